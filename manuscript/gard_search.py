@@ -4,6 +4,7 @@
 from typing import List, Dict, Union, Optional, Set, Tuple
 import requests, string, random
 from nltk import tokenize as nltk_tokenize
+from rdsmproj.mapper.bin.TrieMatcher import TrieMatcher
 class GARD_Search:
     def __init__(self):
         import json, codecs
@@ -73,6 +74,10 @@ class GARD_Search:
         # Returns a dictionary in form of {"GARD_ID":["Longest Disease Name/Synonym","2nd Longest Name/Synonym","Synonym",...]}
         self.id_dict = id_dict
         self.max_length = max_length
+        #Token level automaton of every name and synonym, used by get_diseases. Each name is its own key so the matched name is returned
+        self.matcher = TrieMatcher(lower=False)
+        for name in GARD_dict:
+            self.matcher.add(name, [name])
     
     def __str__(self) -> str:
         return str(
@@ -104,35 +109,13 @@ GARD ID Dictionary: rd_identify.id_dict \n {"GARD_ID":["Longest Disease Name/Syn
 
         #print("processed tokens",tokens)
         
+        #Single pass over the tokens, takes the longest name starting at each position and skips over it, like comparing the
+        #longest sequences first and going down until there is a match
         diseases = []
         ids = []
-        i=0
-        #Iterates through every word, builds string that is max_length or less to compare.
-        while i <len(tokens):
-            #print("i",i)
-            #Find out the length of the comparison string, either max_length or less. This brings algorithm from O(n^2) to O(n) time
-            compare_length = min(len(tokens)-i, self.max_length)
-
-            #print("compare_length",compare_length)
-
-            #Compares longest sequences first and goes down until there is a match
-            while compare_length>0:
-                s = ' '.join(tokens[i:i+compare_length]).lower()
-
-                #print("Comparator:",s)
-
-                if s in self.name_dict.keys():
-                   # print("s in self.GARD_dict.keys()",s in self.GARD_dict.keys())
-
-                    diseases.append(s)
-                    ids.append(self.name_dict[s])
-                    #Need to skip over the next few indexes
-                    i+=compare_length-1
-                    #print('found',self.name_dict[s],"new i is",i)
-                    break
-                else:
-                    compare_length-=1
-            i+=1
+        for name, start, end in self.matcher(tokens):
+            diseases.append(name)
+            ids.append(self.name_dict[name])
         return diseases,ids
     
     #Can search by 7-digit GARD_ID, 12-digit "GARD:{GARD_ID}", matched search term, or arbitrary search term
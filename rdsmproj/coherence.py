@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Topic coherence ('u_mass', 'c_v', 'c_uci', and 'c_npmi') computed with sparse matrices.
+
+Every gensim CoherenceModel scans the tokenized documents again to count how often the topic words
+occur and co-occur, once for each coherence measure, model, and trial, and then scores each word
+pair of each topic in Python. Here the counts are kept per corpus in a CoherenceCache and only
+counted again when topic words appear that were not counted yet. The counts of a word pair only
+depend on the documents and the size of the sliding window, not on which other words are counted,
+so one set of counts serves every coherence measure that uses the same estimator and every model or
+trial on the same documents.
+
+The counts are sparse matrix products restricted to the topic words. For 'u_mass' the boolean
+document x term matrix B gives the co-occurrences as B.T @ B. For the sliding window measures the
+windows of each document are split into segments in which the same topic words are present, and
+the boolean segment x term matrix A with the number of windows in each segment r gives the
+co-occurrences as A.T @ diag(r) @ A. The scores of the topics are then computed together with
+NumPy. The numbers are the same as those of gensim.
+"""
+
+from typing import Optional, Iterable
+import numpy as np
+import scipy.sparse as sps
+import gensim
+from gensim import matutils
+from gensim.corpora.dictionary import Dictionary
+from gensim.models.coherencemodel import CoherenceModel, BOOLEAN_DOCUMENT_BASED, SLIDING_WINDOW_SIZES
+from gensim.topic_coherence.direct_confirmation_measure import EPSILON
+
+
+# Coherence measures supported.
+MEASURES = ('u_mass', 'c_v', 'c_uci', 'c_npmi')
+
+
+class _Counts:
+    """
+    Occurrence and co-occurrence counts of a set of words for one estimator.
+
+    Parameters
+    ----------
+    ids: np.ndarray
+        Sorted word ids of the words counted.
+    co_occurrences: scipy.sparse.spmatrix
+        Number of windows (or documents) in which each pair of words is present, in the order of
+        ids. The diagonal is the number of windows in which each word is present.
+    num_docs: int
+        Number of windows (or documents).
+    """
+    def __init__(self, ids:np.ndarray, co_occurrences:sps.spmatrix, num_docs:int):
+        self.ids = ids
+        co_occurrences = sps.csr_matrix(co_occurrences)
+        co_occurrences.sort_indices()
+        self.occurrences = co_occurrences.diagonal().astype(np.float64)
+        # Pairs as sorted keys of row * number of words + column for vectorized lookups.
+        rows = np.repeat(np.arange(len(ids), dtype=np.int64), np.diff(co_occurrences.indptr))
+        self.keys = rows * len(ids) + co_occurrences.indices
+        self.values = co_occurrences.data.astype(np.float64)
+        self.num_docs = float(num_docs)
+
+    def index(self, word_ids:np.ndarray) -> np.ndarray:
+        """
+        Positions of word ids in ids.
+        """
+        return np.searchsorted(self.ids, word_ids)
+
+    def pairs(self, rows:np.ndarray, cols:np.ndarray) -> np.ndarray:
+        """
+        Co-occurrence counts of the pairs of positions in rows and cols (broadcast together).
+        """
+        keys = rows * len(self.ids) + cols
+        if not len(self.keys):
+            return np.zeros(keys.shape)
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[found] == keys, self.values[found], 0.0)
+
+class TopicCoherence:
+    """
+    Coherence of a set of topics, with the methods of gensim CoherenceModel used by the topic tools.
+    Created by CoherenceCache.coherence_model.
+
+    Parameters
+    ----------
+    cache: CoherenceCache
+        Cache of the documents.
+    topics: list[np.ndarray]
+        Word ids of each topic.
+    coherence: str
+        Coherence measure.
+    window_size: int (Optional, default None)
+        Size of the sliding window. The gensim default of the coherence measure if None.
+    """
+    top_topics_as_word_lists = staticmethod(CoherenceModel.top_topics_as_word_lists)
+
+    def __init__(self,
+                 cache:'CoherenceCache',
+                 topics:list[np.ndarray],
+                 coherence:str,
+                 window_size:Optional[int]=None):
+        self.cache = cache
+        self.topics = topics
+        self.coherence = coherence
+        self.window_size = window_size
+        self._values = None
+
+    def get_coherence_per_topic(self) -> list[float]:
+        """
+        Coherence value of each topic.
+        """
+        if self._values is None:
+            self._values = self.cache.coherence_per_topic(self.topics,
+                                                          self.coherence,
+                                                          self.window_size).tolist()
+        return self._values
+
+    def get_coherence(self) -> float:
+        """
+        Mean coherence value of the topics.
+        """
+        return float(np.mean(self.get_coherence_per_topic()))
+
+class CoherenceCache:
+    """
+    Per corpus store of the word occurrence statistics used by the coherence measures. The counts
+    are kept for each estimator, the boolean document estimator for 'u_mass' and the boolean
+    sliding window estimator with its window size for the others (110 for 'c_v', 10 for 'c_npmi'
+    and 'c_uci'). They are counted for the union of the topic words seen so far and counted again
+    for the larger union when topics have words that were not counted yet.
+
+    Parameters
+    ----------
+    texts: list[list[str]]
+        Tokenized documents.
+    id2word: gensim.corpora.dictionary.Dictionary
+        Mapping of word ids to words.
+    corpus: list[tuple[int, int]] (Optional, default None)
+        Document vectors of texts made up of list of tuples with (word_id, word_frequency). Used by
+        'u_mass'. The words of texts are used if None.
+    """
+    def __init__(self,
+                 texts:list[list[str]],
+                 id2word:Dictionary,
+                 corpus:Optional[list[tuple[int, int]]]=None):
+        self.texts = texts
+        self.id2word = id2word
+        self.corpus = corpus
+        # Counts of each estimator.
+        self.counts = {}
+        self._tokens = None
+        self._documents = None
+
+    def _token_ids(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Word id of every token of texts (-1 if not in id2word) and the length of each document.
+        """
+        if self._tokens is None:
+            token2id = self.id2word.token2id
+            lengths = np.fromiter((len(text) for text in self.texts), dtype=np.int64,
+                                  count=len(self.texts))
+            tokens = np.fromiter((token2id.get(word, -1) for text in self.texts for word in text),
+                                 dtype=np.int64, count=int(lengths.sum()))
+            self._tokens = (tokens, lengths)
+        return self._tokens
+
+    def _document_ids(self) -> tuple[np.ndarray, np.ndarray, int]:
+        """
+        Document number and word id of every word of every document, and the number of documents.
+        """
+        if self._documents is None:
+            if self.corpus is None:
+                word_ids, lengths = self._token_ids()
+            else:
+                lengths = []
+                word_ids = []
+                for document in self.corpus:
+                    lengths.append(len(document))
+                    word_ids.extend(word_id for word_id, _ in document)
+                lengths = np.array(lengths, dtype=np.int64)
+                word_ids = np.array(word_ids, dtype=np.int64)
+            docs = np.repeat(np.arange(len(lengths)), lengths)
+            self._documents = (docs, word_ids, len(lengths))
+        return self._documents
+
+    def _lookup(self, ids:np.ndarray, word_ids:np.ndarray) -> np.ndarray:
+        """
+        Positions of word_ids in ids, -1 for the word ids that are not in ids (and for -1).
+        """
+        size = max(len(self.id2word.token2id), int(word_ids.max(initial=-1)) + 1) + 1
+        lookup = np.full(size, -1, dtype=np.int64)
+        lookup[ids] = np.arange(len(ids))
+        return lookup[word_ids]
+
+    def _document_counts(self, ids:np.ndarray) -> _Counts:
+        """
+        Counts the number of documents in which each pair of words is present.
+        """
+        docs, word_ids, num_docs = self._document_ids()
+        terms = self._lookup(ids, word_ids)
+        present = terms >= 0
+        # Boolean document x term matrix.
+        matrix = sps.csr_matrix((np.ones(present.sum(), dtype=np.int64),
+                                 (docs[present], terms[present])),
+                                shape=(num_docs, len(ids)))
+        matrix.data[:] = 1
+        return _Counts(ids, matrix.T @ matrix, num_docs)
+
+    def _window_counts(self, ids:np.ndarray, window_size:int) -> _Counts:
+        """
+        Counts the number of sliding windows in which each pair of words is present.
+
+        Like gensim, a document shorter than the window is a single window and an empty document
+        counts as a window with no words in it. When the window slides, gensim marks the word
+        leaving it as not present even if another occurrence of it is still in the window, until
+        the next occurrence enters. So a word is present from window max(p - window_size + 1, 0)
+        for each of its positions p, until the window after its first occurrence at or after
+        max(p - window_size + 1, 0) has left.
+        """
+        tokens, lengths = self._token_ids()
+        num_windows = np.maximum(lengths - window_size + 1, 1)
+        starts = np.cumsum(lengths) - lengths
+        docs = np.repeat(np.arange(len(lengths)), lengths)
+
+        terms = self._lookup(ids, tokens)
+        present = terms >= 0
+        docs = docs[present]
+        terms = terms[present]
+        positions = np.flatnonzero(present) - starts[docs]
+
+        # Groups the occurrences by document and term, in order of position.
+        order = np.lexsort((positions, terms, docs))
+        docs, terms, positions = docs[order], terms[order], positions[order]
+        new_group = np.ones(len(docs), dtype=bool)
+        new_group[1:] = (docs[1:] != docs[:-1]) | (terms[1:] != terms[:-1])
+        groups = np.cumsum(new_group) - 1
+
+        # Windows [first, last) in which each occurrence marks its word as present.
+        first = np.maximum(positions - window_size + 1, 0)
+        stride = int(lengths.max(initial=0)) + 1
+        keys = groups * stride + positions
+        leaving = np.searchsorted(keys, groups * stride + first)
+        last = np.minimum(positions[leaving] + 1, num_windows[docs])
+
+        # Merges the overlapping windows of each word in each document. Both first and last only
+        # increase within a group, so a new run starts where first is after the last window so far.
+        new_run = new_group.copy()
+        new_run[1:] |= first[1:] > last[:-1]
+        run_starts = np.flatnonzero(new_run)
+        run_ends = np.append(run_starts[1:], len(new_run)) - 1
+        run_docs = docs[run_starts]
+        run_first = run_docs * (int(num_windows.max(initial=1)) + 1) + first[run_starts]
+        run_last = run_first - first[run_starts] + last[run_ends]
+
+        # Splits the windows of each document into segments in which the same words are present.
+        bounds = np.unique(np.concatenate([run_first, run_last]))
+        segment_start = np.searchsorted(bounds, run_first)
+        segment_count = np.searchsorted(bounds, run_last) - segment_start
+        rows = (np.arange(segment_count.sum())
+                - np.repeat(np.cumsum(segment_count) - segment_count, segment_count)
+                + np.repeat(segment_start, segment_count))
+        cols = np.repeat(terms[run_starts], segment_count)
+        # Number of windows in each segment.
+        weights = np.append(np.diff(bounds), 0)
+
+        shape = (len(bounds), len(ids))
+        matrix = sps.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=shape)
+        weighted = sps.csr_matrix((weights[rows], (rows, cols)), shape=shape)
+        return _Counts(ids, matrix.T @ weighted, int(num_windows.sum()))
+
+    def _get_counts(self, coherence:str, window_size:Optional[int], word_ids:np.ndarray) -> _Counts:
+        """
+        Returns the counts used by a coherence measure, counting them again if word_ids has words
+        that were not counted yet.
+        """
+        if coherence in BOOLEAN_DOCUMENT_BASED:
+            key = ('document',)
+        else:
+            key = ('sliding_window', window_size or SLIDING_WINDOW_SIZES[coherence])
+        counts = self.counts.get(key)
+        if counts is None or not np.isin(word_ids, counts.ids).all():
+            # Counts the words of the earlier topics as well so they stay in the cache.
+            if counts is not None:
+                word_ids = np.concatenate([word_ids, counts.ids])
+            word_ids = np.unique(word_ids)
+            if key[0] == 'document':
+                counts = self._document_counts(word_ids)
+            else:
+                counts = self._window_counts(word_ids, key[1])
+            self.counts[key] = counts
+        return counts
+
+    def topic_ids(self,
+                  model:Optional[gensim.models.basemodel.BaseTopicModel] = None,
+                  topics:Optional[list[list[str]]] = None,
+                  topn:int = 10) -> list[np.ndarray]:
+        """
+        Word ids of the topn words of each topic, the same as those used by gensim CoherenceModel.
+        Words of the topics that are not in id2word are left out.
+
+        Parameters
+        ----------
+        model: gensim.models.basemodel.BaseTopicModel (Optional, default None)
+            Pre-trained topic model provided if topics not provided.
+        topics: list[list[str]] (Optional, default None)
+            List of tokenized topics (or of topics of word ids).
+        topn: int (default 10)
+            Integer corresponding to number of top words to be extracted from each topic.
+
+        Returns
+        -------
+            List of arrays of word ids.
+        """
+        if topics is None:
+            if model is None:
+                raise ValueError('One of model or topics has to be provided.')
+            try:
+                return [matutils.argsort(topic, topn=topn, reverse=True)
+                        for topic in model.get_topics()]
+            except AttributeError as error:
+                raise ValueError('This topic model is not currently supported. Supported topic '
+                                 'models should implement the `get_topics` method.') from error
+
+        topic_ids = []
+        token2id = self.id2word.token2id
+        for topic in topics:
+            ids_from_tokens = [token2id[token] for token in topic if token in token2id]
+            ids_from_ids = [word_id for word_id in topic if word_id in self.id2word]
+            if len(ids_from_tokens) > len(ids_from_ids):
+                topic_ids.append(np.array(ids_from_tokens))
+            elif len(ids_from_ids) > len(ids_from_tokens):
+                topic_ids.append(np.array(ids_from_ids))
+            else:
+                raise ValueError('unable to interpret topic as either a list of tokens or a list '
+                                 'of ids')
+        # Like gensim, the topics are only shortened if the first topic is longer than topn.
+        if len(topic_ids[0]) > topn:
+            topic_ids = [topic[:topn] for topic in topic_ids]
+        return topic_ids
+
+    def coherence_per_topic(self,
+                            topics:list[np.ndarray],
+                            coherence:str = 'c_v',
+                            window_size:Optional[int] = None) -> np.ndarray:
+        """
+        Computes the coherence of every topic at once. Topics of several models can be passed
+        together so the documents are scanned at most once for all of them.
+
+        Parameters
+        ----------
+        topics: list[np.ndarray]
+            Word ids of each topic (e.g. from topic_ids).
+        coherence: str (default 'c_v')
+            Coherence measure, one of 'u_mass', 'c_v', 'c_uci', and 'c_npmi'.
+        window_size: int (Optional, default None)
+            Size of the sliding window. The gensim default of the coherence measure if None.
+
+        Returns
+        -------
+            Array of the coherence value of each topic.
+        """
+        if coherence not in MEASURES:
+            raise ValueError(f'{coherence} coherence is not currently supported.')
+        topics = [np.asarray(topic, dtype=np.int64) for topic in topics]
+        word_ids = np.concatenate(topics) if topics else np.zeros(0, dtype=np.int64)
+        counts = self._get_counts(coherence, window_size, word_ids)
+
+        values = np.full(len(topics), np.nan)
+        lengths = np.array([len(topic) for topic in topics])
+        # Topics with the same number of words are scored together.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for length in np.unique(lengths[lengths > 0]):
+                members = np.flatnonzero(lengths == length)
+                positions = counts.index(np.stack([topics[i] for i in members]))
+                values[members] = _score(counts, positions, coherence)
+        return values
+
+    def coherence_per_model(self,
+                            topic_sets:Iterable[list[np.ndarray]],
+                            coherence:str = 'c_v',
+                            window_size:Optional[int] = None) -> list[list[float]]:
+        """
+        Computes the coherence of the topics of several models in one batch.
+
+        Parameters
+        ----------
+        topic_sets: Iterable[list[np.ndarray]]
+            Word ids of each topic of each model (e.g. from topic_ids).
+        coherence: str (default 'c_v')
+            Coherence measure, one of 'u_mass', 'c_v', 'c_uci', and 'c_npmi'.
+        window_size: int (Optional, default None)
+            Size of the sliding window. The gensim default of the coherence measure if None.
+
+        Returns
+        -------
+            List of the coherence values of each topic of each model.
+        """
+        topic_sets = [list(topics) for topics in topic_sets]
+        values = self.coherence_per_topic([topic for topics in topic_sets for topic in topics],
+                                          coherence, window_size).tolist()
+        results = []
+        for topics in topic_sets:
+            results.append(values[:len(topics)])
+            values = values[len(topics):]
+        return results
+
+    def coherence_model(self,
+                        model:Optional[gensim.models.basemodel.BaseTopicModel] = None,
+                        topics:Optional[list[list[str]]] = None,
+                        coherence:str = 'c_v',
+                        topn:int = 10,
+                        window_size:Optional[int] = None) -> TopicCoherence:
+        """
+        Creates a TopicCoherence of the topics of a model or of a list of tokenized topics on the
+        documents of the cache. Used in place of gensim.models.coherencemodel.CoherenceModel.
+
+        Parameters
+        ----------
+        model: gensim.models.basemodel.BaseTopicModel (Optional, default None)
+            Pre-trained topic model provided if topics not provided.
+        topics: list[list[str]] (Optional, default None)
+            List of tokenized topics.
+        coherence: str (default 'c_v')
+            Coherence measure, one of 'u_mass', 'c_v', 'c_uci', and 'c_npmi'.
+        topn: int (default 10)
+            Integer corresponding to number of top words to be extracted from each topic.
+        window_size: int (Optional, default None)
+            Size of the sliding window. The gensim default of the coherence measure if None.
+
+        Returns
+        -------
+            TopicCoherence with get_coherence and get_coherence_per_topic methods.
+        """
+        if coherence not in MEASURES:
+            raise ValueError(f'{coherence} coherence is not currently supported.')
+        return TopicCoherence(self, self.topic_ids(model, topics, topn), coherence, window_size)
+
+def _score(counts:_Counts, positions:np.ndarray, coherence:str) -> np.ndarray:
+    """
+    Coherence of topics with the same number of words, computed the same way as gensim.
+
+    Parameters
+    ----------
+    counts: _Counts
+        Counts of the estimator of the coherence measure.
+    positions: np.ndarray
+        Positions of the topic words in counts, with shape (topics, words).
+    coherence: str
+        Coherence measure.
+
+    Returns
+    -------
+        Array of the coherence value of each topic.
+    """
+    num_words = positions.shape[1]
+    occurrences = counts.occurrences[positions] / counts.num_docs
+    # Probability of each pair of topic words, with shape (topics, w', w*).
+    co_occurrences = counts.pairs(positions[:, :, None], positions[:, None, :]) / counts.num_docs
+
+    if coherence == 'u_mass':
+        # Log conditional probability of each word given each word before it in the topic, 0 if
+        # the word before it is never present.
+        scores = np.log((co_occurrences + EPSILON) / occurrences[:, None, :])
+        scores = np.where(occurrences[:, None, :] == 0, 0.0, scores)
+        return scores[:, np.tril(np.ones((num_words, num_words), dtype=bool), -1)].mean(axis=1)
+
+    # Pointwise mutual information of each pair of topic words, normalized for 'c_npmi' and 'c_v'.
+    scores = np.log((co_occurrences + EPSILON) / (occurrences[:, :, None] * occurrences[:, None, :]))
+    if coherence != 'c_uci':
+        scores = scores / -np.log(co_occurrences + EPSILON)
+    if coherence != 'c_v':
+        return scores[:, ~np.eye(num_words, dtype=bool)].mean(axis=1)
+
+    # Cosine similarity of the context vector of each topic word with that of all of the topic
+    # words. Context vectors are indexed by distinct word, so the scores of repeated words add up.
+    first = (positions[:, :, None] == positions[:, None, :]).argmax(axis=2)
+    distinct = (first[:, :, None] == np.arange(num_words)).astype(np.float64)
+    vectors = scores @ distinct
+    topic_vectors = vectors.sum(axis=1)
+    similarities = (np.einsum('tiu,tu->ti', vectors, topic_vectors)
+                    / (np.sqrt((vectors ** 2).sum(axis=2))
+                       * np.sqrt((topic_vectors ** 2).sum(axis=1))[:, None]))
+    return similarities.mean(axis=1)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Order preserving deduplication of text documents. Exact duplicates are found with a digest of each
+document. Near duplicates (e.g. reposts and crossposts with small edits) can optionally be found
+with MinHash signatures and locality sensitive hashing (LSH).
+"""
+
+import hashlib
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+import numpy as np
+
+
+# Mersenne prime used for the MinHash permutations.
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+# Largest 32 bit hash value.
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _digest(text:str, digest_size:int=16) -> bytes:
+    """
+    Returns the blake2b digest of a string.
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=digest_size).digest()
+
+def _digest_bytes(data:bytes) -> bytes:
+    """
+    Returns the blake2b digest of bytes used as an LSH bucket key.
+    """
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+def get_shingles(text:str, shingle_size:int=3) -> set[str]:
+    """
+    Creates the set of word shingles (n-grams of consecutive lowercase words) of a document.
+    Documents with fewer words than shingle_size are a single shingle.
+
+    Parameters
+    ----------
+    text: str
+        Document to be shingled.
+
+    shingle_size: int (Optional, default 3)
+        Number of words in each shingle.
+
+    Returns
+    -------
+        Set of shingles.
+    """
+    words = text.lower().split()
+    if len(words) <= shingle_size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+
+def get_lsh_bands(threshold:float, num_perm:int) -> tuple[int, int]:
+    """
+    Finds the number of bands and rows per band for LSH that minimizes the weighted probability
+    of candidate pairs below the threshold (false positives) and of missed pairs above the
+    threshold (false negatives). Candidates are checked against the threshold with their full
+    signatures, so false positives only cost time and false negatives are weighted more heavily.
+
+    Parameters
+    ----------
+    threshold: float
+        Jaccard similarity threshold between 0 and 1.
+
+    num_perm: int
+        Number of permutations in each MinHash signature.
+
+    Returns
+    -------
+        Number of bands and number of rows per band.
+    """
+    below = np.linspace(0, threshold, 200)
+    above = np.linspace(threshold, 1, 200)
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        # Probability that a pair with a given similarity shares at least one band.
+        false_positive = np.mean(1 - (1 - below**rows)**bands) * threshold
+        false_negative = np.mean((1 - above**rows)**bands) * (1 - threshold)
+        error = 0.1 * false_positive + 0.9 * false_negative
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+class Deduplicator:
+    """
+    Removes duplicate documents from a stream in a single pass, keeping the first occurrence of
+    each document and the original order. Only digests (and MinHash signatures in near duplicate
+    mode) are kept in memory, never the documents themselves.
+
+    Parameters
+    ----------
+    near_duplicates: bool (Optional, default False)
+        If True, documents that are near duplicates of an earlier document are also removed.
+
+    threshold: float (Optional, default 0.9)
+        Estimated Jaccard similarity of the word shingles at or above which a document is a near
+        duplicate.
+
+    num_perm: int (Optional, default 128)
+        Number of permutations in each MinHash signature. More permutations give a more accurate
+        similarity estimate at the cost of speed and memory.
+
+    shingle_size: int (Optional, default 3)
+        Number of words in each shingle.
+
+    seed: int (Optional, default 1)
+        Seed for the MinHash permutations.
+    """
+    def __init__(self,
+                 near_duplicates:Optional[bool]=False,
+                 threshold:Optional[float]=0.9,
+                 num_perm:Optional[int]=128,
+                 shingle_size:Optional[int]=3,
+                 seed:Optional[int]=1):
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.stats = Counter()
+        self.seen = set()
+
+        if near_duplicates:
+            generator = np.random.RandomState(seed)
+            self.perm_a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+            self.perm_b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+            self.bands, self.rows = get_lsh_bands(threshold, num_perm)
+            # One bucket table per band mapping the band digest to the indexes of the signatures.
+            self.buckets = [{} for _ in range(self.bands)]
+            self.signatures = []
+
+    def minhash(self, text:str) -> np.ndarray:
+        """
+        Creates the MinHash signature of a document.
+
+        Parameters
+        ----------
+        text: str
+            Document to be hashed.
+
+        Returns
+        -------
+            Array of num_perm 32 bit hash values.
+        """
+        shingles = get_shingles(text, self.shingle_size)
+        hashes = np.fromiter((int.from_bytes(_digest(shingle, 4), 'little')
+                              for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(hashes, self.perm_a) + self.perm_b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _is_near_duplicate(self, text:str) -> bool:
+        """
+        Checks if a document is a near duplicate of an earlier kept document. If it is not, its
+        signature is added to the LSH index.
+        """
+        signature = self.minhash(text)
+        band_keys = [_digest_bytes(signature[i * self.rows:(i + 1) * self.rows].tobytes())
+                     for i in range(self.bands)]
+        # Checks the candidates sharing a band against the similarity threshold.
+        checked = set()
+        for band, key in enumerate(band_keys):
+            for index in self.buckets[band].get(key, ()):
+                if index in checked:
+                    continue
+                checked.add(index)
+                if np.mean(self.signatures[index] == signature) >= self.threshold:
+                    return True
+
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        for band, key in enumerate(band_keys):
+            self.buckets[band].setdefault(key, []).append(index)
+        return False
+
+    def is_duplicate(self, text:str) -> bool:
+        """
+        Checks if a document is a duplicate of an earlier document and records the reason in
+        stats. Documents that are not duplicates are remembered.
+
+        Parameters
+        ----------
+        text: str
+            Document to be checked.
+
+        Returns
+        -------
+            True if the document is a duplicate and should be removed.
+        """
+        self.stats['total'] += 1
+        digest = _digest(text)
+        if digest in self.seen:
+            self.stats['exact_duplicate'] += 1
+            return True
+        if self.near_duplicates and self._is_near_duplicate(text):
+            self.stats['near_duplicate'] += 1
+            return True
+        self.seen.add(digest)
+        self.stats['kept'] += 1
+        return False
+
+    def __call__(self, documents:Iterable[str]) -> Iterator[str]:
+        """
+        Filters a stream of documents.
+
+        Parameters
+        ----------
+        documents: Iterable[str]
+            Documents to be deduplicated.
+
+        Returns
+        -------
+            Generator of the documents that are not duplicates, in their original order.
+        """
+        for doc in documents:
+            if not self.is_duplicate(doc):
+                yield doc
+
+    def report(self) -> str:
+        """
+        Returns a summary of the number of documents removed and why.
+        """
+        removed = self.stats['exact_duplicate'] + self.stats['near_duplicate']
+        return (f"Total number of documents: {self.stats['total']}. "
+                f"Removed {removed} ({self.stats['exact_duplicate']} exact duplicates, "
+                f"{self.stats['near_duplicate']} near duplicates). "
+                f"Final unique number of documents: {self.stats['kept']}.")
@@ -2,7 +2,6 @@ from rdsmproj.mapper.bin import Map
 import pandas as pd
 import json
 import csv
-from spacy.tokens import Doc
 
 class AbstractMap(Map.Map):
     # Normalizes Abstract strings and stores dataframe as a list of tuples
@@ -23,9 +22,7 @@ class AbstractMap(Map.Map):
             temp_xlsx.to_csv(file_name.join('.csv'), encoding='latin-1', index=False) #does not work in utf-8 encoding
             self.data = file_name.join('.csv')
         try:
-            with open(self.gard,'r',encoding='utf-8') as f:
-                g = json.load(f)
-            self._clean_gard(g)
+            self.load_gard()
 
             if file_type == 'txt':
                 df = pd.read_csv(self.data, sep='\t', encoding = 'latin-1')
@@ -69,40 +66,44 @@ class AbstractMap(Map.Map):
             print(row[0])
             print(e)
 
-    # Gathers information on each match during phrase matching
-    def append_match_dict(self,doc):
-        for match_id, start, end in self.matcher(doc):
-            pattern_type = self.nlp.vocab.strings[match_id]
-            matched_word = list(set(self.matches.get(doc._.id, []) + [(pattern_type, str(doc[start:end]))]))
-            
-            if matched_word in self.blacklist._getall() or matched_word in self.blacklist._getall(acronyms=True):
-                continue
-
-            self.matches[doc._.id] = matched_word
-            self.id_list.append(str(doc._.id))
-            self.col_match_list.append(str(doc._.col))
-            self.name_list.append(str(doc[start:end]))
-
+    # Gathers information on each match during phrase matching, returns the pattern type, matched text and context of each match
+    def _doc_matches(self,doc):
+        hits = list()
+        for pattern_type, start, end in self.find_matches(doc):
             if end + 10 > len(doc):
-                self.context_list.append(str(doc[len(doc)-10:len(doc)]))
+                context = str(doc[len(doc)-10:len(doc)])
             elif start - 10 < 0:
-                self.context_list.append(str(doc[0:start+10]))
+                context = str(doc[0:start+10])
             else:
-                self.context_list.append(str(doc[start-10:end+10]))
+                context = str(doc[start-10:end+10])
 
-            
-    # gets metadata of the subreddit document
+            hits.append((pattern_type, str(doc[start:end]), context))
+        return hits
+
+    # Matches a batch of abstracts, returns the ID, column and matches for each document
     def _process_doc(self,batch):
-        for TEXT, DATA in self.nlp.pipe(batch, as_tuples=True):
+        return [(DATA[1], DATA[0], self._doc_matches(TEXT)) for TEXT, DATA in self.make_docs(batch)]
+
+    # Adds the matches of each document returned by the workers to the match lists
+    def append_match_dict(self,results):
+        for doc_id, col, hits in results:
             self.counter += 1
-            TEXT._.id = DATA[1]
-            TEXT._.col = DATA[0]
 
             if self.counter % 1000 == 0:
                 percentage = round((self.counter/len(self.dataObj))*100)
                 print(f'{percentage}%')
 
-            self.append_match_dict(TEXT)
+            for pattern_type, name, context in hits:
+                matched_word = list(set(self.matches.get(doc_id, []) + [(pattern_type, name)]))
+
+                if matched_word in self.blacklist._getall() or matched_word in self.blacklist._getall(acronyms=True):
+                    continue
+
+                self.matches[doc_id] = matched_word
+                self.id_list.append(str(doc_id))
+                self.col_match_list.append(str(col))
+                self.name_list.append(name)
+                self.context_list.append(context)
 
     def _clean_csv(self, df):
         # Creates new columns #DISEASE and #OCCUR
@@ -190,27 +191,23 @@ class AbstractMap(Map.Map):
 
         self._loadGard(gardFile)
         self._loadData(inputFile)
+
+        # Loads SpaCy package with the custom tokenizer
+        self.setup_nlp()
         self._clean()
 
         try:
             if self.gardObj == None or self.dataObj == None:
                 raise Exception
 
-            # Loads SpaCy package with the custom tokenizer
-            self.setup_nlp()
-            Doc.set_extension('id', default = None)
-            Doc.set_extension('col', default = None)
-
-            print('Making Doc Objects...')
-
-            name_patterns,syn_patterns = self.make_patterns()
+            name_patterns,syn_patterns = self.patterns
             
             # Adds normalized GARD data to PhraseMatcher object
-            self.matcher.add('name', name_patterns)
-            self.matcher.add('synonyms', syn_patterns)
+            self.add_patterns('name', name_patterns)
+            self.add_patterns('synonyms', syn_patterns)
 
             print('Matching Doc Objects')
-            self.batch_thread(self.dataObj, self._process_doc, self.batchsize)
+            self.append_match_dict(self.batch_process(self.dataObj, self._process_doc, self.batchsize))
             
             with open(self.outfile + '/new_normalized_abstract_matches.json', mode= 'w+', encoding='utf-8') as file:
                 print(len(self.matches))
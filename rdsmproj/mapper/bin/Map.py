@@ -7,19 +7,47 @@ import os
 from datetime import datetime
 from abc import ABC
 import spacy
+import srsly
 from spacy.matcher import PhraseMatcher
 #from spacy.tokens import Doc
+from spacy.tokens import DocBin
 from spacy.tokenizer import Tokenizer
 from spacy.lang.char_classes import ALPHA, ALPHA_LOWER, ALPHA_UPPER, CONCAT_QUOTES, LIST_ELLIPSES, LIST_ICONS
 from spacy.util import compile_infix_regex
 #from collections import OrderedDict
-import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import hashlib
+import json
+import math
+import time
 import re
 from rdsmproj.mapper.bin.Blacklist import Blacklist
+from rdsmproj.mapper.bin.TrieMatcher import TrieMatcher
+from rdsmproj import text_cleaner
+
+# Version of the saved GARD pattern artifact, changing it causes every saved artifact to be rebuilt
+GARD_ARTIFACT_VERSION = 1
+
+# Map object used by the worker processes of Map.batch_process, set once per worker
+_worker_map = None
+
+# Stores a copy of the Map object in a worker process
+def _init_worker(map_obj):
+    global _worker_map
+    _worker_map = map_obj
+
+# Runs a batch function of the worker's Map object by name and returns its results
+def _run_batch(funct_name, batch):
+    return getattr(_worker_map, funct_name)(batch)
 
 # Base mapper class, common properties in all child classes will be inherited
 class Map(ABC):
-    def __init__(self, bl=None):
+    # workers is the number of worker processes used for normalizing and matching (1 runs in the current process)
+    # model is the name of a SpaCy language model to load, if None a blank English pipeline with only the tokenizer is used
+    # engine is the matcher used, 'spacy' for the SpaCy PhraseMatcher (every match, including overlapping ones) or 'trie'
+    # for the TrieMatcher (longest non-overlapping matches in a single pass over each document)
+    def __init__(self, bl=None, workers=1, model=None, engine='spacy'):
         self.counter = 0
         self.id_list = list()
         self.col_match_list = list()
@@ -65,6 +93,11 @@ class Map(ABC):
         self.gardObj = None
         self.dataObj = list()
         self.batchsize = self.calc_batch()
+        self.workers = max(int(workers or (os.cpu_count() or 2) - 1), 1)
+        self.model = model
+        if engine not in ('spacy', 'trie'):
+            raise ValueError("engine must be 'spacy' or 'trie'")
+        self.engine = engine
 
         if self.system == 'Windows':
             self.path_char = '\\'
@@ -78,6 +111,9 @@ class Map(ABC):
 
         # Default input file paths
         self.gard = self._create_path('neo4j_rare_disease_list.json', input_file=True)
+        # Path of the saved GARD pattern artifact, if None it is saved next to the GARD file
+        self.gard_artifact = None
+        self.patterns = None
         self.data = self._create_path('preprocessed_subreddit_list.json', input_file=True)
 
         print('Default GARD Data file path set to {}'.format(self.gard))
@@ -104,22 +140,36 @@ class Map(ABC):
     def _get_output_path (self):
         return self.outpath
     
-    # batches data and multi-threads a function, for parallel processing
-    def batch_thread(self, obj, funct, size):
-        threads = list()
-        for i in range(0,len(obj),size):
-                batch_json = obj[i:i + size]
-                #print(batch_json)
-                thread = threading.Thread(target=funct, args=(batch_json,))
-
-                thread.daemon = True
-                threads.append(thread)
-
-        for i in range(len(threads)):
-            threads[i].start()
+    # Data the worker processes do not need is left out when the Map object is sent to them
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['dataObj'] = list()
+        state['matches'] = dict()
+        return state
+
+    # batches data and runs a function over each batch, in a pool of worker processes if more than one worker is set
+    # funct must be a method of the Map object that returns a list of results for its batch. The results are
+    # returned in the same order as obj instead of being added to shared lists by the workers
+    def batch_process(self, obj, funct, size):
+        t0 = time.perf_counter()
+
+        if self.workers > 1:
+            # Keeps the batches small enough that every worker gets several of them
+            size = max(min(size, math.ceil(len(obj) / (self.workers * 4))), 1)
+        batches = [obj[i:i + size] for i in range(0, len(obj), size)]
+        results = list()
+
+        if self.workers == 1 or len(batches) <= 1:
+            for batch in batches:
+                results.extend(funct(batch))
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self,)) as executor:
+                for batch_results in executor.map(_run_batch, repeat(funct.__name__), batches):
+                    results.extend(batch_results)
 
-        for i in range(len(threads)):
-            threads[i].join()
+        elapsed = time.perf_counter() - t0
+        print('Processed {} documents in {:.1f}s ({:.0f} docs/sec)'.format(len(obj), elapsed, len(obj) / max(elapsed, 1e-9)))
+        return results
 
     # Converts GARD JSON object to a python dictionary
     def _clean_gard(self,data):
@@ -155,12 +205,95 @@ class Map(ABC):
         except FileNotFoundError as e:
             print(e)
     
+    # Returns the path of the saved GARD pattern artifact
+    def _gard_artifact_path(self):
+        if self.gard_artifact:
+            return self.gard_artifact
+        return os.path.splitext(self.gard)[0] + '_patterns.msgpack'
+
+    # Hash of everything the GARD patterns are built from: the GARD file, the blacklists, the language model and the SpaCy version
+    def _gard_key(self):
+        sha = hashlib.sha256()
+        with open(self.gard,'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                sha.update(block)
+        settings = [GARD_ARTIFACT_VERSION, spacy.__version__, self.model,
+                    self.blacklist._getall(), self.blacklist._getall(acronyms=True)]
+        sha.update(json.dumps(settings).encode('utf-8'))
+        return sha.hexdigest()
+
+    # Loads the normalized GARD data, word_to_gard and the name and synonym patterns from the saved artifact
+    # The artifact is built (cleaning, normalizing and tokenizing all of the GARD names and synonyms) and saved
+    # if it is missing, if rebuild is True, or if the GARD file or blacklist changed since it was saved
+    def load_gard(self, rebuild=False):
+        if self.nlp is None:
+            self.setup_nlp()
+
+        key = self._gard_key()
+        artifact = self._gard_artifact_path()
+
+        if not rebuild and os.path.isfile(artifact):
+            data = srsly.read_msgpack(artifact)
+            if data.get('version') == GARD_ARTIFACT_VERSION and data.get('key') == key:
+                self.gardObj = data['gard']
+                self.word_to_gard = data['word_to_gard']
+                self.patterns = [list(DocBin().from_bytes(data[group]).get_docs(self.nlp.vocab))
+                                 for group in ('names', 'synonyms')]
+                print('GARD patterns loaded from {}'.format(artifact))
+                return self.patterns
+
+        with open(self.gard,'r',encoding='utf-8') as f:
+            g = json.load(f)
+        self._clean_gard(g)
+        self.patterns = self.make_patterns()
+
+        data = {'version': GARD_ARTIFACT_VERSION,
+                'key': key,
+                'gard': self.gardObj,
+                'word_to_gard': self.word_to_gard,
+                'names': DocBin(docs=self.patterns[0]).to_bytes(),
+                'synonyms': DocBin(docs=self.patterns[1]).to_bytes()}
+
+        # Written to a temporary file and renamed so an interrupted build never leaves a partial artifact
+        temp = artifact + '.temp'
+        srsly.write_msgpack(temp, data)
+        os.replace(temp, artifact)
+        print('GARD patterns saved to {}'.format(artifact))
+        return self.patterns
+
     # initializes SpaCy NLP package with custom tokenizer and language model
+    # The PhraseMatcher only matches on the LOWER attribute, so by default a blank English pipeline is used, which has the
+    # same tokenizer rules as the full language models without loading the tagger, parser, NER or word vectors
     def setup_nlp(self):
-        self.nlp = spacy.load('en_core_web_lg')
+        if self.model:
+            self.nlp = spacy.load(self.model)
+        else:
+            self.nlp = spacy.blank('en')
         self.nlp.tokenizer = self._custom_tokenizer(self.nlp)
         self.attr = 'LOWER'
-        self.matcher = PhraseMatcher(self.nlp.vocab, attr=self.attr)
+        if self.engine == 'trie':
+            self.matcher = TrieMatcher(lower=True)
+        else:
+            self.matcher = PhraseMatcher(self.nlp.vocab, attr=self.attr)
+
+    # Adds a list of pattern Doc objects to the matcher under a pattern type
+    def add_patterns(self, pattern_type, patterns):
+        if self.engine == 'trie':
+            self.matcher.add(pattern_type, [[token.text for token in doc] for doc in patterns])
+        else:
+            self.matcher.add(pattern_type, patterns)
+
+    # Returns the pattern type, start and end of each match in a Doc object
+    def find_matches(self, doc):
+        if self.engine == 'trie':
+            return self.matcher([token.text for token in doc])
+        return [(self.nlp.vocab.strings[match_id], start, end) for match_id, start, end in self.matcher(doc)]
+
+    # returns (Doc, context) tuples for a batch of (text, context) tuples, only tokenizes the text if no pipeline components are loaded
+    def make_docs(self, batch):
+        if self.nlp.pipe_names:
+            return self.nlp.pipe(batch, as_tuples=True)
+        return ((self.nlp.make_doc(text), context) for text, context in batch)
 
     # returns a list of rare disease names and synonyms SpaCy Doc objects for use in matching
     def make_patterns(self):
@@ -237,7 +370,7 @@ class Map(ABC):
 
     # Removes leftover HTML tags from text "ex. <h1>"
     def remove_tags(self, text):
-        text = re.sub(r"(\<(.*?)\>)", " ", text)
+        text = text_cleaner.remove_tags(text)
         return text
 
     # Simplifies words in text to its singular form from plural
@@ -263,20 +396,15 @@ class Map(ABC):
         return ' '.join(lemma_tokens)
 
     # Combines all the normalization functions into one function
+    # Uses the precompiled patterns of text_cleaner, which give the same output as the separate
+    # re.sub passes.
     def _normalize(self,text):
-        text = re.sub(r'^\s+|\s+$', '', text)
-        text = re.sub(r'[\s\t]+', ' ', text)
+        text = text_cleaner.collapse_whitespace(text)
         text = self.remove_tags(text)
-        text = re.sub(r'–', '\-', text)
-        text = re.sub(r"’", '\'', text)
-        text = re.sub(r"(?i)(and/or)", "and", text)
-        text = re.sub(r"[^-\w./'\(\) ]", "", text)
-        text = re.sub(r"(?i)(non )|(non- )", "non", text)
-        text = re.sub(r"(?i)'s", "", text)
+        text = text_cleaner.normalize_symbols(text)
         text = self.lemmatization(text)
         text = self.remove_parenthesis(text)
-        text = re.sub(r'[\s\t]+', ' ', text)
-        text = re.sub(r'^\s+|\s+$', '', text)
+        text = text_cleaner.collapse_whitespace(text)
         return text
 
     # Original SpaCy tokenizer but with one small edit to leave hyphenated words combined
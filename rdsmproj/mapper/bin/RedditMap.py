@@ -1,9 +1,5 @@
 from rdsmproj.mapper.bin import Map
 import json
-import threading
-import spacy
-from spacy.matcher import PhraseMatcher
-from spacy.tokens import Doc
 
 class RedditMap(Map.Map):
 # Start of result displaying methods
@@ -13,7 +9,7 @@ class RedditMap(Map.Map):
         self.true_positives = self._get_true_positives()
         self.rare_disease_dict = dict()
 
-        if self.gardObj == None or len(self.dataObj) == 0:
+        if self.gardObj == None or not self.dataObj:
             self._clean()
 
         self._find_matches()
@@ -31,30 +27,43 @@ class RedditMap(Map.Map):
 
     # Returns only matches that are NOT false positives
     def _get_true_positives(self):
+        false_positives = set(self.blacklist._getall())
         return {key:value for key, value in self.matches.items()
-                if key not in self.false_positives._getall()}
-
-    # Matches the results to their respective GARD rare disease
+                if key not in false_positives}
+
+    # Builds the lookup indexes used when assembling the results: GARD ids by lowercased name and by lowercased
+    # synonym, and the first (text, context) tuple of each subreddit by name
+    def _build_indexes(self):
+        self.name_index = dict()
+        self.synonym_index = dict()
+        for gard_id, entry in self.gardObj.items():
+            self.name_index.setdefault(entry['name'].lower(), []).append(gard_id)
+            for synonym in entry['synonyms'] or []:
+                self.synonym_index.setdefault(synonym.lower(), []).append(gard_id)
+
+        self.subreddit_index = dict()
+        for text, context in self.dataObj:
+            self.subreddit_index.setdefault(context['name'], (text, context))
+
+    # Matches the results to their respective GARD rare disease, returns a dictionary of GARD id to GARD name
+    # Hits are exact (lowercased) matches of a name or synonym pattern, so they are looked up in the indexes
     def _find_match(self,hit_list):
         hit_type = hit_list[0]
         hit_text = hit_list[1].lower()
-        match_dict = dict()
 
         if hit_type == 'Names':
-            for index in self.gardObj.keys():
-                if hit_text == index.lower():
-                    match_dict[self.gardObj[index][0]] = index
-
-        if hit_type == 'Synonyms':
-            for index in self.gardObj:
-                for synonym in self.gardObj[index][1]:
-                    if hit_text in synonym.lower():
-                        match_dict[self.gardObj[index][0]] = index
-                    
-        return match_dict
+            gard_ids = self.name_index.get(hit_text, [])
+        elif hit_type == 'Synonyms':
+            gard_ids = self.synonym_index.get(hit_text, [])
+        else:
+            gard_ids = []
+
+        return {gard_id: self.gardObj[gard_id]['name'] for gard_id in gard_ids}
 
     # Converts match results to a dictionary
     def _find_matches(self):
+        self._build_indexes()
+
         for subreddit, hits in self.true_positives.items():
             search_term_list = [(hit[0], hit[1]) for hit in hits]
             search_term_list = list(set(search_term_list))
@@ -77,22 +86,17 @@ class RedditMap(Map.Map):
 
     # Gets subreddit metadata
     def _get_subreddit_data(self,subreddit):
-        data = [(text, context) for text, context in self.dataObj
-                if context['name'] == subreddit]
-        data = data[0]
-        text = data[0]
-        title = data[1]['title']
-        subscribers = data[1]['subscribers']
-        created_utc = data[1]['created_utc']
+        text, context = self.subreddit_index[subreddit]
+        title = context['title']
+        subscribers = context['subscribers']
+        created_utc = context['created_utc']
         return text, title, subscribers, created_utc
 
 # Start of mapping methods
     # Cleans up both GARD and Input data for processing
     def _clean(self):
         try:
-            with open(self.gard,'r',encoding='utf-8') as f:
-                g = json.load(f)
-            self._clean_gard(g)
+            self.load_gard()
 
             with open(self.data,'r',encoding='utf-8') as f:
                 d = json.load(f)
@@ -101,67 +105,53 @@ class RedditMap(Map.Map):
         except FileNotFoundError:
             print('[ERROR] No data and/or input file found in \'mapper/data/\' folder\n[TIP] Use Map objects \'_loadGard()\' or \'_loadData()\' method')
     
-    # Converts data to a tuple then appends to a list
+    # Converts a batch of data to a list of tuples
     def _convert_data(self,chunk):
-        for text, context in chunk:
-            chunk_tuple = (self._normalize(text),context)
-            self.dataObj.append(chunk_tuple)
+        return [(self._normalize(text),context) for text, context in chunk]
     
-    # Converts data to a list of tuples, uses batching and threading to speed up the process
+    # Converts data to a list of tuples, uses batching and worker processes to speed up the process
     def _clean_input(self,data):
         print('Cleaning Input Data, Please wait...')
-        self.batch_thread(data, self._convert_data, 100)
+        self.dataObj = self.batch_process(data, self._convert_data, 100)
         print('Input Data Cleaned and Stored in Map Object')
 
    
     # Gathers information on each match during phrase matching
-    def append_match_dict(self,doc):
-        for match_id, start, end in self.matcher(doc):
-            self.counter += 1
-            pattern_type = self.nlp.vocab.strings[match_id]
-            self.matches[doc._.name] = self.matches.get(doc._.name, []) + [(pattern_type, str(doc[start:end]))]
+    def _doc_matches(self,doc):
+        return [(pattern_type, str(doc[start:end])) for pattern_type, start, end in self.find_matches(doc)]
             
-            print(f'Subreddit: {doc._.name} Match: {pattern_type, doc[start:end]}')
-            
-    # gets metadata of the subreddit document
+    # Matches a batch of subreddit documents, returns the subreddit name and its matches for each document
     def _process_doc(self,batch):
-        for doc, context in self.nlp.pipe(batch, as_tuples=True):
-            doc._.name = context['name']
-            doc._.title = context['title']
-            doc._.subscribers = context['subscribers']
-            doc._.created_utc = context['created_utc']
+        return [(context['name'], self._doc_matches(doc)) for doc, context in self.make_docs(batch)]
+
+    # Adds the matches of each subreddit returned by the workers to the match dictionary
+    def append_match_dict(self,results):
+        for name, hits in results:
+            for pattern_type, text in hits:
+                self.counter += 1
+                self.matches[name] = self.matches.get(name, []) + [(pattern_type, text)]
             
-            self.append_match_dict(doc)
+                print(f'Subreddit: {name} Match: {pattern_type, text}')
 
     # Starts phrase matching between the input and gard file, uses batching and threading to speed up the process
     def _match(self, inputFile, gardFile):
         self._loadGard(gardFile)
         self._loadData(inputFile)
+        self.setup_nlp()
         self._clean()
 
         try:
             if self.gardObj == None or self.dataObj == None:
                 raise Exception
 
-            self.nlp = spacy.load('en_core_web_lg')
-            self.nlp.tokenizer = self._custom_tokenizer(self.nlp)
-            self.attr = 'LOWER'
-            self.matcher = PhraseMatcher(self.nlp.vocab, attr=self.attr)
-
-            print('Making Doc Objects...')
-            name_patterns,syn_patterns = self.make_patterns()
-
-            self.matcher.add('Names', name_patterns)
-            self.matcher.add('Synonyms', syn_patterns)
+            name_patterns,syn_patterns = self.patterns
 
-            Doc.set_extension('name', default = None)
-            Doc.set_extension('title', default = None)
-            Doc.set_extension('subscribers', default = None)
-            Doc.set_extension('created_utc', default = None)
+            self.add_patterns('Names', name_patterns)
+            self.add_patterns('Synonyms', syn_patterns)
 
             print('Matching Doc Objects...')
 
-            self.batch_thread(self.dataObj, self._process_doc, 10000)
+            self.append_match_dict(self.batch_process(self.dataObj, self._process_doc, 10000))
             
             with open(self._create_path('new_normalized_subreddit_matches.json', input_file=False), mode= 'w+', encoding='utf-8') as file:
                 json.dump(self.matches, file)
@@ -0,0 +1,110 @@
+from collections import deque
+
+# Token level Aho-Corasick automaton for matching many multi-word patterns (e.g. GARD names and synonyms) at once
+# Each document is read once, token by token, no matter how many patterns there are, and the matches are returned
+# with longest-match semantics: starting from the left, the longest pattern starting at each position is taken and
+# matching continues after it, so matches never overlap. Only uses the standard library, so it can be used in place
+# of the SpaCy PhraseMatcher or the window search of GARD_Search
+class TrieMatcher():
+    def __init__(self, lower=True):
+        # Lowercases the pattern and document tokens before matching, like the PhraseMatcher LOWER attribute
+        self.lower = lower
+        # Each node is a dictionary of token -> child node index, node 0 is the root
+        self.children = [dict()]
+        # Key and length (in tokens) of the pattern ending at each node, None if no pattern ends there
+        self.output = [None]
+        # Failure link and dictionary link of each node, built by _build
+        self.fail = [0]
+        self.dict_link = [0]
+        self.built = True
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    # Converts a pattern to a list of tokens, strings are split on whitespace
+    def _tokens(self, pattern):
+        if isinstance(pattern, str):
+            pattern = pattern.split()
+        if self.lower:
+            return [token.lower() for token in pattern]
+        return list(pattern)
+
+    # Adds patterns under a key, each pattern is a string or a list of tokens
+    # If the same pattern is added more than once, the first key it was added under is kept
+    def add(self, key, patterns):
+        for pattern in patterns:
+            tokens = self._tokens(pattern)
+            if not tokens:
+                continue
+
+            node = 0
+            for token in tokens:
+                child = self.children[node].get(token)
+                if child is None:
+                    child = len(self.children)
+                    self.children[node][token] = child
+                    self.children.append(dict())
+                    self.output.append(None)
+                node = child
+
+            if self.output[node] is None:
+                self.output[node] = (key, len(tokens))
+                self.count += 1
+
+        self.built = False
+
+    # Builds the failure links (longest proper suffix that is also a trie path) and dictionary links (nearest node
+    # on the failure chain where a pattern ends) with a breadth first pass over the trie
+    def _build(self):
+        self.fail = [0] * len(self.children)
+        self.dict_link = [0] * len(self.children)
+        queue = deque(self.children[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for token, child in self.children[node].items():
+                state = self.fail[node]
+                while state and token not in self.children[state]:
+                    state = self.fail[state]
+                fail = self.children[state].get(token, 0)
+                # Children of the root fail back to the root
+                self.fail[child] = fail if fail != child else 0
+                self.dict_link[child] = self.fail[child] if self.output[self.fail[child]] else self.dict_link[self.fail[child]]
+                queue.append(child)
+
+        self.built = True
+
+    # Returns the (key, start, end) of every match in a list of tokens, end is exclusive like a SpaCy span
+    def __call__(self, tokens):
+        if not self.built:
+            self._build()
+
+        # Length of the longest pattern starting at each token position
+        longest = dict()
+        node = 0
+        for i, token in enumerate(self._tokens(tokens)):
+            while node and token not in self.children[node]:
+                node = self.fail[node]
+            node = self.children[node].get(token, 0)
+
+            # Follows the dictionary links to every pattern ending at this token
+            state = node if self.output[node] else self.dict_link[node]
+            while state:
+                key, length = self.output[state]
+                start = i - length + 1
+                if length > longest.get(start, (0, None))[0]:
+                    longest[start] = (length, key)
+                state = self.dict_link[state]
+
+        # Takes the longest match at the leftmost position, then continues after its end
+        matches = list()
+        end = 0
+        for start in sorted(longest):
+            if start < end:
+                continue
+            length, key = longest[start]
+            end = start + length
+            matches.append((key, start, end))
+
+        return matches
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Embedded metadata store for the subreddits being harvested and modeled. Replaces post_data.json
+with a SQLite database in WAL mode, so several harvesters can update it at once and work lists
+can be queried without loading or globbing anything.
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Union, Dict
+from rdsmproj import utils
+
+
+# Status of a subreddit once its posts have been retrieved.
+POSTS = 'posts'
+# Status of a subreddit once its comments have been retrieved.
+COMMENTS = 'comments'
+# Status of a subreddit whose last retrieval failed.
+FAILED = 'failed'
+
+# Columns that can be updated for a subreddit.
+FIELDS = ('posts', 'comments', 'last_fetch', 'status')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subreddits (
+    name TEXT PRIMARY KEY,
+    posts INTEGER,
+    comments INTEGER,
+    last_fetch REAL,
+    status TEXT
+)
+"""
+
+
+class MetadataStore:
+    """
+    SQLite store of the name, post count, comment count, last fetch time, and status of every
+    subreddit. Each operation uses its own short connection and transaction, so the store can be
+    shared by threads and by separate processes. WAL mode lets readers run while a harvester
+    writes, and writers wait for each other instead of overwriting each other's changes.
+
+    Parameters
+    ----------
+    path: str, Path (Optional, default data/subreddits.db)
+        Path of the database file.
+    timeout: float (Optional, default 30)
+        Number of seconds a writer waits for another writer to finish.
+    """
+    def __init__(self, path:Optional[Union[str, Path]]=None, timeout:float=30):
+        if path is None:
+            path = store_path()
+        self.path = Path(path)
+        utils.check_folder(self.path.parent)
+        self.timeout = timeout
+        connection = self._connect()
+        with connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(_SCHEMA)
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Opens a connection to the database.
+        """
+        connection = sqlite3.connect(self.path, timeout=self.timeout)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def update(self, name:str, **fields) -> None:
+        """
+        Inserts or updates a subreddit. Only the fields given are changed.
+
+        Parameters
+        ----------
+        name: str
+            Name of the subreddit.
+        fields:
+            Any of posts, comments, last_fetch, and status. last_fetch is set to the current time
+            if posts or comments are given without it.
+        """
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f'Unknown fields: {sorted(unknown)}. Use any of {FIELDS}')
+        if ('posts' in fields or 'comments' in fields) and 'last_fetch' not in fields:
+            fields['last_fetch'] = time.time()
+        columns = ['name'] + list(fields)
+        placeholders = ', '.join('?' for _ in columns)
+        if fields:
+            updates = ', '.join(f'{column} = excluded.{column}' for column in fields)
+            conflict = f'DO UPDATE SET {updates}'
+        else:
+            conflict = 'DO NOTHING'
+        connection = self._connect()
+        with connection:
+            connection.execute(f'INSERT INTO subreddits ({", ".join(columns)}) '
+                               f'VALUES ({placeholders}) ON CONFLICT(name) {conflict}',
+                               [name, *fields.values()])
+        connection.close()
+
+    def get(self, name:str) -> Optional[Dict]:
+        """
+        Returns the fields of a subreddit as a dictionary, or None if it is not in the store.
+        """
+        connection = self._connect()
+        row = connection.execute('SELECT * FROM subreddits WHERE name = ?', [name]).fetchone()
+        connection.close()
+        return dict(row) if row else None
+
+    def names(self,
+              status:Optional[Union[str, list[str]]]=None,
+              min_posts:Optional[int]=None,
+              max_posts:Optional[int]=None,
+              exclude_status:Optional[Union[str, list[str]]]=None,
+              order_by_posts:Optional[bool]=None) -> list[str]:
+        """
+        Queries the names of subreddits.
+
+        Parameters
+        ----------
+        status: str, list[str] (Optional, default None)
+            Only subreddits with one of these statuses.
+        min_posts: int (Optional, default None)
+            Only subreddits with at least this many posts.
+        max_posts: int (Optional, default None)
+            Only subreddits with fewer than this many posts.
+        exclude_status: str, list[str] (Optional, default None)
+            Leaves out subreddits with one of these statuses.
+        order_by_posts: bool (Optional, default None)
+            If True, largest first. If False, smallest first. If None, by name.
+
+        Returns
+        -------
+            List of subreddit names.
+        """
+        clauses = []
+        params = []
+        if status is not None:
+            values = [status] if isinstance(status, str) else list(status)
+            clauses.append(f'status IN ({", ".join("?" for _ in values)})')
+            params.extend(values)
+        if exclude_status is not None:
+            values = [exclude_status] if isinstance(exclude_status, str) else list(exclude_status)
+            clauses.append(f'(status IS NULL OR status NOT IN ({", ".join("?" for _ in values)}))')
+            params.extend(values)
+        if min_posts is not None:
+            clauses.append('posts >= ?')
+            params.append(min_posts)
+        if max_posts is not None:
+            clauses.append('posts < ?')
+            params.append(max_posts)
+        query = 'SELECT name FROM subreddits'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        if order_by_posts is None:
+            query += ' ORDER BY name'
+        else:
+            query += f' ORDER BY posts {"DESC" if order_by_posts else "ASC"}'
+        connection = self._connect()
+        names = [row['name'] for row in connection.execute(query, params)]
+        connection.close()
+        return names
+
+    def post_counts(self, names:Optional[list[str]]=None) -> Dict[str, int]:
+        """
+        Returns the number of posts of each subreddit (or of the given subreddits) with the
+        subreddit names as keys, like the old post_data.json.
+        """
+        connection = self._connect()
+        rows = connection.execute('SELECT name, posts FROM subreddits WHERE posts IS NOT NULL')
+        counts = {row['name']: row['posts'] for row in rows}
+        connection.close()
+        if names is not None:
+            counts = {name: counts[name] for name in names if name in counts}
+        return counts
+
+    def import_post_data(self, path:Union[str, Path]) -> int:
+        """
+        Imports the post counts of an existing post_data.json. Subreddits already in the store
+        are left unchanged.
+
+        Parameters
+        ----------
+        path: str, Path
+            Path of post_data.json.
+
+        Returns
+        -------
+            Number of subreddits imported.
+        """
+        post_data = utils.load_json(path)
+        connection = self._connect()
+        with connection:
+            cursor = connection.executemany(
+                'INSERT INTO subreddits (name, posts, status) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO NOTHING',
+                [(name, posts, POSTS) for name, posts in post_data.items()])
+        connection.close()
+        return cursor.rowcount
+
+    def import_comment_data(self, path:Union[str, Path]) -> int:
+        """
+        Records the subreddits with comment data in a comments folder (the {name}_comments files)
+        as having their comments retrieved, with the number of comments from {name}_count if it
+        exists. Subreddits that already have a comment count are left unchanged.
+
+        Parameters
+        ----------
+        path: str, Path
+            Folder of the comment data.
+
+        Returns
+        -------
+            Number of subreddits imported.
+        """
+        rows = []
+        for name in utils.data_names(path, '_comments'):
+            count_file = Path(path, f'{name}_count.json')
+            comments = utils.load_json(count_file) if count_file.is_file() else None
+            rows.append((name, comments, COMMENTS))
+        connection = self._connect()
+        with connection:
+            cursor = connection.executemany(
+                'INSERT INTO subreddits (name, comments, status) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET comments = excluded.comments, '
+                'status = excluded.status WHERE subreddits.comments IS NULL',
+                rows)
+        connection.close()
+        return cursor.rowcount
+
+    def has_comments(self) -> bool:
+        """
+        Checks if the comment count of any subreddit is recorded.
+        """
+        connection = self._connect()
+        row = connection.execute('SELECT 1 FROM subreddits WHERE comments IS NOT NULL '
+                                 'OR status = ? LIMIT 1', [COMMENTS]).fetchone()
+        connection.close()
+        return row is not None
+
+def store_path(data_path:Optional[Union[str, Path]]=None) -> Path:
+    """
+    Returns the path of the metadata store of a data folder. The store is kept in the folder that
+    holds the data folders, so the posts and comments folders of one data directory (e.g.
+    data/posts and data/comments) share one subreddits.db (e.g. data/subreddits.db).
+
+    Parameters
+    ----------
+    data_path: str, Path (Optional, default None)
+        Folder the data is written to (e.g. the posts or comments folder). data/posts if None.
+
+    Returns
+    -------
+        Path of the database file.
+    """
+    if data_path is None:
+        return Path(Path.cwd(), 'data', 'subreddits.db')
+    return Path(Path(data_path).parent, 'subreddits.db')
+
+def get_store(post_path:Optional[Union[str, Path]]=None,
+              path:Optional[Union[str, Path]]=None,
+              comment_path:Optional[Union[str, Path]]=None) -> MetadataStore:
+    """
+    Opens the metadata store. Data from an earlier version is imported: if the store is empty and
+    a post_data.json exists in post_path, its post counts are imported, and if no comment counts
+    are recorded yet, the subreddits with comment data in comment_path are recorded as done.
+
+    Parameters
+    ----------
+    post_path: str, Path (Optional, default data/posts)
+        Folder of the post data.
+    path: str, Path (Optional, default None)
+        Path of the database file. Defaults to subreddits.db next to post_path. See store_path.
+    comment_path: str, Path (Optional, default None)
+        Folder of the comment data. Defaults to the comments folder next to post_path.
+
+    Returns
+    -------
+        MetadataStore
+    """
+    if post_path is None:
+        post_path = utils.get_data_path('posts')
+    if path is None:
+        path = store_path(post_path)
+    if comment_path is None:
+        comment_path = Path(Path(post_path).parent, 'comments')
+    store = MetadataStore(path)
+    post_data = Path(post_path, 'post_data.json')
+    if post_data.is_file() and not store.names():
+        print(f'Imported {store.import_post_data(post_data)} subreddits from {post_data}')
+    if Path(comment_path).is_dir() and not store.has_comments():
+        imported = store.import_comment_data(comment_path)
+        if imported:
+            print(f'Imported {imported} subreddits with comments from {comment_path}')
+    return store
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frozen bigram and trigram phrase models. A phrase model is trained once, saved to disk as two
+gensim Phraser files, and reused by later runs. The models can be applied to documents in batches
+by a pool of worker processes, and one model can be shared by several subreddits.
+"""
+
+import json
+import os
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Optional, Union
+from gensim.models.phrases import Phrases, Phraser
+from rdsmproj import utils
+from rdsmproj import stage_cache
+
+
+# Version of the saved phrase models. Changing it invalidates every saved model.
+PHRASE_MODEL_VERSION = 1
+
+
+def apply_phrase_batch(phrasers:tuple, tokenized_docs:list[list[str]]) -> list[list[str]]:
+    """
+    Applies phrase models to a batch of tokenized documents in the order they are given. Runs
+    inside of the worker processes used by PhraseModel.apply.
+    """
+    for phraser in phrasers:
+        tokenized_docs = [phraser[doc] for doc in tokenized_docs]
+    return tokenized_docs
+
+class PhraseModel:
+    """
+    Bigram and trigram phrase models. The trigram model is trained on the output of the bigram
+    model, so applying both replaces up to three related unigram tokens with a single phrase.
+    (e.g ['New', 'York', 'City'] becomes ['New York City'])
+
+    Parameters
+    ----------
+    bigram: gensim.models.phrases.FrozenPhrases
+        Frozen bigram model.
+
+    trigram: gensim.models.phrases.FrozenPhrases
+        Frozen trigram model trained on the bigram output.
+
+    key: str (Optional, default None)
+        Hash identifying the data and arguments the models were trained with. Used by PreProcess
+        as part of the cache key of the phrases stage.
+    """
+    def __init__(self, bigram:Phraser, trigram:Phraser, key:Optional[str]=None):
+        self.bigram = bigram
+        self.trigram = trigram
+        self.key = key
+
+    @classmethod
+    def train(cls,
+              corpora:Iterable[Iterable[list[str]]],
+              ngram_vocab_args:dict,
+              key:Optional[str]=None) -> 'PhraseModel':
+        """
+        Trains the bigram and trigram models. Each corpus is read twice, once for each model, and
+        only one corpus is applied to the bigram model at a time, so a model can be trained
+        across several subreddits without holding all of them in memory.
+
+        Parameters
+        ----------
+        corpora: Iterable[Iterable[list[str]]]
+            Restartable collection of tokenized corpora (e.g. a list with one corpus, or one
+            corpus for each subreddit loaded on demand).
+
+        ngram_vocab_args: dict
+            Arguments for gensim phrases. See preprocess.get_phrase_args.
+
+        key: str (Optional, default None)
+            Hash identifying the training data and arguments.
+
+        Returns
+        -------
+            Trained PhraseModel.
+        """
+        bigram = Phrases(**ngram_vocab_args)
+        for corpus in corpora:
+            bigram.add_vocab(corpus)
+        bigram_mod = Phraser(bigram)
+        # Frees the counts of the bigram model before the trigram counts are collected.
+        del bigram
+
+        trigram = Phrases(**ngram_vocab_args)
+        for corpus in corpora:
+            trigram.add_vocab([bigram_mod[doc] for doc in corpus])
+        trigram_mod = Phraser(trigram)
+        return cls(bigram_mod, trigram_mod, key)
+
+    def apply(self,
+              tokenized_docs:list[list[str]],
+              workers:Optional[int]=1,
+              chunksize:Optional[int]=1000) -> list[list[str]]:
+        """
+        Applies the bigram and then the trigram model to every document. Documents are sent to
+        the worker processes in batches of chunksize documents together with the frozen models.
+        Output is identical to applying the models one document at a time.
+
+        Parameters
+        ----------
+        tokenized_docs: list[list[str]]
+            Tokenized list of documents.
+
+        workers: int (Optional, default 1)
+            Number of worker processes. If None, workers will be set to number of real cores - 1.
+
+        chunksize: int (Optional, default 1000)
+            Number of documents in each batch.
+
+        Returns
+        -------
+            Tokenized list of documents with phrases replacing the related unigram tokens.
+        """
+        # Imported here as preprocess imports this module.
+        from rdsmproj.preprocess import parallel_map
+
+        batches = [tokenized_docs[i:i + chunksize]
+                   for i in range(0, len(tokenized_docs), chunksize)]
+        batches = parallel_map(partial(apply_phrase_batch, (self.bigram, self.trigram)),
+                               batches, workers, 1, desc='Applying Phrases')
+        return [doc for batch in batches for doc in batch]
+
+    @staticmethod
+    def _files(path:Union[str, Path], name:str) -> dict[str, Path]:
+        """
+        Returns the paths of the files of a saved phrase model.
+        """
+        return {'bigram': Path(path, f'{name}_bigram.phraser'),
+                'trigram': Path(path, f'{name}_trigram.phraser'),
+                'meta': Path(path, f'{name}_phrases.json')}
+
+    def save(self, path:Union[str, Path], name:str):
+        """
+        Saves the frozen models as {name}_bigram.phraser and {name}_trigram.phraser along with
+        {name}_phrases.json holding the key of the model. Files are written to a temporary name
+        and renamed once complete.
+
+        Parameters
+        ----------
+        path: str, Path
+            Folder the models are written to.
+
+        name: str
+            Name of the subreddit, or of the group of subreddits for a shared model.
+        """
+        utils.check_folder(path)
+        files = self._files(path, name)
+        for model in ('bigram', 'trigram'):
+            temp = Path(path, f'{files[model].name}.temp')
+            getattr(self, model).save(str(temp))
+            os.replace(temp, files[model])
+        meta = {'version': PHRASE_MODEL_VERSION,
+                'key': self.key,
+                'files': {model: stage_cache.hash_file(files[model])
+                          for model in ('bigram', 'trigram')}}
+        utils.dump_json(meta, path, f'{files["meta"].stem}.temp')
+        os.replace(Path(path, f'{files["meta"].stem}.temp.json'), files['meta'])
+
+    @classmethod
+    def load(cls,
+             path:Union[str, Path],
+             name:str,
+             key:Optional[str]=None) -> Optional['PhraseModel']:
+        """
+        Loads a saved phrase model.
+
+        Parameters
+        ----------
+        path: str, Path
+            Folder the models were written to.
+
+        name: str
+            Name the models were saved under.
+
+        key: str (Optional, default None)
+            If given, the model is only loaded if it was trained with this key.
+
+        Returns
+        -------
+            PhraseModel, or None if there is no saved model or it does not match the key.
+        """
+        files = cls._files(path, name)
+        if not all(file.is_file() for file in files.values()):
+            return None
+        with open(files['meta'], mode='r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta.get('version') != PHRASE_MODEL_VERSION:
+            return None
+        if key is not None and meta.get('key') != key:
+            return None
+        # The key of a model loaded without one identifies it by the contents of its files.
+        if meta.get('key') is None:
+            meta['key'] = stage_cache.hash_data(meta['files'])
+        return cls(Phraser.load(str(files['bigram'])),
+                   Phraser.load(str(files['trigram'])),
+                   meta['key'])
@@ -5,18 +5,36 @@ Preprocessing functions for topic generation files needed for topic modeling alg
 """
 
 from pathlib import Path
-from typing import Any, Union, Optional
-import re
+from typing import Any, Callable, Iterable, Iterator, Union, Optional
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import psutil
 from tqdm import tqdm
 from gensim.corpora.dictionary import Dictionary
+from gensim.corpora.mmcorpus import MmCorpus
 from gensim.models.phrases import Phrases, Phraser, ENGLISH_CONNECTOR_WORDS
 from gensim.parsing.preprocessing import STOPWORDS
 from nltk.tokenize import word_tokenize
 from nltk.corpus import wordnet
 from nltk.stem import WordNetLemmatizer
-from nltk import pos_tag
+from nltk import pos_tag, pos_tag_sents
 import contractions
 from  rdsmproj import utils
+from rdsmproj import stage_cache, storage, text_cleaner
+from rdsmproj.dedup import Deduplicator
+from rdsmproj.phrase_model import PhraseModel
+from rdsmproj.streaming import JsonlCorpus, PhraseStream, write_jsonl
+
+
+# Maximum number of (token, wordnet POS) pairs kept in the shared lemma cache. Least recently
+# used pairs are evicted once the cache is full.
+LEMMA_CACHE_SIZE = 2**18
+
+# Shared lemmatizer used by lemmatize_token.
+_lemmatizer = WordNetLemmatizer()
+
+# Keys of the post data used by get_doc. Only these columns are read from Parquet post files.
+DOC_COLUMNS = ['title', 'selftext', 'all_text']
 
 
 def get_id2word(texts:list[str],
@@ -67,66 +85,91 @@ def get_docs(data:list[dict]) -> list[str]:
         List of strings with each string (document) being the text for the title of the post along
         with the text of the post itself and any retrieved comments to that post.
     """
-    # Initializes documents list.
-    documents = []
-    # Iterates over every dictionary item in data.
-    for item in data:
-        # Checks if 'all_text' is not in dictionary of item. This is for posts that do not have
-        # associated comment data, which would be found in the 'all_text' key.
-        if 'all_text' not in item:
-            # Gets title text.
-            title = item['title']
-            # Checks if post text exists, then retrieves it.
-            if 'selftext' in item:
-                selftext = item['selftext']
-            # If post text does not exist, then sets selftext to empty string.
-            else:
-                selftext = ''
-            # Creates entry of retrieved title and post text data.
-            all_text = f"{title} {selftext}"
+    return [get_doc(item) for item in data]
+
+def get_doc(item:dict) -> str:
+    """
+    Retrieves the text of a single post for topic generation, stripped of brackets, web links, and
+    email addresses and with contractions expanded.
+
+    Parameters
+    ----------
+    item: dict
+        Post data containing metadata as well as post title and associated text and comment text
+        for that post.
+
+    Returns
+    -------
+    all_text: str
+        Text for the title of the post along with the text of the post itself and any retrieved
+        comments to that post.
+    """
+    # Checks if 'all_text' is not in dictionary of item. This is for posts that do not have
+    # associated comment data, which would be found in the 'all_text' key.
+    if 'all_text' not in item:
+        # Gets title text.
+        title = item['title']
+        # Checks if post text exists, then retrieves it.
+        if 'selftext' in item:
+            selftext = item['selftext']
+        # If post text does not exist, then sets selftext to empty string.
         else:
-            # Retrieves title, post, and comment data from item.
-            all_text = item['all_text']
-
-        # Ensures that encoding is utf-8 and removes junk items.
-        all_text = strip_junk(all_text)
-        # Expands contractions (e.g. can't -> cannot)
-        try:
-            all_text = contractions.fix(all_text, slang=False)
-        except IndexError:
-            pass
-        documents.append(all_text)
+            selftext = ''
+        # Creates entry of retrieved title and post text data.
+        all_text = f"{title} {selftext}"
+    else:
+        # Retrieves title, post, and comment data from item.
+        all_text = item['all_text']
 
-    return documents
+    # Ensures that encoding is utf-8 and removes junk items.
+    all_text = strip_junk(all_text)
+    # Expands contractions (e.g. can't -> cannot)
+    try:
+        all_text = contractions.fix(all_text, slang=False)
+    except IndexError:
+        pass
+    return all_text
 
-def get_unique(data:list[Any], verbose:Optional[bool] = False):
+def get_unique(data:list[str],
+               verbose:Optional[bool] = False,
+               near_duplicate_threshold:Optional[float] = None) -> list[str]:
     """
-    Finds the set of unique items in the data and returns that list of unique items.
+    Removes duplicate documents in a single pass, keeping the first occurrence of each document
+    and the original order of the documents.
 
     Parameters:
     ----------
-    data: list[Any]
+    data: list[str]
         List of text data to be parsed for duplicates.
     verbose: bool (Optional, default False)
-        If True, will print out total number of items and final number of unique items.
+        If True, will print out total number of items, the number of items removed as exact and
+        near duplicates, and final number of unique items.
+    near_duplicate_threshold: float (Optional, default None)
+        If given, documents whose estimated Jaccard similarity (MinHash/LSH over word shingles) to
+        an earlier document is at least this value are also removed. If None, only exact
+        duplicates are removed.
 
     Returns
     -------
-    data: list[Any]
-        List of passed text data with only unique entries. Note that creating the set used to
-        find unique values does NOT preserve order of the entries.
-    """
-    # Finds the number of entries in the list, for use in verbose.
-    initial = len(data)
-    # Uses set to quickly and efficiently find only unique entries.
-    documents = list(set(data))
-    # Finds the number of entries in the newer list, for use in verbose.
-    final = len(data)
-    # If verbose is True, prints text of before and after size of list.
+    data: list[str]
+        List of passed text data with only unique entries in their original order.
+    """
+    deduplicator = get_deduplicator(near_duplicate_threshold)
+    documents = list(deduplicator(data))
+    # If verbose is True, prints the number of documents removed and why.
     if verbose:
-        print(f'Total number of documents: {initial}. Final unique number of documents: {final}.')
+        print(deduplicator.report())
     return documents
 
+def get_deduplicator(near_duplicate_threshold:Optional[float] = None) -> Deduplicator:
+    """
+    Creates a Deduplicator that removes exact duplicates, and near duplicates if a threshold is
+    given.
+    """
+    if near_duplicate_threshold:
+        return Deduplicator(near_duplicates=True, threshold=near_duplicate_threshold)
+    return Deduplicator()
+
 def strip_junk(text:str) -> str:
     """
     Filters text by removing brackets and their text (e.g. [deleted]), internet links, and email
@@ -143,21 +186,37 @@ def strip_junk(text:str) -> str:
     text: str
         Output text string after filters applied.
     """
-    # Ensures utf-8
-    text = text.encode('utf-8').decode('utf-8')
-    #remove brackets such as [deleted]
-    text = re.sub(r"\[.*?\]", '', text)
-    #remove www links
-    text = re.sub(r"www\S+", '', text)
-    #remove http(s) links
-    text = re.sub(r"http\S+", '', text)
-    #remove email addresses
-    text = re.sub(r"\S*@\S+", '', text)
+    # Uses the precompiled text normalization engine. See text_cleaner.strip_junk.
+    return text_cleaner.strip_junk(text)
 
-    return text
+def get_phrase_args(ngram_vocab_args:Optional[dict]=None) -> dict:
+    """
+    Creates the arguments passed to gensim phrases. Defaults are used if no arguments are given.
+    The delimiter is always set to a space.
+
+    Parameters
+    ----------
+    ngram_vocab_args: dict (Optional, default None)
+        Custom arguments for gensim phrases.
+
+    Returns:
+        Copy of the arguments that can be modified without changing the passed dictionary.
+    """
+    if not ngram_vocab_args:
+        return {'min_count': 5,
+                'threshold':10.0,
+                'delimiter': ' ',
+                'connector_words':ENGLISH_CONNECTOR_WORDS}
+    # Copies the arguments so that the caller's dictionary is not modified.
+    ngram_vocab_args = dict(ngram_vocab_args)
+    ngram_vocab_args['delimiter'] = ' '
+    return ngram_vocab_args
 
 def get_phrases(tokenized_docs:list[list[str]],
-                ngram_vocab_args:Optional[dict]=None) -> list[list[str]]:
+                ngram_vocab_args:Optional[dict]=None,
+                phrase_model:Optional[PhraseModel]=None,
+                workers:Optional[int]=1,
+                chunksize:Optional[int]=1000) -> list[list[str]]:
     """
     Creates phrases of bigrams and trigrams from the tokenized documents using Gensim. The phrases
     replace the individual tokens. (e.g ['New', 'York'] becomes ['New York'])
@@ -173,32 +232,162 @@ def get_phrases(tokenized_docs:list[list[str]],
         For more information visit:
         https://radimrehurek.com/gensim/models/phrases.html
 
+    phrase_model: PhraseModel (Optional, default None)
+        Previously trained (e.g. shared or saved) phrase model to apply. If None, a new model is
+        trained on tokenized_docs.
+
+    workers: int (Optional, default 1)
+        Number of worker processes used to apply the phrase models. If None, workers will be set
+        to number of real cores - 1.
+
+    chunksize: int (Optional, default 1000)
+        Number of documents sent to a worker process at a time.
+
     Returns:
         Tokenized list of documents with bigram and trigram phrases replacing related unigram
         tokens.
     """
-    if not ngram_vocab_args:
-        ngram_vocab_args = {'sentences':tokenized_docs,
-                            'min_count': 5,
-                            'threshold':10.0,
-                            'delimiter': ' ',
-                            'connector_words':ENGLISH_CONNECTOR_WORDS}
-    else:
-        ngram_vocab_args['sentences'] = tokenized_docs
-        ngram_vocab_args['delimiter'] = ' '
+    if phrase_model is None:
+        phrase_model = PhraseModel.train([tokenized_docs], get_phrase_args(ngram_vocab_args))
+    return phrase_model.apply(tokenized_docs, workers=workers, chunksize=chunksize)
+
+class _LemmaCorpora:
+    """
+    Restartable collection of the lemmatized documents of several subreddits. Each subreddit is
+    loaded from the PreProcess stage cache (or computed) only when it is reached, so only one
+    subreddit is held in memory at a time.
+    """
+    def __init__(self, names:list[str], preprocess_args:Optional[dict]=None):
+        self.names = names
+        self.preprocess_args = preprocess_args or {}
+
+    def __iter__(self) -> Iterator[list[list[str]]]:
+        for name in self.names:
+            yield PreProcess(name, **self.preprocess_args).get_stage('lemmas')
 
-    bigram = Phrases(**ngram_vocab_args)
-    bigram_mod = Phraser(bigram)
-    bigrams = [bigram_mod[doc] for doc in tqdm(tokenized_docs, desc='Creating Bigrams')]
+def build_shared_phrase_model(names:list[str],
+                              name:Optional[str]='shared',
+                              path:Optional[Union[Path,str]]=None,
+                              ngram_vocab_args:Optional[dict]=None,
+                              preprocess_args:Optional[dict]=None) -> PhraseModel:
+    """
+    Trains one phrase model across several subreddits (e.g. all of the rare disease subreddits)
+    so that it can be applied to each of them instead of training a model per subreddit. The
+    model is saved to path and loaded from there by later runs with the same subreddits and
+    arguments.
+
+    Parameters
+    ----------
+    names: list[str]
+        Names of the subreddits.
 
-    ngram_vocab_args['sentences'] = bigrams
-    trigram = Phrases(**ngram_vocab_args)
-    trigram_mod = Phraser(trigram)
-    trigrams = [trigram_mod[doc] for doc in tqdm(bigrams, desc='Creating Trigrams')]
+    name: str (Optional, default 'shared')
+        Name the model is saved under.
 
-    return trigrams
+    path: str, Path (Optional, default data/models)
+        Folder the model is written to.
 
-def tokenize_docs(documents:list[str]) -> list[list[str]]:
+    ngram_vocab_args: dict (Optional, default None)
+        Pass custom arguments to gensim phrases. See get_phrases.
+
+    preprocess_args: dict (Optional, default None)
+        Arguments passed to PreProcess for each subreddit to find its lemmatized documents.
+
+    Returns
+    -------
+        PhraseModel to pass to PreProcess as phrase_model.
+    """
+    if not path:
+        path = utils.get_data_path('models')
+    ngram_vocab_args = get_phrase_args(ngram_vocab_args)
+    corpora = _LemmaCorpora(names, preprocess_args)
+    # Keys the model by the lemmas of every subreddit and the phrase arguments.
+    lemma_keys = [PreProcess(subreddit, **corpora.preprocess_args)._stage_keys()['lemmas']
+                  for subreddit in names]
+    key = stage_cache.hash_data({'lemmas': lemma_keys, 'ngram_vocab_args': ngram_vocab_args})
+
+    phrase_model = PhraseModel.load(path, name, key)
+    if phrase_model is None:
+        phrase_model = PhraseModel.train(corpora, ngram_vocab_args, key)
+        phrase_model.save(path, name)
+    return phrase_model
+
+def get_workers(workers:Optional[int]=1) -> int:
+    """
+    Finds the number of worker processes to use for parallel preprocessing.
+
+    Parameters:
+    ----------
+    workers: int (Optional, default 1)
+        Number of worker processes. If None, workers will be set to number of real cores - 1.
+
+    Returns
+    -------
+        Number of worker processes, always at least 1.
+    """
+    if not workers:
+        # Number of workers equal to 1 less than total physical number of cores.
+        workers = (psutil.cpu_count(logical=False) or 2) - 1
+    return max(int(workers), 1)
+
+def _process_chunk(function:Callable, chunk:list[Any]) -> list[Any]:
+    """
+    Applies a function to every item of a chunk of documents. Runs inside of the worker processes
+    used by parallel_map.
+    """
+    return [function(item) for item in chunk]
+
+def parallel_map(function:Callable,
+                 items:list[Any],
+                 workers:Optional[int]=1,
+                 chunksize:Optional[int]=1000,
+                 desc:Optional[str]=None) -> list[Any]:
+    """
+    Applies a function to every item in a list. If more than one worker is used, the items are
+    sharded into chunks that are processed by a pool of worker processes. The output keeps the
+    original order of the items and is identical to the serial output.
+
+    Parameters:
+    ----------
+    function: Callable
+        Function applied to each item. Must be a module level function so that it can be sent to
+        the worker processes.
+
+    items: list[Any]
+        List of items (e.g. documents) to be processed.
+
+    workers: int (Optional, default 1)
+        Number of worker processes. If 1, items are processed serially in the current process. If
+        None, workers will be set to number of real cores - 1.
+
+    chunksize: int (Optional, default 1000)
+        Number of items sent to a worker process at a time.
+
+    desc: str (Optional, default None)
+        Description for the progress bar.
+
+    Returns
+    -------
+        List of results with one result for each item, in the same order as items.
+    """
+    workers = get_workers(workers)
+    # Serial path. Also used when there is not enough data to be worth starting the pool.
+    if workers == 1 or len(items) <= chunksize:
+        return [function(item) for item in tqdm(items, desc=desc)]
+
+    # Shards the items into chunks. Executor.map returns the chunks in the order submitted.
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with tqdm(total=len(items), desc=desc) as progress:
+            for chunk in executor.map(_process_chunk, [function]*len(chunks), chunks):
+                results.extend(chunk)
+                progress.update(len(chunk))
+    return results
+
+def tokenize_docs(documents:list[str],
+                  workers:Optional[int]=1,
+                  chunksize:Optional[int]=1000) -> list[list[str]]:
     """
     Tokenizes a list of text documents for use in LDA topic model generation or coherence model
     generation.
@@ -208,13 +397,20 @@ def tokenize_docs(documents:list[str]) -> list[list[str]]:
     documents: list[str]
         List of strings with each string being a separate document.
 
+    workers: int (Optional, default 1)
+        Number of worker processes used to tokenize the documents. If None, workers will be set
+        to number of real cores - 1.
+
+    chunksize: int (Optional, default 1000)
+        Number of documents sent to a worker process at a time.
+
     Returns
     -------
         List of string tokens (words) with each list corresponding to a document and the list of
         string tokens (words) associated with that document.
     """
     # Applies tokenization to each document in documents.
-    return [tokenize_text(doc) for doc in tqdm(documents, desc='Tokenizing Text')]
+    return parallel_map(tokenize_text, documents, workers, chunksize, desc='Tokenizing Text')
 
 def tokenize_text(text:str) -> list[str]:
     """
@@ -279,33 +475,104 @@ def get_word_net_pos(tag:str) -> str:
     else:
         return None
 
-def lemma_text(tokenized_doc:list[str]) -> list[str]:
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_token(token:str, pos:str) -> str:
     """
-    Lemmatizes tokens. Removes tokens if not adjective, adverb, noun, or verb. Removes any
-    remaining tokens if they are in STOPWORDS or not two characters or longer.
+    Lemmatizes a single token given its wordnet POS tag. Results are memoized in a bounded LRU
+    cache shared by every document lemmatized in the process, as the same (token, POS) pairs come
+    up repeatedly in Reddit text.
 
     Parameters:
     ----------
-    tokenized_doc: list[str]
-        Tokenized document.
+    token: str
+        Token to be lemmatized.
+
+    pos: str
+        Wordnet POS tag. 'a', 'v', 'n', or 'r'.
+
+    Returns:
+    -------
+        Lemma of the token.
+    """
+    return _lemmatizer.lemmatize(token, pos=pos)
+
+def lemma_cache_info() -> dict:
+    """
+    Reports the usage of the lemma cache for the current process. Each worker process used by
+    parallel_map keeps its own cache.
+
+    Returns:
+    -------
+        Dictionary with the hits, misses, maxsize, currsize, and hit_rate of the cache.
+    """
+    info = lemmatize_token.cache_info()
+    lookups = info.hits + info.misses
+    return {'hits': info.hits,
+            'misses': info.misses,
+            'maxsize': info.maxsize,
+            'currsize': info.currsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0}
+
+def lemma_tagged(tag_tokens:list[tuple[str, str]]) -> list[str]:
+    """
+    Lemmatizes POS tagged tokens. Removes tokens if not adjective, adverb, noun, or verb. Removes
+    any remaining tokens if they are in STOPWORDS or not two characters or longer.
+
+    Parameters:
+    ----------
+    tag_tokens: list[tuple[str, str]]
+        Tokens tagged with part of speech (POS) as returned by nltk.pos_tag.
 
     Returns:
     -------
         Tokenized document.
     """
-    # Initializes Lemmatizer.
-    lmr = WordNetLemmatizer()
-    # Tags tokens with part of speech (POS)
-    tag_tokens = pos_tag(tokenized_doc)
     # Converts POS into wordnet adjective, verb, noun, adverb, or None.
     tag_tokens = [(token, get_word_net_pos(pos)) for token, pos in tag_tokens]
     # Lemmatizes tokens if POS is not None.
-    tag_tokens = [lmr.lemmatize(token, pos=tag) for token, tag in tag_tokens if tag]
+    tag_tokens = [lemmatize_token(token, tag) for token, tag in tag_tokens if tag]
     # Removes tokens if token size is less than 2 or if they are in STOPWORDS.
     tag_tokens = [token for token in tag_tokens if len(token) > 1 and token not in STOPWORDS]
     return tag_tokens
 
-def get_lemma(tokenized_docs:list[list[str]]) -> list[list[str]]:
+def lemma_text(tokenized_doc:list[str]) -> list[str]:
+    """
+    Lemmatizes tokens. Removes tokens if not adjective, adverb, noun, or verb. Removes any
+    remaining tokens if they are in STOPWORDS or not two characters or longer.
+
+    Parameters:
+    ----------
+    tokenized_doc: list[str]
+        Tokenized document.
+
+    Returns:
+    -------
+        Tokenized document.
+    """
+    # Tags tokens with part of speech (POS) and lemmatizes them.
+    return lemma_tagged(pos_tag(tokenized_doc))
+
+def lemma_batch(tokenized_docs:list[list[str]]) -> list[list[str]]:
+    """
+    Lemmatizes a batch of tokenized documents. The whole batch is POS tagged in one call so the
+    overhead of loading the tagger is paid once per batch instead of once per document. Output is
+    identical to calling lemma_text on each document.
+
+    Parameters:
+    ----------
+    tokenized_docs: list[list[str]]
+        Tokenized list of documents.
+
+    Returns:
+    -------
+        Tokenized documents
+    """
+    return [lemma_tagged(tag_tokens) for tag_tokens in pos_tag_sents(tokenized_docs)]
+
+def get_lemma(tokenized_docs:list[list[str]],
+              workers:Optional[int]=1,
+              chunksize:Optional[int]=1000,
+              batch_size:Optional[int]=None) -> list[list[str]]:
     """
     Tags tokens in each document with part of speech (POS) and removes if not adjective, adverb,
     noun, or verb. Removes remaining tokens if they are in STOPWORDS or not greater than 2
@@ -316,12 +583,32 @@ def get_lemma(tokenized_docs:list[list[str]]) -> list[list[str]]:
     tokenized_docs: list[list[str]]
         Tokenized list of documents.
 
+    workers: int (Optional, default 1)
+        Number of worker processes used to lemmatize the documents. If None, workers will be set
+        to number of real cores - 1.
+
+    chunksize: int (Optional, default 1000)
+        Number of documents sent to a worker process at a time.
+
+    batch_size: int (Optional, default None)
+        If given, documents are POS tagged in batches of batch_size documents with one call to
+        the tagger per batch. If None, each document is tagged separately.
+
     Returns:
     -------
         Tokenized documents
     """
-    tokenized_docs = [lemma_text(doc) for doc in tqdm(tokenized_docs, desc='Lemmatizing Tokens')]
-    return tokenized_docs
+    if not batch_size:
+        tokenized_docs = parallel_map(lemma_text, tokenized_docs, workers, chunksize,
+                                      desc='Lemmatizing Tokens')
+        return tokenized_docs
+
+    # Groups the documents into batches and sends whole batches to the workers.
+    batches = [tokenized_docs[i:i + batch_size]
+               for i in range(0, len(tokenized_docs), batch_size)]
+    batches = parallel_map(lemma_batch, batches, workers, max(chunksize // batch_size, 1),
+                           desc='Lemmatizing Batches')
+    return [doc for batch in batches for doc in batch]
 
 class PreProcess:
     """
@@ -355,6 +642,35 @@ class PreProcess:
     keep_n: int (Optional, default 100000)
         Keep only the first keep_n most frequent tokens.
 
+    workers: int (Optional, default 1)
+        Number of worker processes used for tokenization and lemmatization. If None, workers will
+        be set to number of real cores - 1. Output is identical to using a single worker.
+
+    chunksize: int (Optional, default 1000)
+        Number of documents sent to a worker process at a time.
+
+    pos_batch_size: int (Optional, default None)
+        If given, documents are POS tagged in batches of this many documents instead of one at a
+        time.
+
+    ngram_vocab_args: dict (Optional, default None)
+        Pass custom arguments to gensim phrases. See get_phrases.
+
+    near_duplicate_threshold: float (Optional, default None)
+        If given, documents that are near duplicates of an earlier document (estimated Jaccard
+        similarity at or above the threshold) are removed as well as exact duplicates.
+
+    use_cache: bool (Optional, default True)
+        If True, the result of each stage (documents, tokens, lemmas, phrases, id2word, corpus) is
+        cached in model_path/cache. Each entry is keyed by a hash of its input data and its
+        parameters, so changing a setting only recomputes the stages after it.
+
+    phrase_model: PhraseModel (Optional, default None)
+        Phrase model to apply to the documents, e.g. one shared by all rare disease subreddits
+        from build_shared_phrase_model. If None, the phrase model saved in model_path is reused
+        if it was trained on the same lemmas and arguments, otherwise a new model is trained and
+        saved there as {name}_bigram.phraser and {name}_trigram.phraser.
+
 
     Returns, when called:
     ----------
@@ -370,36 +686,50 @@ class PreProcess:
                  documents:list[str]=None,
                  no_above:Optional[float] = 1.0,
                  no_below:Optional[int] = 10,
-                 keep_n: Optional[int] = 100000):
+                 keep_n: Optional[int] = 100000,
+                 workers: Optional[int] = 1,
+                 chunksize: Optional[int] = 1000,
+                 pos_batch_size: Optional[int] = None,
+                 ngram_vocab_args: Optional[dict] = None,
+                 near_duplicate_threshold: Optional[float] = None,
+                 use_cache: Optional[bool] = True,
+                 phrase_model: Optional[PhraseModel] = None):
 
         # Initialize parameters.
         self.name = name
         self.no_above = no_above
         self.no_below = no_below
         self.keep_n = keep_n
+        self.workers = workers
+        self.chunksize = chunksize
+        self.pos_batch_size = pos_batch_size
+        self.ngram_vocab_args = ngram_vocab_args
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.phrase_model = phrase_model
         self.data_folder = data_folder
-        self.documents = documents
+        self.input_documents = documents
+        self.documents = None
         self.tokenized_docs = None
         self.data_path = None
+        self.is_datafile = False
+        # Results of each stage of the pipeline once computed or loaded from the cache.
+        self.stages = {}
 
-        # Checks if datafile_path is given. If it exists, it loads the data,
-        # strips junk, and finds the unique items to create the list of documents.
+        # Checks if datafile_path is given. If it exists, the data is loaded from the file as a
+        # list of text documents.
         if datafile_path:
             self.data_path = datafile_path
-            data = utils.load_json(Path(self.data_path))
-            documents = [strip_junk(doc) for doc in documents]
-            self.documents = get_unique(data)
+            self.is_datafile = True
         # Checks if text documents are passed instead of a file path or subreddit name.
         elif documents:
-            documents = [strip_junk(doc) for doc in documents]
-            self.documents = get_unique(data)
+            pass
         # If text documents are not passed and no datafile is passed, defaults to subreddit.
         else:
             if self.data_folder:
                 comments = utils.get_data_path(self.data_folder)
             else:
                 comments = utils.get_data_path('comments')
-            self.data_path = Path(comments, f'{name}_comments.json')
+            self.data_path = storage.resolve_path(Path(comments, f'{name}_comments.json'))
 
         # Checks if model_path exists. If it is given, then it checks if the path exists and
         # creates the directory if it does not.
@@ -413,12 +743,130 @@ class PreProcess:
             utils.check_folder(model_path)
             self.model_path = model_path
 
-        if Path(self.model_path,f'{self.name}_documents.json').is_file():
-            self.documents = utils.load_json(Path(self.model_path,
-                                       f'{self.name}_documents.json'))
-        if Path(self.model_path,f'{self.name}_tokenized_docs.json').is_file():
-            self.tokenized_docs = utils.load_json(Path(self.model_path,
-                                       f'{self.name}_tokenized_docs.json'))
+        if use_cache:
+            self.cache = stage_cache.StageCache(Path(self.model_path, 'cache'), self.name)
+        else:
+            self.cache = None
+
+    def _stage_keys(self) -> dict[str, str]:
+        """
+        Creates the cache keys of every stage from a hash of the source data and the parameters
+        of each stage.
+        """
+        if self.input_documents:
+            source_key = stage_cache.hash_data(self.input_documents)
+        else:
+            source_key = stage_cache.hash_file(self.data_path)
+        params = {'documents': {'datafile': self.is_datafile,
+                                'near_duplicate_threshold': self.near_duplicate_threshold},
+                  'phrases': {'ngram_vocab_args': self.ngram_vocab_args},
+                  'id2word': {'no_above': self.no_above,
+                              'no_below': self.no_below,
+                              'keep_n': self.keep_n}}
+        # Phrases applied from a given model depend on that model instead of only the arguments.
+        if self.phrase_model is not None:
+            params['phrases']['phrase_model'] = self.phrase_model.key
+        return stage_cache.stage_keys(source_key, params)
+
+    def _get_keys(self) -> dict[str, str]:
+        """
+        Returns the keys of every stage, computing them the first time they are needed.
+        """
+        if not hasattr(self, 'keys'):
+            self.keys = self._stage_keys()
+        return self.keys
+
+    def _get_phrase_model(self) -> PhraseModel:
+        """
+        Returns the phrase model passed to PreProcess, the model saved in model_path if it was
+        trained with the current lemmas and arguments, or a newly trained and saved model.
+        """
+        if self.phrase_model is not None:
+            return self.phrase_model
+        key = self._get_keys()['phrases']
+        phrase_model = PhraseModel.load(self.model_path, self.name, key)
+        if phrase_model is None:
+            phrase_model = PhraseModel.train([self.get_stage('lemmas')],
+                                             get_phrase_args(self.ngram_vocab_args),
+                                             key)
+            phrase_model.save(self.model_path, self.name)
+        return phrase_model
+
+    def _build_documents(self) -> list[str]:
+        """
+        Creates the list of unique documents from the passed documents, the datafile, or the
+        subreddit comment data.
+        """
+        # Documents passed directly or read from a datafile are lists of text strings.
+        if self.input_documents or self.is_datafile:
+            if self.input_documents:
+                documents = self.input_documents
+            else:
+                documents = utils.load_json(Path(self.data_path))
+            documents = [strip_junk(doc) for doc in documents]
+        # Defaults to Reddit data extraction and filtering loading the .json from data_path.
+        else:
+            data = utils.load_json(Path(self.data_path), columns=DOC_COLUMNS)
+            documents = get_docs(data)
+        return get_unique(documents, near_duplicate_threshold=self.near_duplicate_threshold)
+
+    def _build_stage(self, stage:str) -> Any:
+        """
+        Computes a stage of the pipeline from the stage before it.
+        """
+        if stage == 'documents':
+            return self._build_documents()
+        if stage == 'tokens':
+            return tokenize_docs(self.get_stage('documents'),
+                                 workers=self.workers,
+                                 chunksize=self.chunksize)
+        if stage == 'lemmas':
+            return get_lemma(self.get_stage('tokens'),
+                             workers=self.workers,
+                             chunksize=self.chunksize,
+                             batch_size=self.pos_batch_size)
+        if stage == 'phrases':
+            return get_phrases(self.get_stage('lemmas'),
+                               phrase_model=self._get_phrase_model(),
+                               workers=self.workers,
+                               chunksize=self.chunksize)
+        if stage == 'id2word':
+            return get_id2word(self.get_stage('phrases'),
+                               no_above = self.no_above,
+                               no_below = self.no_below,
+                               keep_n=self.keep_n)
+        if stage == 'corpus':
+            return create_corpus(self.get_stage('id2word'), self.get_stage('phrases'))
+        raise ValueError(f'Unknown stage: {stage}. Use one of {stage_cache.STAGES}')
+
+    def get_stage(self, stage:str) -> Any:
+        """
+        Returns the result of a stage of the pipeline. The result is loaded from the cache if an
+        entry exists for the current data and parameters. Otherwise it is computed from the stage
+        before it and saved to the cache.
+
+        Parameters
+        ----------
+        stage: str
+            One of 'documents', 'tokens', 'lemmas', 'phrases', 'id2word', or 'corpus'.
+
+        Returns
+        -------
+            Result of the stage.
+        """
+        if stage in self.stages:
+            return self.stages[stage]
+        if self.cache is None:
+            self.stages[stage] = self._build_stage(stage)
+            return self.stages[stage]
+
+        key = self._get_keys()[stage]
+        if self.cache.has(stage, key):
+            self.stages[stage] = self.cache.load(stage, key)
+        else:
+            self.stages[stage] = self._build_stage(stage)
+            self.cache.save(stage, key, self.stages[stage])
+        return self.stages[stage]
 
     def __call__(self):
         """
@@ -426,36 +874,215 @@ class PreProcess:
         -------
             documents, tokenized documents, id2word, and corpus objects.
         """
-        # If data is not already present in self.documents, then it defaults to Reddit data
-        # extraction and filtering loading the .json from data_path.
-        if self.documents is None:
-            data = utils.load_json(Path(self.data_path))
-            documents = get_docs(data)
-            documents = [doc for doc in documents]
-            self.documents = get_unique(documents)
+        # Retrieves each stage from the cache or computes it. On a warm run only the documents,
+        # phrases, id2word, and corpus entries are loaded and the other stages are skipped.
+        self.documents = self.get_stage('documents')
+        self.tokenized_docs = self.get_stage('phrases')
+        id2word = self.get_stage('id2word')
+        corpus = self.get_stage('corpus')
 
         # Dumps the documents data to a file for retrieval and use later to preserve order of
-        # documents, which is essential for reproducibility of results and analysis.
+        # documents, which is essential for reproducibility of results and analysis. Also saves
+        # the tokenized documents.
         utils.dump_json(self.documents, self.model_path,f'{self.name}_documents')
+        utils.dump_json(self.tokenized_docs,self.model_path,f'{self.name}_tokenized_docs',
+                        fmt='tokens')
+
+        return self.documents, self.tokenized_docs, id2word, corpus
+
+def iter_blocks(items:Iterable[Any], block_size:int) -> Iterator[list[Any]]:
+    """
+    Groups a stream of items into lists of at most block_size items.
+    """
+    block = []
+    for item in items:
+        block.append(item)
+        if len(block) == block_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+class StreamPreProcess:
+    """
+    Streaming version of PreProcess. Documents are read from disk one at a time and every stage of
+    the pipeline is written back to disk, so only a block of documents is ever held in memory and
+    peak memory stays flat as the corpus grows. The stages are run in passes:
+
+    1. Posts are read one at a time from the JSON file, cleaned, deduplicated, and written to
+       {name}_documents.jsonl.
+    2. Documents are tokenized and lemmatized in blocks and written to {name}_lemmas.jsonl.
+    3. Bigram and trigram phrase models are trained on the stream of lemmas.
+    4. Phrases are applied and the tokenized documents written to {name}_tokenized_docs.jsonl.
+    5. id2word is built from the stream of tokenized documents.
+    6. The bag of words corpus is written to the Matrix Market file {name}_corpus.mm.
+
+    Parameters
+    ----------
+    name: str
+        Name of subreddit or collection of documents.
+
+    datafile_path: str, Path (Optional, default None)
+        Path of a JSON file containing a list of text documents. If not given, the subreddit
+        comment data is used.
+
+    data_folder: str, Path (Optional, default None)
+        Path for the subreddit comment data. Defaults to data/comments.
+
+    model_path: str, Path (Optional, default data/models/name)
+        Path for the output files to be written to.
 
-        # Once document data is retrieved, then the tokenized documents, id2word, and corpus
-        # are generated from the data.
-        if self.tokenized_docs is None:
-            tokenized_docs = tokenize_docs(self.documents)
-            # Lemmatizes Tokens.
-            tokenized_docs = get_lemma(tokenized_docs)
-            # Creates bigrams and trigrams.
-            self.tokenized_docs = get_phrases(tokenized_docs)
-        # Saves the tokenized documents so that tokenization and ngram creation does not need
-        # to be redone each time.
-        utils.dump_json(tokenized_docs,self.model_path,f'{self.name}_tokenized_docs')
-        # Creating id2word and corpus from tokenized documents is trivial and takes almost no
-        # time and thus is not saved to a file. They are also static in relation to tokenized
-        # documents.
+    no_above: float (Optional, default 1.0)
+        Keep tokens (words) that are contained in no more than no_above documents, which is the
+        fraction of total corpus size.
+
+    no_below: int (Optional, default 10)
+        Keep tokens (words) that are contained in at least no_below documents.
+
+    keep_n: int (Optional, default 100000)
+        Keep only the first keep_n most frequent tokens.
+
+    workers: int (Optional, default 1)
+        Number of worker processes used for tokenization and lemmatization. If None, workers will
+        be set to number of real cores - 1.
+
+    chunksize: int (Optional, default 1000)
+        Number of documents sent to a worker process at a time.
+
+    pos_batch_size: int (Optional, default None)
+        If given, documents are POS tagged in batches of this many documents.
+
+    ngram_vocab_args: dict (Optional, default None)
+        Pass custom arguments to gensim phrases. See get_phrases.
+
+    near_duplicate_threshold: float (Optional, default None)
+        If given, documents that are near duplicates of an earlier document (estimated Jaccard
+        similarity at or above the threshold) are removed as well as exact duplicates.
+
+    block_size: int (Optional, default 10000)
+        Number of documents tokenized and lemmatized at a time.
+
+
+    Returns, when called:
+    ----------
+    documents: JsonlCorpus
+    tokenized_docs: JsonlCorpus
+    id2word: gensim.corpora.dictionary.Dictionary
+    corpus: gensim.corpora.mmcorpus.MmCorpus
+    """
+    def __init__(self, name:str,
+                 datafile_path:Optional[Union[Path,str]]=None,
+                 data_folder:Optional[Union[Path,str]]=None,
+                 model_path:Optional[Union[Path,str]]=None,
+                 no_above:Optional[float] = 1.0,
+                 no_below:Optional[int] = 10,
+                 keep_n: Optional[int] = 100000,
+                 workers: Optional[int] = 1,
+                 chunksize: Optional[int] = 1000,
+                 pos_batch_size: Optional[int] = None,
+                 ngram_vocab_args: Optional[dict] = None,
+                 near_duplicate_threshold: Optional[float] = None,
+                 block_size: Optional[int] = 10000):
+
+        # Initialize parameters.
+        self.name = name
+        self.no_above = no_above
+        self.no_below = no_below
+        self.keep_n = keep_n
+        self.workers = workers
+        self.chunksize = chunksize
+        self.pos_batch_size = pos_batch_size
+        self.ngram_vocab_args = ngram_vocab_args
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.block_size = block_size
+
+        # Datafiles contain lists of text documents, otherwise defaults to subreddit data.
+        if datafile_path:
+            self.data_path = Path(datafile_path)
+            self.is_datafile = True
+        else:
+            if data_folder:
+                comments = utils.get_data_path(data_folder)
+            else:
+                comments = utils.get_data_path('comments')
+            self.data_path = storage.resolve_path(Path(comments, f'{name}_comments.json'))
+            self.is_datafile = False
+
+        # Uses default model directory if model_path is not given.
+        if not model_path:
+            model_path = Path(f'{Path.cwd()}/data/models/{name}')
+        utils.check_folder(model_path)
+        self.model_path = Path(model_path)
+
+    def _file(self, stage:str, suffix:str='jsonl') -> Path:
+        """
+        Returns the path of the output file of a stage.
+        """
+        return Path(self.model_path, f'{self.name}_{stage}.{suffix}')
+
+    def iter_documents(self) -> Iterator[str]:
+        """
+        Reads the documents from disk one at a time, cleans them, and skips duplicates. Only a
+        digest (and MinHash signature) of each document is kept in memory to find the duplicates,
+        and the order of the documents is preserved.
+        """
+        deduplicator = get_deduplicator(self.near_duplicate_threshold)
+        columns = None if self.is_datafile else DOC_COLUMNS
+        for item in utils.iter_records(self.data_path, columns=columns):
+            if self.is_datafile:
+                doc = strip_junk(item)
+            else:
+                doc = get_doc(item)
+            if not deduplicator.is_duplicate(doc):
+                yield doc
+
+    def iter_lemmas(self, documents:Iterable[str]) -> Iterator[list[str]]:
+        """
+        Tokenizes and lemmatizes a stream of documents one block at a time.
+        """
+        for block in iter_blocks(documents, self.block_size):
+            tokens = tokenize_docs(block, workers=self.workers, chunksize=self.chunksize)
+            yield from get_lemma(tokens,
+                                 workers=self.workers,
+                                 chunksize=self.chunksize,
+                                 batch_size=self.pos_batch_size)
+
+    def __call__(self):
+        """
+        Returns
+        -------
+            documents, tokenized documents, id2word, and corpus objects. The documents and
+            tokenized documents are streamed from JSON lines files and the corpus from a Matrix
+            Market file.
+        """
+        # Pass 1: Cleaned and deduplicated documents.
+        write_jsonl(self.iter_documents(), self._file('documents'))
+        documents = JsonlCorpus(self._file('documents'))
+
+        # Pass 2: Tokenized and lemmatized documents.
+        write_jsonl(self.iter_lemmas(documents), self._file('lemmas'))
+        lemmas = JsonlCorpus(self._file('lemmas'))
+
+        # Pass 3: Phrase models. The trigram model is trained on the bigram stream.
+        ngram_vocab_args = get_phrase_args(self.ngram_vocab_args)
+        bigram_mod = Phraser(Phrases(lemmas, **ngram_vocab_args))
+        trigram_mod = Phraser(Phrases(PhraseStream(lemmas, bigram_mod), **ngram_vocab_args))
+
+        # Pass 4: Tokenized documents with phrases applied.
+        write_jsonl(PhraseStream(lemmas, bigram_mod, trigram_mod), self._file('tokenized_docs'))
+        tokenized_docs = JsonlCorpus(self._file('tokenized_docs'))
+        # Removes the intermediate lemmas as they are no longer needed.
+        self._file('lemmas').unlink()
+
+        # Pass 5: Mapping of word IDs to words.
         id2word = get_id2word(tokenized_docs,
-                            no_above = self.no_above,
-                            no_below = self.no_below,
-                            keep_n=self.keep_n)
-        corpus = create_corpus(id2word, tokenized_docs)
+                              no_above = self.no_above,
+                              no_below = self.no_below,
+                              keep_n=self.keep_n)
+
+        # Pass 6: Bag of words corpus written to disk.
+        corpus_file = str(self._file('corpus', 'mm'))
+        MmCorpus.serialize(corpus_file, (id2word.doc2bow(doc) for doc in tokenized_docs))
+        corpus = MmCorpus(corpus_file)
 
-        return self.documents, tokenized_docs, id2word, corpus
+        return documents, tokenized_docs, id2word, corpus
@@ -6,15 +6,97 @@ and then saves the file.
 """
 
 import json
+import os
 import re
-from typing import Union, Dict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Union, Dict
 from pathlib import Path
 from tqdm import tqdm
 import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 from rdsmproj.sm_reddit.zreader import Zreader as zreader
 from rdsmproj import utils
 
 
+# Byte patterns checked before a line is decoded. Only lines of public, English subreddits are
+# decoded, and the full check is repeated on the decoded object.
+_PUBLIC = re.compile(rb'"subreddit_type"\s*:\s*"public"')
+_ENGLISH = re.compile(rb'"lang"\s*:\s*"en"')
+
+# Number of lines sent to a worker process at a time.
+BATCH_SIZE = 5000
+
+# Columns of the primary subreddit list in the order of create_dataframe.
+COLUMNS = ['title', 'description', 'subscribers', 'created_utc', 'public_description', 'name']
+
+
+def is_candidate(line:bytes) -> bool:
+    """
+    Checks the raw bytes of a line for a public, English subreddit without decoding it.
+    """
+    return _PUBLIC.search(line) is not None and _ENGLISH.search(line) is not None
+
+def parse_lines(lines:list[bytes], encoding:str='ISO-8859-1') -> list[tuple[str, list]]:
+    """
+    Decodes the lines of a batch and keeps the attributes of public, English subreddits. Runs
+    inside of the worker processes used by ConvertSubreddit.
+
+    :param lines: Lines of the subreddit file as bytes.
+    :param encoding: Encoding each line is decoded with.
+
+    :return: List of (display_name, [title, description, subscribers, created_utc,
+        public_description]).
+    """
+    results = []
+    for line in lines:
+        # Decodes and loads the json line.
+        obj = json.loads(line.decode(encoding))
+        # Checks for public subreddit and English language.
+        if (obj['subreddit_type'] == 'public') and (obj['lang']== 'en'):
+            results.append((obj['display_name'], [obj['title'],
+                                                  obj['description'],
+                                                  obj['subscribers'],
+                                                  obj['created_utc'],
+                                                  obj['public_description']]))
+    return results
+
+def preprocess_entry(name:str, values:list) -> Optional[tuple[str, Dict]]:
+    """
+    Preprocesses the attributes of a subreddit for use in spaCy Python scripts.
+
+    :param name: Display name of the subreddit.
+    :param values: [title, description, subscribers, created_utc, public_description]
+
+    :return: Tuple of (description text, {'name': name, 'title': title, 'subscribers':
+        subscribers, 'created_utc': created_utc}), or None if the subreddit has no text.
+    """
+    # Concatenates the title, description, and public description into one text string.
+    description = [values[0], values[1], values[4]]
+    description = [text for text in description if text]
+    description = '. '.join(description)
+    if not description:
+        return None
+    # Issues with encoding/decoding. Partial fix.
+    try:
+        description = description.encode('ISO-8859-1').decode('latin1').encode('utf-8').decode('utf-8')
+    except UnicodeEncodeError:
+        # Text decoded as utf-8 does not need the fix.
+        pass
+    # Removing brackets [], parentheses (), and slashes /.
+    description = re.sub("[(\[\])/]", ' ', description)
+    # Brute force fix for apostrophe's that snuck through as â\x80\x99 instead.
+    description = re.sub(r'â\x80\x99', "'", description)
+    return (description, {'name': name,
+                          'title': values[0],
+                          'subscribers': values[2],
+                          'created_utc': values[3]})
+
 def create_dataframe(subreddit_dict:Dict) -> pd.DataFrame:
     """
     Takes the subreddit dictionary and converts it into a pandas DataFrame.
@@ -36,15 +118,38 @@ class ConvertSubreddit:
     and save it as either a parquet or csv.
 
     :param path: Path for storing the file of subreddit data.
+    :param workers: Number of worker processes decoding the JSON lines. 1 decodes them in the
+        current process.
+    :param encoding: Encoding the lines are decoded with. ISO-8859-1 keeps the output of earlier
+        versions.
+    :param chunked: If True, the subreddits are written as they are read: the projected columns
+        to primary_subreddit_list.parquet one row group at a time and the preprocessed data to
+        preprocessed_subreddit_list.json in the same pass, so memory use does not grow with the
+        number of subreddits. Requires pyarrow. Unlike the default mode, a subreddit that appears
+        more than once in the dump is kept more than once.
+    :param chunk_size: Number of subreddits in each Parquet row group in the chunked mode.
     """
 
-    def __init__(self, path:Union[str, Path, None] = None):
+    def __init__(self, path:Union[str, Path, None] = None,
+                 workers:int = 1,
+                 encoding:str = 'ISO-8859-1',
+                 chunked:bool = False,
+                 chunk_size:int = 50000):
         # If no path is given, uses default data path.
         if path is None:
             path = utils.find_data_path()
         self.path = path
+        self.workers = workers
+        self.encoding = encoding
         # Checks if folder for data path exists, creates if it does not.
         utils.check_folder(self.path)
+
+        if chunked:
+            self.chunk_size = chunk_size
+            self.df = None
+            self._write_chunked()
+            return
+
         # Creates pandas DataFrame from reading in data file.
         self._read_data()
 
@@ -70,29 +175,20 @@ class ConvertSubreddit:
         :return: Dictionary of result including title, description, subscribers, and created_utc.
         """
         print('Reading in Reddit subreddit data...')
-        # Reads compressed NDJSON .zst file using zreader.
-        reader = zreader(Path(self.path,'reddit_subreddits.ndjson.zst'))
-        # Finds total length of file.
-        total = sum(1 for line in reader.readlines())
+        # Reads compressed NDJSON .zst file using zreader in a single pass.
+        reader = zreader(Path(self.path,'reddit_subreddits.ndjson.zst'), encoding=self.encoding)
         # Initializes dictionary.
         self.subreddit_dict = {}
-        # Re-initializes the generator.
-        reader = zreader(Path(self.path,'reddit_subreddits.ndjson.zst'))
-
-        # Read each line from the reader.
-        for line in tqdm(iterable = reader.readlines(), total = total, desc='Reading in data.'):
-            # Loads the json line.
-            obj = json.loads(line)
-            # Checks for public subreddit and English language.
-            # Possibly open up to check other languages and translate to English?
-            if (obj['subreddit_type'] == 'public') and (obj['lang']== 'en'):
-                # Creates dictionary entries for title, description, subscribers and creation time.
-                # These were the attributes chosen by Eric. Are these sufficient?
-                self.subreddit_dict[obj['display_name']] = [obj['title'],
-                                                    obj['description'],
-                                                    obj['subscribers'],
-                                                    obj['created_utc'],
-                                                    obj['public_description']]
+
+        # Progress is measured in compressed bytes read, so the file is not read twice to count
+        # the lines.
+        with tqdm(total=reader.size, unit='B', unit_scale=True,
+                  desc='Reading in data.') as progress:
+            for batch in self._parse_batches(reader, progress):
+                # Creates dictionary entries for title, description, subscribers and creation
+                # time. These were the attributes chosen by Eric. Are these sufficient?
+                # Possibly open up to check other languages and translate to English?
+                self.subreddit_dict.update(batch)
 
         # Other possible attributes available from the file are as follows:
 
@@ -121,6 +217,94 @@ class ConvertSubreddit:
         # 'user_sr_flair_enabled', 'user_sr_theme_enabled', 'videostream_links_count',
         # 'whitelist_status', 'wiki_enabled', 'wls']
 
+    def _write_chunked(self) -> None:
+        """
+        Reads the subreddit file in a single pass and writes both outputs as the subreddits
+        stream in. Only the columns of the primary subreddit list are kept, and at most
+        chunk_size subreddits are held in memory before they are written as a Parquet row group.
+        The JSON array of preprocessed data is written one entry at a time. Both files are written
+        to temporary names and renamed once complete.
+        """
+        if pq is None:
+            raise ImportError('pyarrow is required for the chunked mode of ConvertSubreddit.')
+        print('Reading in Reddit subreddit data...')
+        reader = zreader(Path(self.path,'reddit_subreddits.ndjson.zst'), encoding=self.encoding)
+        schema = pa.schema([('title', pa.string()),
+                            ('description', pa.string()),
+                            ('subscribers', pa.int64()),
+                            ('created_utc', pa.float64()),
+                            ('public_description', pa.string()),
+                            ('name', pa.string())])
+        parquet_file = Path(self.path, 'primary_subreddit_list.parquet')
+        json_file = Path(self.path, 'preprocessed_subreddit_list.json')
+        parquet_temp = Path(f'{parquet_file}.temp')
+        json_temp = Path(f'{json_file}.temp')
+
+        # Columns of the row group being collected.
+        rows = {column: [] for column in COLUMNS}
+        count = 0
+        with pq.ParquetWriter(parquet_temp, schema) as writer, \
+             open(json_temp, mode='w', encoding='utf-8') as json_out, \
+             tqdm(total=reader.size, unit='B', unit_scale=True,
+                  desc='Reading in data.') as progress:
+            json_out.write('[')
+            for batch in self._parse_batches(reader, progress):
+                for name, values in batch:
+                    for column, value in zip(COLUMNS, values + [name]):
+                        rows[column].append(value)
+                    entry = preprocess_entry(name, values)
+                    if entry:
+                        json_out.write(', ' if count else '')
+                        json_out.write(json.dumps(entry))
+                        count += 1
+                if len(rows['name']) >= self.chunk_size:
+                    writer.write_table(pa.table(rows, schema=schema))
+                    rows = {column: [] for column in COLUMNS}
+            if rows['name']:
+                writer.write_table(pa.table(rows, schema=schema))
+            json_out.write(']')
+        os.replace(parquet_temp, parquet_file)
+        os.replace(json_temp, json_file)
+        print(f'Wrote {count} preprocessed subreddits.')
+
+    def _iter_batches(self, reader:zreader, progress:tqdm) -> Iterator[list[bytes]]:
+        """
+        Groups the lines of public, English subreddits into batches of BATCH_SIZE lines. Other
+        lines are skipped without being decoded.
+        """
+        batch = []
+        for line in reader.iter_lines():
+            if is_candidate(line):
+                batch.append(line)
+                if len(batch) == BATCH_SIZE:
+                    progress.update(reader.bytes_read - progress.n)
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+        progress.update(reader.size - progress.n)
+
+    def _parse_batches(self, reader:zreader, progress:tqdm) -> Iterator[list[tuple[str, list]]]:
+        """
+        Parses the batches of lines, in a pool of worker processes if more than one worker is
+        used. Only a few batches per worker are in flight at a time and the batches are returned
+        in the order of the file.
+        """
+        batches = self._iter_batches(reader, progress)
+        if self.workers <= 1:
+            for batch in batches:
+                yield parse_lines(batch, self.encoding)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(parse_lines, batch, self.encoding))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
     def _preprocess_data(self) -> None:
         """
         Preprocesses reddit data for use in spaCy Python scripts.
@@ -142,21 +326,9 @@ class ConvertSubreddit:
         # Preprocesses dictionary of subreddits and converts to correct data format.
         for key, values in tqdm(iterable=self.subreddit_dict.items(),
                                 total=total, desc='Preprocessing data'):
-            # Concatenates the title, description, and public description into one text string.
-            description = [values[0], values[1], values[4]]
-            description = [text for text in description if text]
-            description = '. '.join(description)
-            if description:
-                # Issues with encoding/decoding. Partial fix.
-                description = description.encode('ISO-8859-1').decode('latin1').encode('utf-8').decode('utf-8')
-                # Removing brackets [], parentheses (), and slashes /.
-                description = re.sub("[(\[\])/]", ' ', description)
-                # Brute force fix for apostrophe's that snuck through as â\x80\x99 instead.
-                description = re.sub(r'â\x80\x99', "'", description)
-                data.append((description, {'name': key,
-                                           'title': values[0],
-                                           'subscribers': values[2],
-                                           'created_utc': values[3]}))
+            entry = preprocess_entry(key, values)
+            if entry:
+                data.append(entry)
 
         # Writes the processed data to a JSON file.
         utils.dump_json(data,self.path,'preprocessed_subreddit_list')
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Comment fetchers and concurrent comment retrieval for GetRedditComments.
+
+A fetcher has two methods, comment_ids(post_id) and comments(ids), which match the two calls made
+for each post. PushshiftFetcher uses pmaw and HttpFetcher calls a Pushshift compatible HTTP API
+directly, so comment retrieval can be run against a local server that returns canned data.
+"""
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Dict
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket rate limiter. Tokens are added at a constant rate up to capacity and
+    every request takes one token, waiting until one is available.
+
+    Parameters
+    ----------
+    rate: float
+        Number of requests allowed per second on average.
+    capacity: int (Optional, default 1)
+        Largest burst of requests allowed at once.
+    """
+    def __init__(self, rate:float, capacity:int=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Takes one token, waiting until one is available.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class PushshiftFetcher:
+    """
+    Fetches comment ids and comments with pmaw.
+
+    Parameters
+    ----------
+    api: pmaw.PushshiftAPI (Optional, default None)
+        PushshiftAPI instance. A new one that ignores shards_down messages is created if None.
+    pmaw_args: dict (Optional, default None)
+        Pass arguments to pmaw api.search_submission_comment_ids.
+    rate_limit: float (Optional, default None)
+        Largest average number of requests per second pmaw makes when a new PushshiftAPI instance
+        is created. Uses the pmaw default if None.
+    """
+    def __init__(self, api=None, pmaw_args:Optional[Dict]=None, rate_limit:Optional[float]=None):
+        if api is None:
+            # Imported here so other fetchers can be used without pmaw installed.
+            from pmaw import PushshiftAPI
+            api_args = {'shards_down_behavior': None}
+            if rate_limit is not None:
+                # pmaw limits the requests of each instance per minute.
+                api_args.update(rate_limit=max(int(rate_limit * 60), 1), limit_type='average')
+            api = PushshiftAPI(**api_args)
+        self.api = api
+        self.pmaw_args = pmaw_args or {}
+
+    def comment_ids(self, post_id:str) -> list[str]:
+        """
+        Returns the ids of the comments of a post.
+        """
+        return list(self.api.search_submission_comment_ids(ids=post_id, **self.pmaw_args))
+
+    def comments(self, ids:list[str]) -> list[Dict]:
+        """
+        Returns the comments with the given ids.
+        """
+        return list(self.api.search_comments(ids=ids))
+
+class HttpFetcher:
+    """
+    Fetches comment ids and comments from a Pushshift compatible HTTP API with the standard
+    library. Errors are raised as UserWarning like pmaw.
+
+    Parameters
+    ----------
+    base_url: str
+        URL of the API (e.g. 'https://api.pushshift.io' or 'http://localhost:8000').
+    timeout: float (Optional, default 30)
+        Timeout in seconds of each request.
+    """
+    def __init__(self, base_url:str, timeout:float=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _get(self, endpoint:str, params:Optional[Dict]=None) -> list:
+        """
+        Requests an endpoint and returns the 'data' list of the JSON response.
+        """
+        url = f'{self.base_url}/{endpoint}'
+        if params:
+            url = f'{url}?{urllib.parse.urlencode(params)}'
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                return json.load(response)['data']
+        except (OSError, ValueError, KeyError) as error:
+            raise UserWarning(f'Request to {url} failed: {error}') from error
+
+    def comment_ids(self, post_id:str) -> list[str]:
+        """
+        Returns the ids of the comments of a post.
+        """
+        return self._get(f'reddit/submission/comment_ids/{post_id}')
+
+    def comments(self, ids:list[str]) -> list[Dict]:
+        """
+        Returns the comments with the given ids.
+        """
+        return self._get('reddit/search/comment', {'ids': ','.join(ids)})
+
+class ConcurrentCommentFetcher:
+    """
+    Retrieves the comments of many posts at once with a bounded pool of threads. The comment ids
+    of each post are looked up concurrently, then the ids of all of the posts are merged into
+    requests of up to ids_per_request ids each, so far fewer comment requests are made than one
+    per post. Every request made by the pool goes through the same rate limiter.
+
+    Parameters
+    ----------
+    fetcher: PushshiftFetcher, HttpFetcher
+        Fetcher used for the requests.
+    concurrency: int (Optional, default 4)
+        Largest number of requests in flight at once.
+    rate_limit: float (Optional, default None)
+        Largest average number of requests per second. No limit if None.
+    ids_per_request: int (Optional, default 500)
+        Largest number of comment ids in each comment request.
+    limiter: TokenBucket (Optional, default None)
+        Rate limiter shared with other fetchers (e.g. across subreddits). Used instead of
+        rate_limit if given.
+    """
+    def __init__(self, fetcher,
+                 concurrency:int=4,
+                 rate_limit:Optional[float]=None,
+                 ids_per_request:int=500,
+                 limiter:Optional[TokenBucket]=None):
+        self.fetcher = fetcher
+        self.concurrency = concurrency
+        self.ids_per_request = ids_per_request
+        if limiter is None and rate_limit:
+            limiter = TokenBucket(rate_limit, capacity=concurrency)
+        self.limiter = limiter
+
+    def _call(self, function, *args):
+        """
+        Calls a fetcher method once the rate limiter allows it. Errors are returned instead of
+        raised so one failed request does not stop the others.
+        """
+        if self.limiter is not None:
+            self.limiter.acquire()
+        try:
+            return function(*args)
+        except UserWarning as error:
+            return error
+
+    def __call__(self, post_ids:Iterable[str]) -> Dict[str, Optional[list[Dict]]]:
+        """
+        Retrieves the comments of the posts.
+
+        Parameters
+        ----------
+        post_ids: Iterable[str]
+            Ids of the posts.
+
+        Returns
+        -------
+            Dictionary with the post ids as keys and the list of comments of each post as values,
+            in the order of its comment ids. The value is None if there was an error retrieving
+            the comments of the post.
+        """
+        post_ids = list(post_ids)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # Looks up the comment ids of every post.
+            id_lists = dict(zip(post_ids, executor.map(
+                lambda post_id: self._call(self.fetcher.comment_ids, post_id), post_ids)))
+
+            # Merges the comment ids of all of the posts into as few requests as possible.
+            all_ids = list(dict.fromkeys(comment_id for ids in id_lists.values()
+                                         if not isinstance(ids, UserWarning)
+                                         for comment_id in ids))
+            chunks = [all_ids[i:i + self.ids_per_request]
+                      for i in range(0, len(all_ids), self.ids_per_request)]
+            responses = executor.map(lambda chunk: self._call(self.fetcher.comments, chunk),
+                                     chunks)
+
+            comments = {}
+            failed = set()
+            for chunk, response in zip(chunks, responses):
+                if isinstance(response, UserWarning):
+                    failed.update(chunk)
+                else:
+                    comments.update((comment['id'], comment) for comment in response)
+
+        results = {}
+        for post_id, ids in id_lists.items():
+            if isinstance(ids, UserWarning) or failed.intersection(ids):
+                results[post_id] = None
+            else:
+                results[post_id] = [comments[comment_id] for comment_id in ids
+                                    if comment_id in comments]
+        return results
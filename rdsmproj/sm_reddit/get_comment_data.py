@@ -8,7 +8,10 @@ from pathlib import Path
 from typing import Union, Optional, Dict
 from pmaw import PushshiftAPI
 from tqdm import tqdm
-from rdsmproj import utils
+from rdsmproj import utils, metadata
+from rdsmproj.sm_reddit.journal import CheckpointJournal
+from rdsmproj.sm_reddit.fetcher import PushshiftFetcher, ConcurrentCommentFetcher, TokenBucket
+from rdsmproj.sm_reddit.scheduler import CommentScheduler
 
 
 # Sets the PushshiftAPI to ignore shards_down messages.
@@ -29,12 +32,40 @@ class GetRedditComments:
         Silences the PushshiftAPI logger.
     pmaw_args: dict (Optional, default None)
         Pass arguments to pmaw api.search_submission_comment_ids.
+    checkpoint_every: int (Optional, default 100)
+        Number of posts parsed between checkpoints of the journal used to resume interrupted
+        downloads.
+    fetcher: PushshiftFetcher, HttpFetcher (Optional, default None)
+        Fetcher used to retrieve comment ids and comments. Defaults to a PushshiftFetcher using
+        pmaw. Any object with comment_ids(post_id) and comments(ids) methods can be used, e.g. an
+        HttpFetcher pointed at a local server returning canned data.
+    concurrency: int (Optional, default 1)
+        Number of requests in flight at once. If greater than 1, the posts are retrieved
+        concurrently in batches of checkpoint_every posts and the comment ids of each batch are
+        merged into fewer comment requests.
+    rate_limit: float (Optional, default None)
+        Largest average number of requests per second in the concurrent mode. No limit if None.
+    ids_per_request: int (Optional, default 500)
+        Largest number of comment ids in each comment request in the concurrent mode.
+    limiter: TokenBucket (Optional, default None)
+        Rate limiter shared with other downloads. Used instead of rate_limit if given.
+    store: metadata.MetadataStore (Optional, default None)
+        Metadata store the number of comments is recorded in. Defaults to the subreddits.db
+        shared with the posts, in the folder that holds data_path (data/subreddits.db for the
+        default path).
     """
     def __init__(self, data:list[Dict] = None,
                  data_path:Union[str, Path] = None,
                  missing_list:Optional[list[Dict]] = None,
                  silence:bool=True,
-                 pmaw_args:Dict=None) -> None:
+                 pmaw_args:Dict=None,
+                 checkpoint_every:int=100,
+                 fetcher=None,
+                 concurrency:int=1,
+                 rate_limit:Optional[float]=None,
+                 ids_per_request:int=500,
+                 limiter:Optional[TokenBucket]=None,
+                 store:Optional[metadata.MetadataStore]=None) -> None:
 
         # Uses given path or default if none provided.
         if data_path:
@@ -45,6 +76,7 @@ class GetRedditComments:
         # Initializes data.
         self.data = data
         self.num_comments = 0
+        self.checkpoint_every = checkpoint_every
 
         # Sets name of subreddit.
         self.name = self.data[0]['subreddit']
@@ -62,23 +94,48 @@ class GetRedditComments:
         if missing_list is None:
             # Sets missing comment list to empty list.
             self.missing_list = []
-        
+        else:
+            self.missing_list = missing_list
+        # Replays the journal of an interrupted download.
+        self._replay_journal()
+
         # Passes optional arguments if pmaw_args is given.
         if pmaw_args:
             self.pmaw_args = pmaw_args
         else:
-            self.pmaw_args = None
+            self.pmaw_args = {}
+
+        # Uses pmaw to retrieve the comments if no other fetcher is given.
+        if fetcher is None:
+            fetcher = PushshiftFetcher(api, self.pmaw_args)
+        self.fetcher = fetcher
 
         # Gets the comment data. Updates the self.data with comments.
-        self._get_comments()
+        if concurrency > 1:
+            self._get_comments_concurrent(ConcurrentCommentFetcher(fetcher,
+                                                                   concurrency=concurrency,
+                                                                   rate_limit=rate_limit,
+                                                                   ids_per_request=ids_per_request,
+                                                                   limiter=limiter))
+        else:
+            self._get_comments()
 
-        # Saves the new data updated with the comment data to self.path.
-        utils.dump_json(self.data, path = self.path, filename=f'{self.name}_comments')
+        # Saves the new data updated with the comment data to self.path. The file is written to
+        # a temporary name and renamed, so the journal is only removed once the data is complete.
+        utils.dump_json(self.data, path = self.path, filename=f'{self.name}_comments', fmt='auto')
+        self._remove_tempfile()
+        # Writes the final number of comments retrieved.
+        utils.dump_json(self.num_comments, path=self.path, filename = f'{self.name}_count')
+        # Records the subreddit as complete in the metadata store shared with the posts
+        # (data/subreddits.db for the default path).
+        if store is None:
+            store = metadata.MetadataStore(metadata.store_path(self.path))
+        store.update(self.name, comments=self.num_comments, status=metadata.COMMENTS)
 
         # If there were errors, saves the list of posts with errors.
         if self.missing_list:
             print(f'Saving {len(self.missing_list)} post ids with errors for {self.name}')
-            utils.dump_json(self.missing_list,Path(data_path,'missing'),f"{self.name}_missing_list")
+            utils.dump_json(self.missing_list,Path(self.path,'missing'),f"{self.name}_missing_list")
 
     def _get_comments(self) -> None:
         """
@@ -97,63 +154,125 @@ class GetRedditComments:
         for submission in tqdm(iterable = self.data, total = total, desc=f'{self.name}'):
             # Checks if 'all_text' is a key for the submission.
             if 'parsed' not in submission:
+                # Number of comments retrieved and whether there was an error for this post.
+                num_comments = 0
+                missing = False
                 try:
                     # Tries to query PushShift for the comment list of a given post.
-                    comment_id_list = list(api.search_submission_comment_ids(ids=submission['id'],
-                                                                             **self.pmaw_args))
+                    comment_id_list = self.fetcher.comment_ids(submission['id'])
                     # If comment list exists, tries to retrieve comments.
                     if comment_id_list:
                         try:
                             # Retrieves comments from list of ids.
-                            comments = list(api.search_comments(ids=comment_id_list))
-                            # Retrieves body text from each comment.
-                            text = [comment['body'] for comment in comments]
-                            # Adds number of comments found to comment total.
-                            self.num_comments += len(text)
-                            # Concatenates the comment text list into one string.
-                            text = ' '.join(text)
-                            # Gets post title.
-                            title = submission['title']
-                            # Gets post text.
-                            if 'selftext' in submission:
-                                selftext = submission['selftext']
-                            else:
-                                selftext = ''
+                            comments = self.fetcher.comments(comment_id_list)
                             # Saves the title, post text, and comment text to 'all_text'
-                            submission['all_text'] = f"{title} {selftext} {text}"
+                            num_comments = self._add_comments(submission, comments)
                             # Updates count of posts with comment data retrieved.
                             count+=1
 
                         # If error in retrieving comments, append post id to missing list.
                         except UserWarning:
                             self.missing_list.append(submission['id'])
+                            missing = True
 
                 # If error in querying PushShift for the comment list,
                 # append post id to missing list.
                 except UserWarning:
                     self.missing_list.append(submission['id'])
+                    missing = True
 
                 posts += 1
                 submission['parsed'] = True
-                # Every 100 posts parsed it will write a temporary file to be used in case of
-                # interrupted downloads.
-                if posts % 100 == 0:
-                    utils.dump_json(self.data,
-                                    path = self.path,
-                                    filename = f'{self.name}_temp')
-                    utils.dump_json(self.num_comments,
-                                    path=self.path,
-                                    filename = f'{self.name}_count')
-
-        # Removes the temporary file if it exists.
-        self._remove_tempfile()
-        # Writes the final number of comments retrieved.
-        utils.dump_json(self.num_comments, path=self.path, filename = f'{self.name}_count')
+                # Records only this post in the journal.
+                self.journal.add(submission['id'],
+                                 all_text=submission.get('all_text'),
+                                 comments=num_comments,
+                                 missing=missing)
+                # Every checkpoint_every posts parsed the new journal entries are appended to
+                # disk to be used in case of interrupted downloads.
+                if posts % self.checkpoint_every == 0:
+                    self.journal.checkpoint()
+
+        # Writes the remaining journal entries.
+        self.journal.checkpoint()
+
+    def _get_comments_concurrent(self, fetcher:ConcurrentCommentFetcher) -> None:
+        """
+        Retrieves the comments of the posts in self.data that have not been parsed, one batch of
+        checkpoint_every posts at a time. The posts of a batch are retrieved concurrently and the
+        journal is checkpointed after each batch.
+        """
+        # Posts that have not been parsed yet.
+        remaining = [submission for submission in self.data if 'parsed' not in submission]
+        with tqdm(total=len(remaining), desc=f'{self.name}') as progress:
+            for i in range(0, len(remaining), self.checkpoint_every):
+                batch = remaining[i:i + self.checkpoint_every]
+                results = fetcher([submission['id'] for submission in batch])
+                for submission in batch:
+                    comments = results[submission['id']]
+                    num_comments = 0
+                    if comments is None:
+                        self.missing_list.append(submission['id'])
+                    elif comments:
+                        num_comments = self._add_comments(submission, comments)
+                    submission['parsed'] = True
+                    self.journal.add(submission['id'],
+                                     all_text=submission.get('all_text'),
+                                     comments=num_comments,
+                                     missing=comments is None)
+                self.journal.checkpoint()
+                progress.update(len(batch))
+
+    def _add_comments(self, submission:Dict, comments:list[Dict]) -> int:
+        """
+        Saves the title, post text, and comment text of a post to 'all_text'.
+
+        Returns
+        -------
+            Number of comments added.
+        """
+        # Retrieves body text from each comment.
+        text = [comment['body'] for comment in comments]
+        # Adds number of comments found to comment total.
+        self.num_comments += len(text)
+        # Concatenates the comment text list into one string.
+        text = ' '.join(text)
+        # Gets post title.
+        title = submission['title']
+        # Gets post text.
+        if 'selftext' in submission:
+            selftext = submission['selftext']
+        else:
+            selftext = ''
+        submission['all_text'] = f"{title} {selftext} {text}"
+        return len(comments)
+
+    def _replay_journal(self) -> None:
+        """
+        Replays the checkpoint journal of an interrupted download, restoring 'all_text' and the
+        parsed flag of the posts it records, along with the comment count and missing list.
+        """
+        self.journal = CheckpointJournal(Path(self.path, f'{self.name}_journal.jsonl'))
+        entries = {entry['id']: entry for entry in self.journal.replay()}
+        if not entries:
+            return
+        print(f'Resuming {self.name} from {len(entries)} journaled posts.')
+        for submission in self.data:
+            entry = entries.get(submission['id'])
+            if entry is None:
+                continue
+            if 'all_text' in entry:
+                submission['all_text'] = entry['all_text']
+            submission['parsed'] = True
+            self.num_comments += entry['comments']
+            if entry['missing']:
+                self.missing_list.append(entry['id'])
 
     def _check_tempfile(self) -> None:
         """
-        Checks if the temporary file exists. If it does, then it replaces self.data with the data
-        found in the temporary file.
+        Checks if a temporary file from an older version exists. If it does, then it replaces
+        self.data with the data found in the temporary file. Progress is now recorded in the
+        checkpoint journal instead.
         """
         # Sets the temporary file path to path/subreddit_temp.json.
         temporary_file = Path(self.path, f'{self.name}_temp.json')
@@ -163,70 +282,111 @@ class GetRedditComments:
             print(f'Using temporary file for {self.name}.')
             self.data = utils.load_json(temporary_file)
 
-        if comment_count.is_file():
-            self.num_comments = utils.load_json(comment_count)
+            if comment_count.is_file():
+                self.num_comments = utils.load_json(comment_count)
 
     def _remove_tempfile(self) -> None:
         """
-        Checks if the temporary file exists. If it does, then it removes the temporary file.
+        Removes the checkpoint journal and any temporary file from an older version.
         """
+        self.journal.remove()
         # Sets the temporary file path to path/subreddit_temp.json.
         temporary_file = Path(self.path, f'{self.name}_temp.json')
         # Checks if temporary file exists. Removes the file if it does.
         if temporary_file.is_file():
             temporary_file.unlink()
 
-def main():
+def download_subreddit(name:str,
+                       limiter:Optional[TokenBucket]=None,
+                       path:Optional[Union[str, Path]]=None,
+                       concurrency:int=4,
+                       store:Optional[metadata.MetadataStore]=None,
+                       rate_limit:Optional[float]=None) -> None:
+    """
+    Loads the post data of a subreddit and downloads its comments. Used by the scheduler in main.
+
+    Parameters
+    ----------
+    name: str
+        Name of the subreddit.
+    limiter: TokenBucket (Optional, default None)
+        Rate limiter shared by all of the subreddits being downloaded.
+    path: str, Path (Optional, default data/posts)
+        Path to the post data.
+    concurrency: int (Optional, default 4)
+        Number of requests in flight at once for this subreddit.
+    store: metadata.MetadataStore (Optional, default None)
+        Metadata store the result is recorded in. Defaults to the subreddits.db in the folder
+        that holds path (data/subreddits.db for the default path).
+    rate_limit: float (Optional, default None)
+        Largest average number of requests per second pmaw makes for this subreddit. Uses the
+        pmaw default if None.
     """
-    Auto-magically gets all the comment data for subreddits with > 10 posts and < 50000.
+    if path is None:
+        path = utils.get_data_path('posts')
+    if store is None:
+        store = metadata.get_store(path)
+    try:
+        # Loads the subreddit data.
+        data = utils.load_json(Path(path, f'{name}_posts.json'))
+        # Each subreddit uses its own PushshiftAPI instance as they are run in separate threads.
+        GetRedditComments(data,
+                          fetcher=PushshiftFetcher(rate_limit=rate_limit),
+                          concurrency=concurrency,
+                          limiter=limiter,
+                          store=store)
+    except Exception:
+        store.update(name, status=metadata.FAILED)
+        raise
+
+def main(max_subreddits:int=4,
+         rate_limit:float=10,
+         min_posts:int=100,
+         max_posts:Optional[int]=None):
     """
+    Auto-magically gets all the comment data for subreddits with at least min_posts posts.
+    Several subreddits are downloaded at once under one rate limit, largest first. The state of
+    each subreddit is recorded in data/comments/manifest.json, and subreddits that are done are
+    skipped unless new posts were retrieved for them since.
 
+    Parameters
+    ----------
+    max_subreddits: int (Optional, default 4)
+        Number of subreddits downloaded at once.
+    rate_limit: float (Optional, default 10)
+        Largest average number of requests per second across all of the subreddits.
+    min_posts: int (Optional, default 100)
+        Smallest number of posts of a subreddit to be downloaded.
+    max_posts: int (Optional, default None)
+        Largest number of posts of a subreddit to be downloaded. No limit if None.
+    """
     # Finds the data path for the posts data.
     path = utils.get_data_path('posts')
     # Finds the data path for the comments data to be written to.
     comment_path = utils.get_data_path('comments')
-    # Scans the files in the comments folder for completed subreddit json files.
-    comments_list = [file.name for file in Path(comment_path).rglob('*.json')]
-    # Replaces comments with posts in filename to make it easier to compare lists.
-    comments_list = [file.replace('comments', 'posts') for file in comments_list]
-
-    # Creates path for post data file.
-    post_data_path = Path(path, 'post_data.json')
-    # Loads post data file.
-    post_data = utils.load_json(post_data_path)
-    # Sorts the post data in reverse order by size.
-    post_data = {subreddit:posts for subreddit, posts in
-                 sorted(post_data.items(), key=lambda item: item[1])}
-    # Creates list of subreddits from post_data that are between 100 and 100000 posts.
-    subreddit_list = [f'{subreddit}_posts.json' for subreddit, posts in post_data.items()
-                      if (posts >= 100 and posts < 100000)]
-    # Prunes the subreddit list if the subreddit is already in the comments folder.
-    subreddit_list = [subreddit for subreddit in subreddit_list if subreddit not in comments_list]
-
-    # Total number of subreddits.
-    total = len(subreddit_list)
-    # Count of subreddits completed.
-    count = 1
-    print(subreddit_list)
-    # Iterates over all subreddits in the list.
-    for subreddit in subreddit_list:
-        print(subreddit)
-        if subreddit not in ['tinnitus_posts.json',
-                             'Snus_posts.json',
-                             'Fibromyalgia_posts.json',
-                             'optometry_posts.json',
-                             'ChronicPain_posts.json',
-                             'cancer_posts.json']:
-            # Loads the subreddit data.
-            data = utils.load_json(Path(path,subreddit))
-            # Gets name of subreddit.
-            name = data[0]['subreddit']
-            # Calls the class and retrieves the comment data. Writes the data to a json file.
-            GetRedditComments(data)
-            # Reinitializes data to None.
-            data = None
-            print(f'Subreddit {name}: {count} out of {total} completed.\n')
-            count += 1
+
+    # Records the subreddits with comment data on disk that the metadata store does not know
+    # about as done, then queries the store for the subreddits whose comments are not retrieved
+    # yet. Subreddits refreshed with new posts since their comments were recorded stay in the
+    # list. The number of posts is the estimated cost of each subreddit.
+    store = metadata.get_store(path, comment_path=comment_path)
+    store.import_comment_data(comment_path)
+    subreddit_list = store.names(min_posts=min_posts,
+                                 max_posts=max_posts,
+                                 exclude_status=metadata.COMMENTS)
+    costs = store.post_counts(subreddit_list)
+
+    # pmaw makes its own requests, so each subreddit's PushshiftAPI instance is limited to its
+    # share of the rate limit as well as the calls through the shared limiter.
+    subreddit_rate_limit = rate_limit / max_subreddits
+    scheduler = CommentScheduler(costs,
+                                 lambda name, limiter: download_subreddit(
+                                     name, limiter, path, store=store,
+                                     rate_limit=subreddit_rate_limit),
+                                 manifest_path=comment_path,
+                                 max_subreddits=max_subreddits,
+                                 rate_limit=rate_limit)
+    scheduler()
 
 if __name__ == '__main__':
     main()
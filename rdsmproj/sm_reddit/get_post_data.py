@@ -10,12 +10,34 @@ import datetime as dt
 import time
 from pmaw import PushshiftAPI
 import pandas as pd
-from rdsmproj import utils
+from rdsmproj import utils, storage, metadata
 
 
 # Sets the PushshiftAPI to ignore shards_down messages.
 api = PushshiftAPI(shards_down_behavior=None)
 
+def merge_posts(stored:list[Dict], new:list[Dict]) -> list[Dict]:
+    """
+    Merges newly retrieved posts into the stored posts of a subreddit, deduplicated by post id.
+    Stored posts keep their order and are replaced by a newer copy with the same id. New posts
+    are added after them.
+
+    Parameters
+    ----------
+    stored: list[Dict]
+        Posts already stored for the subreddit.
+
+    new: list[Dict]
+        Newly retrieved posts.
+
+    Returns
+    -------
+    List of merged posts.
+    """
+    merged = {post['id']: post for post in stored}
+    merged.update((post['id'], post) for post in new)
+    return list(merged.values())
+
 class GetPosts:
     """
     Class to retrieve post data in a subreddit.
@@ -32,10 +54,23 @@ class GetPosts:
     
     pmaw_args: dict (Optional, default None)
         Pass arguments to pmaw api.search_comments
+
+    incremental: bool (Optional, default False)
+        If True, only posts created from the second of the newest post already stored for the
+        subreddit (its created_utc high-water mark) on are retrieved and merged into the stored
+        posts, replacing stored posts with the same id. If False, all posts are retrieved and the
+        stored posts are overwritten.
+
+    store: metadata.MetadataStore (Optional, default None)
+        Metadata store the number of posts is recorded in. Defaults to the subreddits.db shared
+        with the comments, in the folder that holds path (data/subreddits.db for the default
+        path).
     """
 
     def __init__(self, name:str, path:Union[str,Path] = None,
-                 silence:bool=True, pmaw_args:Dict=None):
+                 silence:bool=True, pmaw_args:Dict=None,
+                 incremental:bool=False,
+                 store:Optional[metadata.MetadataStore]=None):
 
         # Sets name of subreddit.
         self.name = name
@@ -52,70 +87,128 @@ class GetPosts:
         else:
             self.path = path
 
+        # Uses the metadata store shared with the comments if none is given (data/subreddits.db
+        # for the default path).
+        if store is None:
+            store = metadata.get_store(self.path)
+        self.store = store
+
         # Sets the posts retrieved to 0 initially.
         self.post_num = 0
+        # Number of posts that were not already stored.
+        self.new_posts = 0
+        self.incremental = incremental
 
         # Passes optional arguments if pmaw_args is given.
         if pmaw_args:
             self.pmaw_args = pmaw_args
         else:
-            self.pmaw_args = None
+            self.pmaw_args = {}
 
         # Calls the api to search for submissions.
         self._get_post_data()
         # Writes posts retrieved data from subreddit.
         self._write_post_data()
 
+    def _get_high_water_mark(self, posts:Optional[list[Dict]]) -> Optional[int]:
+        """
+        Returns the created_utc of the newest stored post of the subreddit. It is read from
+        {name}_posts_state.json, or found from the stored posts if there is no state file.
+        """
+        state_file = Path(self.path, f'{self.name}_posts_state.json')
+        if state_file.is_file():
+            return utils.load_json(state_file)['created_utc']
+        if posts:
+            return max(int(post['created_utc']) for post in posts)
+        return None
+
+    def _load_posts(self) -> Optional[list[Dict]]:
+        """
+        Loads the stored posts of the subreddit if there are any.
+        """
+        post_file = storage.resolve_path(Path(self.path, f'{self.name}_posts.json'))
+        if post_file.is_file():
+            return utils.load_json(post_file)
+        return None
+
     def _get_post_data(self) -> None:
         """
         Calls the api to search for submissions for the subreddit.
         """
+        pmaw_args = dict(self.pmaw_args)
+        stored = None
+        if self.incremental:
+            stored = self._load_posts()
+            high_water_mark = self._get_high_water_mark(stored)
+            # Only retrieves posts from the second of the newest stored post on. Pushshift's
+            # 'after' is exclusive, so posts created in that same second but indexed after the
+            # last run would otherwise be skipped. Posts retrieved again are dropped by id.
+            if high_water_mark is not None:
+                pmaw_args['after'] = high_water_mark - 1
         try:
             # Tries to query PushShift for submission data of a given subreddit.
             posts = list(api.search_submissions(subreddit=self.name,
                                                 metadata=True,
-                                                **self.pmaw_args))
+                                                **pmaw_args))
+            self.new_posts = len(posts)
+            # Leaves the stored posts untouched if there are no new posts (only posts from the
+            # second of the high-water mark that are already stored).
+            if stored and not {post['id'] for post in posts} - {post['id'] for post in stored}:
+                self.post_num = len(stored)
+                print(f'No new posts for the subreddit: {self.name} ({self.post_num} total)')
+                # Pauses in between calls to the api.
+                time.sleep(1)
+                return
+            # Merges the new posts into the stored posts by post id.
+            if stored:
+                posts = merge_posts(stored, posts)
+                self.new_posts = len(posts) - len(stored)
             # Checks if any posts were retrieved.
             if posts:
                 # Sets the filename.
                 filename = f'{self.name}_posts'
-                # Dumps the retrieved data to a json file.
-                utils.dump_json(posts, self.path, filename)
+                # Dumps the retrieved data to a Parquet file (JSON if pyarrow is not installed).
+                utils.dump_json(posts, self.path, filename, fmt='auto')
+                # Records the high-water mark for the next incremental run.
+                utils.dump_json({'created_utc': max(int(post['created_utc']) for post in posts)},
+                                self.path, f'{self.name}_posts_state')
                 # Sets the number of posts retrieved.
                 self.post_num = len(posts)
-                print(f'Retrieved {self.post_num} posts from the subreddit: {self.name}')
+                print(f'Retrieved {self.new_posts} new posts from the subreddit: {self.name} '
+                      f'({self.post_num} total)')
             else:
                 print(f"No post data to be retrieved from subreddit: {self.name}")
 
         # Some subreddits give an IndexError when trying to retrieve data.
         except IndexError:
             print(f'IndexError for {self.name}!')
+            # Keeps the count of the posts already stored.
+            if stored:
+                self.post_num = len(stored)
 
         # Pauses in between calls to the api.
         time.sleep(1)
 
     def _write_post_data(self) -> None:
         """
-        Writes the post data for subreddits completed and number of posts retrieved.
+        Records the number of posts retrieved for the subreddit in the metadata store. Only the
+        row of this subreddit is written, so several harvesters can run at once.
         """
-        # Sets the path to the post data file.
-        post_file = Path(self.path, 'post_data.json')
+        fields = {'posts': self.post_num}
+        # Subreddits with new posts need their comments retrieved again.
+        if self.new_posts or self.store.get(self.name) is None:
+            fields['status'] = metadata.POSTS
+        self.store.update(self.name, **fields)
 
-        # Initializes post_temp dictionary.
-        post_temp = {}
-        # Checks if post data file exists.
-        if post_file.is_file():
-            # Loads the existing post data file.
-            post_temp = utils.load_json(post_file)
-
-        # Adds subreddit and number of posts retrieved to the dictionary.
-        post_temp[self.name] = self.post_num
-        # Writes the post data dictionary to a json file.
-        utils.dump_json(post_temp, self.path, 'post_data')
-
-def main():
+def main(incremental:bool=False):
     """
     Auto-magically gets the post data for subreddits that were matched to GARD data.
+
+    Parameters
+    ----------
+    incremental: bool (Optional, default False)
+        If True, every subreddit is refreshed with only the posts newer than its stored posts.
+        If False, only subreddits without stored posts are retrieved.
     """
     # Gets the data path.
     data_path = utils.find_data_path()
@@ -136,12 +229,13 @@ def main():
 
     # Finds the data path for the posts data.
     post_path = utils.get_data_path('posts')
-    # Scans the files in the comments folder for completed subreddit json files.
-    completed_list = [file.name for file in Path(post_path).rglob('*.json')]
-    # Gets only the subreddit name from completed json files.
-    completed_list = [subreddit.split('_posts.json')[0] for subreddit in completed_list]
-    # Prunes the completed subreddits from the subreddit list.
-    subreddit_list = [subreddit for subreddit in subreddit_list if subreddit not in completed_list]
+    # Queries the metadata store for the names of completed subreddits.
+    store = metadata.get_store(post_path)
+    completed_list = set(store.post_counts())
+    # Prunes the completed subreddits from the subreddit list unless they are being refreshed.
+    if not incremental:
+        subreddit_list = [subreddit for subreddit in subreddit_list
+                          if subreddit not in completed_list]
 
     # Total number of subreddits.
     total = len(subreddit_list)
@@ -150,7 +244,7 @@ def main():
     # Iterates over subreddit list and retrieves the posts.
     for subreddit in subreddit_list:
         # Calls th class and retrieves the post data. Writes the data to a json file.
-        GetPosts(name=subreddit, silence=False)
+        GetPosts(name=subreddit, silence=False, incremental=incremental, store=store)
         print(f'Subreddit {subreddit}: {count} out of {total} completed.\n')
         count += 1
 
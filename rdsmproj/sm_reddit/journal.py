@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append only checkpoint journal for interrupted comment downloads.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+
+class CheckpointJournal:
+    """
+    Append only JSON lines journal of the posts parsed by GetRedditComments. Each checkpoint
+    appends only the posts parsed since the last checkpoint and is flushed and fsynced to disk, so
+    the cost of a checkpoint does not grow with the number of posts in the subreddit and a crash
+    can at most lose the posts after the last checkpoint. A line cut off by a crash is skipped
+    when the journal is replayed.
+
+    Each line is a dictionary with the post 'id', the number of 'comments' retrieved, 'missing'
+    set to True if there was an error retrieving the comments, and the 'all_text' of the post if
+    comments were retrieved.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path of the journal file.
+    """
+    def __init__(self, path:Union[str, Path]):
+        self.path = Path(path)
+        self.pending = []
+        # A crash during a checkpoint can leave a partial last line. The next checkpoint starts
+        # on a new line so that only the partial line is lost.
+        self.partial_line = False
+        if self.path.is_file() and self.path.stat().st_size:
+            with open(self.path, mode='rb') as file:
+                file.seek(-1, os.SEEK_END)
+                self.partial_line = file.read(1) != b'\n'
+
+    def add(self, post_id:str,
+            all_text:Optional[str]=None,
+            comments:int=0,
+            missing:bool=False):
+        """
+        Adds a parsed post to the next checkpoint.
+        """
+        entry = {'id': post_id, 'comments': comments, 'missing': missing}
+        if all_text is not None:
+            entry['all_text'] = all_text
+        self.pending.append(json.dumps(entry))
+
+    def checkpoint(self):
+        """
+        Appends the posts added since the last checkpoint to the journal and syncs it to disk.
+        """
+        if not self.pending:
+            return
+        with open(self.path, mode='a', encoding='utf-8') as file:
+            if self.partial_line:
+                file.write('\n')
+                self.partial_line = False
+            file.write('\n'.join(self.pending) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        self.pending = []
+
+    def replay(self) -> Iterator[dict]:
+        """
+        Reads the entries of the journal in the order they were written.
+        """
+        if not self.path.is_file():
+            return
+        with open(self.path, mode='r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Skips a partial line left by an interrupted write.
+                    continue
+
+    def remove(self):
+        """
+        Removes the journal once the results are written.
+        """
+        self.pending = []
+        if self.path.is_file():
+            self.path.unlink()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scheduler for downloading the comments of several subreddits at once.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, Union, Dict
+from rdsmproj import utils
+from rdsmproj.sm_reddit.fetcher import TokenBucket
+
+
+# States of a subreddit in the manifest.
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class CommentScheduler:
+    """
+    Downloads the comments of several subreddits at once. All of the downloads share one rate
+    limiter that throttles the calls made into their fetchers. A fetcher that makes several HTTP
+    requests per call (e.g. pmaw) is not limited by it, so its own rate limit has to be set to a
+    share of the budget (see download_subreddit in get_comment_data). Subreddits are started in
+    order of their estimated cost (number of posts), largest first by default so that the
+    largest subreddits do not end up running alone at the end.
+
+    The state of every subreddit (pending, running, done, or failed) is recorded in a manifest
+    that is rewritten atomically after each change. Subreddits that are done are skipped when the
+    scheduler is run again unless their cost changed (e.g. new posts were retrieved), and
+    subreddits left running by an interrupted run are started again and resume from their
+    checkpoint journals.
+
+    Parameters
+    ----------
+    costs: dict[str, int]
+        Estimated cost of each subreddit (e.g. the number of posts from the metadata store) with the
+        subreddit names as keys.
+    download: Callable
+        Function called with the name of a subreddit and the shared rate limiter that downloads
+        the comments of that subreddit.
+    manifest_path: str, Path (Optional, default data/comments)
+        Folder the manifest.json file is written to.
+    max_subreddits: int (Optional, default 4)
+        Number of subreddits downloaded at once.
+    rate_limit: float (Optional, default 10)
+        Largest average number of calls per second into the fetchers across all of the
+        subreddits.
+    largest_first: bool (Optional, default True)
+        If True, the subreddits with the highest cost are started first. Otherwise the lowest.
+    retry_failed: bool (Optional, default True)
+        If True, subreddits that failed in an earlier run are tried again.
+    rerun_done: bool (Optional, default False)
+        If True, subreddits that are done in the manifest are downloaded again even if their
+        cost did not change.
+    """
+    def __init__(self, costs:Dict[str, int],
+                 download:Callable[[str, TokenBucket], None],
+                 manifest_path:Optional[Union[str, Path]]=None,
+                 max_subreddits:int=4,
+                 rate_limit:float=10,
+                 largest_first:bool=True,
+                 retry_failed:bool=True,
+                 rerun_done:bool=False):
+        self.costs = costs
+        self.download = download
+        if manifest_path is None:
+            manifest_path = utils.get_data_path('comments')
+        self.path = Path(manifest_path)
+        self.max_subreddits = max_subreddits
+        self.limiter = TokenBucket(rate_limit, capacity=max(int(rate_limit), 1))
+        self.largest_first = largest_first
+        self.retry_failed = retry_failed
+        self.rerun_done = rerun_done
+        self.lock = threading.Lock()
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        """
+        Loads the manifest of an earlier run and adds any new subreddits as pending. Subreddits
+        that are done but whose cost changed since are pending again.
+        """
+        manifest_file = Path(self.path, 'manifest.json')
+        manifest = utils.load_json(manifest_file) if manifest_file.is_file() else {}
+        for name, cost in self.costs.items():
+            entry = manifest.setdefault(name, {'state': PENDING})
+            if entry['state'] == DONE and entry.get('cost') != cost:
+                entry['state'] = PENDING
+            entry['cost'] = cost
+        return manifest
+
+    def _set_state(self, name:str, state:str, **info) -> None:
+        """
+        Updates the state of a subreddit and rewrites the manifest.
+        """
+        with self.lock:
+            self.manifest[name].update(state=state, updated=time.time(), **info)
+            utils.dump_json(self.manifest, self.path, 'manifest')
+
+    def queue(self) -> list[str]:
+        """
+        Returns the subreddits to be downloaded in the order they will be started.
+        """
+        skip = set() if self.rerun_done else {DONE}
+        if not self.retry_failed:
+            skip.add(FAILED)
+        names = [name for name in self.costs if self.manifest[name]['state'] not in skip]
+        return sorted(names, key=lambda name: self.costs[name], reverse=self.largest_first)
+
+    def _run_job(self, name:str) -> None:
+        """
+        Downloads a single subreddit and records its state.
+        """
+        self._set_state(name, RUNNING, error=None)
+        try:
+            self.download(name, self.limiter)
+        except Exception:  # pylint: disable=broad-except
+            # Records the error so the other subreddits keep running.
+            self._set_state(name, FAILED, error=traceback.format_exc())
+            print(f'Subreddit {name} failed.')
+        else:
+            self._set_state(name, DONE)
+            print(f'Subreddit {name} completed.')
+
+    def __call__(self) -> Dict[str, Dict]:
+        """
+        Downloads every subreddit that is not done.
+
+        Returns
+        -------
+            Manifest with the state of every subreddit.
+        """
+        queue = self.queue()
+        print(f'Downloading {len(queue)} subreddits, {self.max_subreddits} at a time.')
+        with ThreadPoolExecutor(max_workers=self.max_subreddits) as executor:
+            list(executor.map(self._run_job, queue))
+        states = [entry['state'] for entry in self.manifest.values()]
+        print(f'{states.count(DONE)} done, {states.count(FAILED)} failed.')
+        return self.manifest
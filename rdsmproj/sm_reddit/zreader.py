@@ -5,29 +5,49 @@ Zreader reads in the ndjson.zst files. Taken from the pushshift github at:
 https://github.com/pushshift/zreader
 """
 
+import os
 import zstandard as zstd
 
 class Zreader:
     """
-    Zreader class to read the ndjson.zst files.
+    Zreader class to read the ndjson.zst files. Lines are split as bytes and only decoded when
+    they are used, and the number of compressed bytes read so far is available for progress
+    reporting.
     """
-    def __init__(self, file, chunk_size=16384):
+    def __init__(self, file, chunk_size=2**20, encoding='ISO-8859-1'):
         '''Init method'''
         self.fh = open(file,'rb')
         self.chunk_size = chunk_size
+        self.encoding = encoding
         self.dctx = zstd.ZstdDecompressor()
         self.reader = self.dctx.stream_reader(self.fh)
-        self.buffer = ''
+        self.buffer = b''
+        # Size of the compressed file in bytes.
+        self.size = os.fstat(self.fh.fileno()).st_size
 
-    def readlines(self):
-        '''Generator method that creates an iterator for each line of JSON'''
+    @property
+    def bytes_read(self):
+        '''Number of compressed bytes read from the file so far.'''
+        return self.fh.tell()
+
+    def iter_lines(self):
+        '''Generator method that creates an iterator for each line of JSON as bytes'''
         while True:
-            chunk = self.reader.read(self.chunk_size).decode("ISO-8859-1")
+            chunk = self.reader.read(self.chunk_size)
             if not chunk:
                 break
-            lines = (self.buffer + chunk).split("\n")
+            lines = (self.buffer + chunk).split(b"\n")
 
-            for line in lines[:-1]:
-                yield line
+            yield from lines[:-1]
 
             self.buffer = lines[-1]
+        # Last line of a file that does not end with a newline.
+        if self.buffer:
+            yield self.buffer
+            self.buffer = b''
+        self.fh.close()
+
+    def readlines(self):
+        '''Generator method that creates an iterator for each line of JSON'''
+        for line in self.iter_lines():
+            yield line.decode(self.encoding)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache for the stages of the preprocessing pipeline.
+
+Each stage (documents, tokens, lemmas, phrases, id2word, corpus) is stored under a key that is a
+hash of the key of the stage before it and the parameters of the stage itself. The first key is a
+hash of the source data. Changing a setting therefore only changes the keys of the stages that
+come after it, and only those stages need to be recomputed.
+"""
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Union, Optional
+from gensim.corpora.dictionary import Dictionary
+from gensim.corpora.mmcorpus import MmCorpus
+from rdsmproj import utils
+
+
+# Version of the cached data. Changing it invalidates every existing cache entry.
+CACHE_VERSION = 1
+
+# Order of the stages in the preprocessing pipeline.
+STAGES = ('documents', 'tokens', 'lemmas', 'phrases', 'id2word', 'corpus')
+
+
+def _default(obj:Any) -> Any:
+    """
+    Makes objects that are not JSON serializable (e.g. the frozenset of connector words passed to
+    gensim Phrases) hashable in a stable way.
+    """
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    return repr(obj)
+
+def hash_data(data:Any) -> str:
+    """
+    Hashes JSON serializable data.
+
+    Parameters
+    ----------
+    data: Any
+        Data to be hashed (e.g. list of documents or dictionary of parameters).
+
+    Returns
+    -------
+    Hex digest of the sha256 hash of the data.
+    """
+    encoded = json.dumps(data, sort_keys=True, default=_default).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+def hash_file(path:Union[str, Path], block_size:int=2**20) -> str:
+    """
+    Hashes the contents of a file without reading the whole file into memory.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path of the file to be hashed.
+
+    block_size: int (Optional, default 2**20)
+        Number of bytes read at a time.
+
+    Returns
+    -------
+    Hex digest of the sha256 hash of the file contents.
+    """
+    sha = hashlib.sha256()
+    with open(path, mode='rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def chain_key(parent_key:str, params:Optional[dict]=None) -> str:
+    """
+    Creates the key of a stage from the key of the stage it is computed from and its parameters.
+
+    Parameters
+    ----------
+    parent_key: str
+        Key of the input data for the stage.
+
+    params: dict (Optional, default None)
+        Parameters of the stage.
+
+    Returns
+    -------
+    Key for the stage.
+    """
+    return hash_data({'version': CACHE_VERSION, 'parent': parent_key, 'params': params or {}})
+
+def stage_keys(source_key:str, params:dict[str, dict]) -> dict[str, str]:
+    """
+    Creates the keys for every stage of the pipeline.
+
+    Parameters
+    ----------
+    source_key: str
+        Hash of the source data.
+
+    params: dict[str, dict]
+        Parameters for each stage with the stage names as keys. Stages without parameters can be
+        left out.
+
+    Returns
+    -------
+    Dictionary with the stage names as keys and the stage keys as values.
+    """
+    keys = {}
+    parent_key = source_key
+    for stage in STAGES:
+        keys[stage] = chain_key(parent_key, params.get(stage))
+        parent_key = keys[stage]
+    return keys
+
+class StageCache:
+    """
+    Stores the results of each preprocessing stage on disk. Documents are stored as JSON, token
+    lists in the binary tokens format, id2word as a serialized gensim Dictionary, and the corpus as a Matrix Market file.
+    Only the latest entry of each stage is kept.
+
+    Parameters
+    ----------
+    path: str, Path
+        Folder the cache files are written to.
+
+    name: str
+        Name of the subreddit or collection of documents used as a prefix for the cache files.
+    """
+    def __init__(self, path:Union[str, Path], name:str):
+        self.path = Path(path)
+        self.name = name
+        utils.check_folder(self.path)
+
+    def _file(self, stage:str, key:str) -> Path:
+        """
+        Returns the path of the file for a stage and key.
+        """
+        suffix = {'id2word': 'dict', 'corpus': 'mm', 'documents': 'json'}.get(stage, 'tok')
+        return Path(self.path, f'{self.name}_{stage}_{key[:16]}.{suffix}')
+
+    def has(self, stage:str, key:str) -> bool:
+        """
+        Checks if there is a cache entry for the stage and key.
+        """
+        return self._file(stage, key).is_file()
+
+    def load(self, stage:str, key:str) -> Any:
+        """
+        Loads the cache entry for the stage and key.
+        """
+        file = self._file(stage, key)
+        if stage == 'id2word':
+            return Dictionary.load(str(file))
+        if stage == 'corpus':
+            return [[(int(word_id), int(count)) for word_id, count in doc]
+                    for doc in MmCorpus(str(file))]
+        return utils.load_json(file)
+
+    def save(self, stage:str, key:str, data:Any):
+        """
+        Saves the data for the stage and key. Files are written to a temporary name and then
+        renamed so an interrupted write never leaves a partial entry behind. Older entries for
+        the stage are removed.
+        """
+        file = self._file(stage, key)
+        temp = Path(self.path, f'{file.stem}_temp{file.suffix}')
+        if stage == 'id2word':
+            data.save(str(temp))
+        elif stage == 'corpus':
+            MmCorpus.serialize(str(temp), data)
+            os.replace(f'{temp}.index', f'{file}.index')
+        else:
+            # Token lists are stored in the binary tokens format. See storage.
+            fmt = 'json' if stage == 'documents' else 'tokens'
+            temp = utils.dump_json(data, self.path, temp.stem, fmt=fmt)
+        os.replace(temp, file)
+        self._remove_stale(stage, file)
+
+    def _remove_stale(self, stage:str, current:Path):
+        """
+        Removes the entries of a stage other than the current one. Files are matched on the full
+        name, stage, and key layout so the entries of other names sharing the folder (e.g. the
+        foo_documents_documents entries when cleaning the documents of foo) are left alone.
+        """
+        entry = re.compile(rf'{re.escape(self.name)}_{stage}_[0-9a-f]{{16}}(_temp)?\.')
+        for file in self.path.glob(f'{self.name}_{stage}_*'):
+            if entry.match(file.name) and not file.name.startswith(current.name):
+                file.unlink()
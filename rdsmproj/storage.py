@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storage formats for the data written by utils.dump_json and read by utils.load_json.
+
+Three formats are supported:
+
+- json: The stdlib JSON format used for all data before. Always available.
+- parquet: Columnar Parquet files for tabular data such as posts and comments (lists of
+  dictionaries). Requires pyarrow. Nested values (lists and dictionaries) and columns with values
+  of more than one type are stored as JSON text, and rows are read back with the same keys.
+- tokens: Compact binary format for tokenized documents (lists of lists of strings). Every
+  distinct token is stored once and the documents are stored as arrays of 32 bit token ids.
+
+The format of a file is detected from its first bytes, so files of every format (including the
+existing JSON files) are loaded the same way.
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# File suffix for each format.
+SUFFIXES = {'json': '.json', 'parquet': '.parquet', 'tokens': '.tok'}
+
+# First bytes of a Parquet file.
+PARQUET_MAGIC = b'PAR1'
+
+# First bytes of a tokens file. The last byte is the version of the format.
+TOKENS_MAGIC = b'RDSMTOK\x01'
+
+# Key in the Parquet schema metadata listing the columns stored as JSON text.
+_JSON_COLUMNS_KEY = b'rdsmproj.json_columns'
+
+# Key in the Parquet schema metadata naming the column with the keys missing from each row.
+_MISSING_COLUMN_KEY = b'rdsmproj.missing_column'
+
+# Column with the keys missing from each row (as JSON text, null if no key is missing).
+_MISSING_COLUMN = '__rdsmproj_missing__'
+
+# Number of rows in each Parquet row group.
+ROW_GROUP_SIZE = 10000
+
+
+def detect_format(path:Union[str, Path]) -> str:
+    """
+    Detects the storage format of a file from its first bytes.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path of the file.
+
+    Returns
+    -------
+        'parquet', 'tokens', or 'json'.
+    """
+    with open(path, mode='rb') as file:
+        head = file.read(len(TOKENS_MAGIC))
+    if head.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if head == TOKENS_MAGIC:
+        return 'tokens'
+    return 'json'
+
+def resolve_path(path:Union[str, Path]) -> Path:
+    """
+    Finds the file for a path in any of the storage formats. If the path does not exist, files
+    with the same name and the suffix of another format are checked (e.g. {name}_posts.parquet
+    for {name}_posts.json).
+
+    Parameters
+    ----------
+    path: str, Path
+        Path of the file in any format.
+
+    Returns
+    -------
+        Path of the existing file, or the path given if no file is found.
+    """
+    path = Path(path)
+    if path.is_file():
+        return path
+    for suffix in SUFFIXES.values():
+        candidate = path.with_suffix(suffix)
+        if candidate.is_file():
+            return candidate
+    return path
+
+def is_tokenized(data:Any) -> bool:
+    """
+    Checks if data is a list of tokenized documents (list of lists of strings) that can be stored
+    in the tokens format.
+    """
+    return (isinstance(data, list)
+            and all(isinstance(doc, list) for doc in data)
+            and all(isinstance(token, str) and '\0' not in token for doc in data for token in doc))
+
+def is_tabular(data:Any) -> bool:
+    """
+    Checks if data is a non empty list of dictionaries with string keys that can be stored in the
+    parquet format.
+    """
+    return (pa is not None
+            and isinstance(data, list)
+            and bool(data)
+            and all(isinstance(row, dict) for row in data)
+            and all(isinstance(key, str) for row in data for key in row))
+
+def choose_format(data:Any, fmt:str) -> str:
+    """
+    Chooses the format data is written in. The 'auto' format uses tokens for tokenized documents
+    and parquet for lists of dictionaries. Data that cannot be stored in the requested format is
+    written as JSON.
+
+    Parameters
+    ----------
+    data: Any
+        Data to be written.
+
+    fmt: str
+        'json', 'parquet', 'tokens', or 'auto'.
+
+    Returns
+    -------
+        Format the data will be written in.
+    """
+    if fmt in ('tokens', 'auto') and is_tokenized(data) and data:
+        return 'tokens'
+    if fmt in ('parquet', 'auto') and is_tabular(data):
+        return 'parquet'
+    if fmt not in ('json', 'parquet', 'tokens', 'auto'):
+        raise ValueError(f'Unknown format: {fmt}. Use one of {list(SUFFIXES)} or auto')
+    return 'json'
+
+def write(data:Any, path:Union[str, Path], fmt:Optional[str]='json') -> Path:
+    """
+    Writes data to a file. The suffix of the file is set by the format the data is written in.
+    The file is replaced atomically.
+
+    Parameters
+    ----------
+    data: Any
+        Data to be written.
+
+    path: str, Path
+        Path of the file without a suffix.
+
+    fmt: str (Optional, default 'json')
+        'json', 'parquet', 'tokens', or 'auto'. See choose_format.
+
+    Returns
+    -------
+        Path of the file written.
+    """
+    fmt = choose_format(data, fmt)
+    path = Path(f'{path}{SUFFIXES[fmt]}')
+    # Writes to a temporary name and renames once complete, so an interrupted write never
+    # replaces an existing file with a partial one.
+    temp = Path(f'{path}.temp')
+    if fmt == 'tokens':
+        _write_tokens(data, temp)
+    elif fmt == 'parquet':
+        _write_parquet(data, temp)
+    else:
+        with open(temp, mode='w+', encoding='utf-8') as file:
+            json.dump(data, file)
+    os.replace(temp, path)
+    return path
+
+def read(path:Union[str, Path], columns:Optional[list[str]]=None) -> Any:
+    """
+    Reads a file in any of the storage formats.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path of the file.
+
+    columns: list[str] (Optional, default None)
+        For parquet files, only these columns are read. Ignored for other formats.
+
+    Returns
+    -------
+        Data loaded from the file.
+    """
+    fmt = detect_format(path)
+    if fmt == 'tokens':
+        return _read_tokens(path)
+    if fmt == 'parquet':
+        return list(_iter_parquet(path, columns))
+    with open(path, mode='r', encoding='utf-8') as file:
+        return json.load(file)
+
+def _to_little_endian(values:array) -> bytes:
+    """
+    Returns the bytes of an array in little endian order.
+    """
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_little_endian(typecode:str, data:bytes) -> array:
+    """
+    Creates an array from bytes in little endian order.
+    """
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def _write_tokens(tokenized_docs:list[list[str]], path:Path):
+    """
+    Writes tokenized documents in the tokens format:
+
+    magic | number of tokens in vocab, documents, tokens (3 x uint64) |
+    byte length of vocab (uint64) | vocab as NUL separated utf-8 |
+    document offsets (uint64 x documents + 1) | token ids (uint32 x tokens)
+    """
+    vocab = {}
+    ids = array('I')
+    offsets = array('Q', [0])
+    for doc in tokenized_docs:
+        ids.extend(vocab.setdefault(token, len(vocab)) for token in doc)
+        offsets.append(len(ids))
+    vocab_bytes = '\0'.join(vocab).encode('utf-8')
+    with open(path, mode='wb') as file:
+        file.write(TOKENS_MAGIC)
+        file.write(struct.pack('<QQQQ', len(vocab), len(tokenized_docs), len(ids),
+                               len(vocab_bytes)))
+        file.write(vocab_bytes)
+        file.write(_to_little_endian(offsets))
+        file.write(_to_little_endian(ids))
+
+def _read_tokens(path:Union[str, Path]) -> list[list[str]]:
+    """
+    Reads tokenized documents written in the tokens format. Each distinct token is a single
+    string object shared by every document it appears in.
+    """
+    with open(path, mode='rb') as file:
+        file.read(len(TOKENS_MAGIC))
+        n_vocab, n_docs, n_tokens, vocab_length = struct.unpack('<QQQQ', file.read(32))
+        vocab = file.read(vocab_length).decode('utf-8').split('\0') if n_vocab else []
+        offsets = _from_little_endian('Q', file.read(8 * (n_docs + 1)))
+        ids = _from_little_endian('I', file.read(4 * n_tokens))
+    return [[vocab[i] for i in ids[offsets[doc]:offsets[doc + 1]]] for doc in range(n_docs)]
+
+def _write_parquet(rows:list[dict], path:Path):
+    """
+    Writes a list of dictionaries as a Parquet file with one column for every key. Columns are
+    stored as JSON text unless every value that is not None has the same Python type (e.g. a mix
+    of ints and floats, or False and a float for 'edited'), so the values are read back with the
+    type they were written with. The JSON columns are listed in the schema metadata so they can be
+    decoded when read. The keys missing from each row are stored in an extra column, so missing
+    keys and keys set to None are both read back as they were written.
+    """
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    json_columns = []
+    table = {}
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        types = {type(value) for value in values if value is not None}
+        if len(types) > 1 or types & {dict, list}:
+            json_columns.append(column)
+            values = [None if value is None else json.dumps(value) for value in values]
+        try:
+            table[column] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            # Values arrow cannot store (e.g. ints larger than 64 bits) are stored as JSON.
+            json_columns.append(column)
+            table[column] = pa.array([None if value is None else json.dumps(value)
+                                      for value in values])
+    metadata = {_JSON_COLUMNS_KEY: json.dumps(json_columns), _MISSING_COLUMN_KEY: ''}
+    missing = [[key for key in columns if key not in row] for row in rows]
+    if any(missing):
+        table[_MISSING_COLUMN] = pa.array([json.dumps(keys) if keys else None
+                                           for keys in missing])
+        metadata[_MISSING_COLUMN_KEY] = _MISSING_COLUMN
+    table = pa.table(table)
+    table = table.replace_schema_metadata(metadata)
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE)
+
+def _iter_parquet(path:Union[str, Path], columns:Optional[list[str]]=None) -> Iterator[dict]:
+    """
+    Reads the rows of a Parquet file one row group at a time. Keys that were missing from a row
+    when it was written are left out of its dictionary and keys set to None are kept, matching
+    the posts they were written from.
+    """
+    if pq is None:
+        raise ImportError(f'pyarrow is required to read {path}')
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.schema_arrow.metadata or {}
+    json_columns = set(json.loads(metadata.get(_JSON_COLUMNS_KEY, b'[]')))
+    missing_column = metadata.get(_MISSING_COLUMN_KEY, b'').decode('utf-8') or None
+    # Files written before the missing keys were stored have None for every missing key.
+    legacy = _MISSING_COLUMN_KEY not in metadata
+    names = parquet_file.schema_arrow.names
+    if columns is not None:
+        columns = [column for column in columns if column in names and column != missing_column]
+        if missing_column is not None:
+            columns.append(missing_column)
+    for batch in parquet_file.iter_batches(columns=columns):
+        for row in batch.to_pylist():
+            missing = row.pop(missing_column, None) if missing_column is not None else None
+            missing = set(json.loads(missing)) if missing else ()
+            yield {key: json.loads(value) if key in json_columns and value is not None else value
+                   for key, value in row.items()
+                   if key not in missing and not (legacy and value is None)}
+
+def iter_records(path:Union[str, Path],
+                 columns:Optional[list[str]]=None,
+                 iter_json:Optional[Any]=None) -> Iterator[Any]:
+    """
+    Reads the items of a file one at a time. Parquet files are read one row group at a time and
+    JSON files with iter_json.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path of the file.
+
+    columns: list[str] (Optional, default None)
+        For parquet files, only these columns are read.
+
+    iter_json: Callable (Optional, default None)
+        Function that streams the items of a JSON file (e.g. utils.iter_json_array). If None,
+        the whole JSON file is loaded.
+
+    Returns
+    -------
+        Generator of the items of the file.
+    """
+    fmt = detect_format(path)
+    if fmt == 'parquet':
+        yield from _iter_parquet(path, columns)
+    elif fmt == 'json' and iter_json is not None:
+        yield from iter_json(path)
+    else:
+        yield from read(path)
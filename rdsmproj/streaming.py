@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Disk backed document streams used by the streaming preprocessing mode. Each stream can be iterated
+over any number of times and only ever holds one document in memory.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Union
+
+
+def write_jsonl(items:Iterable[Any], path:Union[str, Path]) -> int:
+    """
+    Writes items to a JSON lines file with one item per line. The file is written to a temporary
+    name and renamed once complete.
+
+    Parameters
+    ----------
+    items: Iterable[Any]
+        JSON serializable items (e.g. documents or lists of tokens).
+
+    path: str, Path
+        Path for file to be written.
+
+    Returns
+    -------
+    Number of items written.
+    """
+    path = Path(path)
+    temp = Path(path.parent, f'{path.name}.temp')
+    count = 0
+    with open(temp, mode='w', encoding='utf-8') as file:
+        for item in items:
+            file.write(json.dumps(item))
+            file.write('\n')
+            count += 1
+    os.replace(temp, path)
+    return count
+
+class JsonlCorpus:
+    """
+    Restartable stream of the items of a JSON lines file.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path for JSON lines file with one item per line.
+    """
+    def __init__(self, path:Union[str, Path]):
+        self.path = Path(path)
+        self.length = None
+
+    def __iter__(self) -> Iterator[Any]:
+        with open(self.path, mode='r', encoding='utf-8') as file:
+            for line in file:
+                yield json.loads(line)
+
+    def __len__(self) -> int:
+        # Counts the lines of the file the first time the length is needed.
+        if self.length is None:
+            with open(self.path, mode='rb') as file:
+                self.length = sum(1 for _ in file)
+        return self.length
+
+class PhraseStream:
+    """
+    Restartable stream that applies gensim phrase models to each tokenized document of a corpus
+    as it is read.
+
+    Parameters
+    ----------
+    corpus: Iterable[list[str]]
+        Restartable stream of tokenized documents.
+
+    phrasers: gensim.models.phrases.FrozenPhrases
+        Phrase models applied in the order they are given (e.g. bigram then trigram).
+    """
+    def __init__(self, corpus:Iterable[list[str]], *phrasers):
+        self.corpus = corpus
+        self.phrasers = phrasers
+
+    def __iter__(self) -> Iterator[list[str]]:
+        for doc in self.corpus:
+            for phraser in self.phrasers:
+                doc = phraser[doc]
+            yield doc
+
+    def __len__(self) -> int:
+        return len(self.corpus)
@@ -8,48 +8,96 @@ by Maarten Grootendorst as part of BERTopic: https://github.com/MaartenGr/BERTop
 _bertopic.py and _ctfidf.py. Adapted as standalone script to calculate c-TF-IDF.
 """
 
-from typing import Union, Dict, Optional
+from typing import Union, Dict, Optional, Callable
+import itertools
 from bertopic import _ctfidf
 import numpy as np
-from sklearn.feature_extraction.text import CountVectorizer
-from scipy.sparse.csr import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer, ENGLISH_STOP_WORDS
+from scipy.sparse import csr_matrix
 from rdsmproj.preprocess import tokenize_text
 
-def _top_n_idx_sparse(matrix: csr_matrix, n: int) -> np.ndarray:
-    """ Return indices of top n values in each row of a sparse matrix
-    Retrieved from:
+def _top_n_sparse(matrix: csr_matrix, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """ Return the indices and values of the top n values in each row of a sparse matrix
+    Replaces _top_n_idx_sparse and _top_n_values_sparse from:
         https://github.com/MaartenGr/BERTopic/blob/master/bertopic/_bertopic.py
-        https://stackoverflow.com/questions/49207275/finding-the-top-n-values-in-a-row-of-a-scipy-sparse-matrix
+    All rows are handled at once from the indptr, indices and data arrays of the matrix instead of
+    one row (and one value) at a time.
     Args:
-        matrix: The sparse matrix from which to get the top n indices per row
+        matrix: The sparse matrix from which to get the top n values per row
         n: The number of highest values to extract from each row
     Returns:
-        indices: The top n indices per row
+        indices: The top n column indices per row, highest value first, padded with -1
+        values: The top n values per row, highest value first, padded with 0
     """
-    indices = []
-    for left, right in zip(matrix.indptr[:-1], matrix.indptr[1:]):
-        n_row_pick = min(n, right - left)
-        values = matrix.indices[left +
-                                np.argpartition(matrix.data[left:right], -n_row_pick)[-n_row_pick:]]
-        values = [values[index] if len(values) >= index + 1 else None for index in range(n)]
-        indices.append(values)
-    return np.array(indices)
-
-def _top_n_values_sparse(matrix: csr_matrix, indices: np.ndarray) -> np.ndarray:
-    """ Return the top n values for each row in a sparse matrix
-    Retrieved from:
-        https://github.com/MaartenGr/BERTopic/blob/master/bertopic/_bertopic.py
+    matrix = csr_matrix(matrix)
+    n_rows = matrix.shape[0]
+    row_lengths = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(n_rows), row_lengths)
+    # Orders the stored values by row, then by value from highest to lowest.
+    order = np.lexsort((-matrix.data, rows))
+    # Position of each value within its row after ordering.
+    ranks = np.arange(len(order)) - np.repeat(matrix.indptr[:-1], row_lengths)
+    keep = ranks < n
+    indices = np.full((n_rows, n), -1, dtype=np.int64)
+    values = np.zeros((n_rows, n), dtype=matrix.dtype)
+    indices[rows[keep], ranks[keep]] = matrix.indices[order[keep]]
+    values[rows[keep], ranks[keep]] = matrix.data[order[keep]]
+    return indices, values
+
+
+def _class_term_matrix(corpus: list[list[tuple[int, int]]],
+                       classes: np.ndarray,
+                       n_classes: int,
+                       n_terms: int) -> csr_matrix:
+    """ Return the class by term count matrix of a bag-of-words corpus
+    The rows of the corpus are summed for each class, which gives the same counts as joining the
+    documents of each class together and counting the terms again.
     Args:
-        matrix: The sparse matrix from which to get the top n indices per row
-        indices: The top n indices per row
+        corpus: Document vectors made up of lists of tuples with (word_id, frequency)
+        classes: Row of the class of each document, -1 to leave a document out
+        n_classes: Number of rows (classes)
+        n_terms: Number of columns (word ids)
     Returns:
-        top_values: The top n scores per row
+        counts: Sparse matrix with the count of each term in each class
     """
-    top_values = []
-    for row, values in enumerate(indices):
-        scores = np.array([matrix[row, value] if value is not None else 0 for value in values])
-        top_values.append(scores)
-    return np.array(top_values)
+    classes = np.asarray(classes, dtype=np.int64)
+    docs = list(itertools.islice(corpus, len(classes)))
+    lengths = np.fromiter((len(doc) for doc in docs), dtype=np.int64, count=len(docs))
+    pairs = np.fromiter((value for doc in docs for pair in doc for value in pair),
+                        dtype=np.int64, count=2 * int(lengths.sum())).reshape(-1, 2)
+    rows = np.repeat(classes[:len(docs)], lengths)
+    keep = rows >= 0
+    # Duplicate (row, column) entries are summed when the matrix is built.
+    return csr_matrix((pairs[keep, 1], (rows[keep], pairs[keep, 0])), shape=(n_classes, n_terms))
+
+def _term_word_matrix(id2word,
+                      n_terms: int,
+                      tokenizer: Callable[[str], list[str]]) -> tuple[csr_matrix, np.ndarray]:
+    """ Return the matrix mapping each term of id2word to the words CountVectorizer would count
+    for it
+    Each term is tokenized once the way CTFIDF tokenizes joined documents (lowercased, tokenized,
+    and English stop words removed), so phrases are split into their words and filtered terms are
+    dropped without rebuilding any documents.
+    Args:
+        id2word: Mapping of word ids to terms
+        n_terms: Number of word ids
+        tokenizer: Tokenizer used by CountVectorizer
+    Returns:
+        mapping: Sparse (n_terms, n_words) matrix of the count of each word in each term
+        words: Words in alphabetical order, the same as CountVectorizer.get_feature_names_out
+    """
+    term_words = {term_id: [word for word in tokenizer(id2word[term_id].lower())
+                            if word not in ENGLISH_STOP_WORDS]
+                  for term_id in id2word.keys()}
+    words = np.array(sorted({word for parts in term_words.values() for word in parts}), dtype=object)
+    word_index = {word: index for index, word in enumerate(words)}
+    rows, cols = [], []
+    for term_id, parts in term_words.items():
+        rows.extend([term_id] * len(parts))
+        cols.extend(word_index[word] for word in parts)
+    mapping = csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)),
+                         shape=(n_terms, len(words)))
+    return mapping, words
 
 
 class CTFIDF:
@@ -78,16 +126,69 @@ class CTFIDF:
 
     n: int
         Top n words to be extracted from each class (topic).
+
+    The class by word count matrix can instead be built from an existing bag-of-words corpus with
+    CTFIDF.from_corpus, in which case clustered_docs is None.
     """
 
     def __init__(self,
-                 clustered_docs: list[str],
+                 clustered_docs: Optional[list[str]],
                  topic_list: list[Union[int, str]],
                  n:int=10):
 
         self.clustered_docs = clustered_docs
         self.labels = topic_list
         self.n = n
+        self.counts = None
+        self.words = None
+
+    @classmethod
+    def from_corpus(cls,
+                    corpus: list[list[tuple[int, int]]],
+                    doc_topics: np.ndarray,
+                    id2word,
+                    topic_list: list[Union[int, str]],
+                    n:int=10) -> 'CTFIDF':
+        """
+        Creates a CTFIDF from the bag-of-words corpus instead of documents joined for each class.
+        The corpus rows of each topic are summed into a class by term matrix, which is mapped to
+        the words the joined documents would be tokenized into. The result is the same as joining
+        the documents the corpus was made from, as far as the terms kept in id2word.
+
+        Parameters
+        ----------
+        corpus: list[list[tuple[int, int]]]
+            Document vectors made up of lists of tuples with (word_id, frequency).
+
+        doc_topics: np.ndarray
+            Topic (class) label of each document.
+
+        id2word: gensim.corpora.dictionary.Dictionary
+            Mapping of word ids to words used to create the corpus.
+
+        topic_list: list[Union[int, str]]
+            List of labels for the topics or classes, in the order of the rows of the matrix.
+
+        n: int
+            Top n words to be extracted from each class (topic).
+
+        Returns
+        -------
+            CTFIDF with the class by word count matrix set.
+        """
+        ctfidf = cls(None, topic_list, n)
+        row_of_label = {label: row for row, label in enumerate(topic_list)}
+        classes = np.array([row_of_label.get(label, -1) for label in np.asarray(doc_topics).tolist()],
+                           dtype=np.int64)
+        n_terms = max(id2word.keys(), default=-1) + 1
+        counts = _class_term_matrix(corpus, classes, len(topic_list), n_terms)
+        mapping, words = _term_word_matrix(id2word, n_terms, tokenize_text)
+        counts = csr_matrix(counts @ mapping)
+        # Drops words that do not occur in any class, as CountVectorizer only keeps words it saw.
+        seen = np.flatnonzero(np.asarray(counts.sum(axis=0)).ravel())
+        ctfidf.counts = counts[:, seen]
+        ctfidf.words = words[seen]
+        return ctfidf
 
     def _extract_words_per_topic(self,
                                  ngram_range:Optional[tuple[int, int]] = (1,1)
@@ -112,25 +213,27 @@ class CTFIDF:
         """
 
         # Calculate the c-TF-IDF matrix from which to extract the top words.
-        tokenizer = tokenize_text
-        count = CountVectorizer(ngram_range=ngram_range,
-                                stop_words="english",
-                                tokenizer=tokenizer).fit(self.clustered_docs)
-        count_transform = count.transform(self.clustered_docs)
+        if self.counts is not None:
+            if tuple(ngram_range) != (1, 1):
+                raise ValueError('Only ngram_range=(1, 1) is supported with CTFIDF.from_corpus')
+            count_transform = self.counts
+            words = self.words
+        else:
+            tokenizer = tokenize_text
+            count = CountVectorizer(ngram_range=ngram_range,
+                                    stop_words="english",
+                                    tokenizer=tokenizer).fit(self.clustered_docs)
+            count_transform = count.transform(self.clustered_docs)
+            words = count.get_feature_names_out()
         c_tf_idf = _ctfidf.ClassTFIDF().fit_transform(count_transform)
-        words = count.get_feature_names_out()
 
-        # Get the top n indices and values per row in a sparse c-TF-IDF matrix.
-        indices = _top_n_idx_sparse(c_tf_idf, n=self.n)
-        scores = _top_n_values_sparse(c_tf_idf, indices)
-        sorted_indices = np.argsort(scores, 1)
-        indices = np.take_along_axis(indices, sorted_indices, axis = 1)
-        scores = np.take_along_axis(scores, sorted_indices, axis=1)
+        # Get the top n indices and values per row in a sparse c-TF-IDF matrix, highest first.
+        indices, scores = _top_n_sparse(c_tf_idf, n=self.n)
 
         # Get top n words per topic based on c-TF-IDF score.
-        topics = {label: {words[word_index] if word_index and score > 0 else "":
-                            score if word_index and score > 0 else 0.00001
-                            for word_index, score in zip(indices[index][::-1], scores[index][::-1])
+        topics = {label: {words[word_index] if word_index >= 0 and score > 0 else "":
+                            score if word_index >= 0 and score > 0 else 0.00001
+                            for word_index, score in zip(indices[index], scores[index])
                         }
                     for index, label in enumerate(self.labels)}
 
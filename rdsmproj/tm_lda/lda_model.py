@@ -19,6 +19,7 @@ from gensim.corpora.dictionary import Dictionary
 import psutil
 from hyperopt import STATUS_OK
 from rdsmproj import utils
+from rdsmproj.coherence import CoherenceCache
 from rdsmproj.tm_lda import topic_tools as tt
 
 
@@ -73,6 +74,8 @@ class OptunaObj:
         self.name = name
         self.path = path
         self.coherence = coherence
+        # Word occurrence statistics shared by the coherence models of every trial.
+        self.coherence_cache = CoherenceCache(self.documents, id2word, corpus)
 
     def __call__(self, trial):
         # Objective function for optuna package.
@@ -102,7 +105,8 @@ class OptunaObj:
                 coherence_model = tt.create_coherence_model(model=model,
                                                         texts=self.documents,
                                                         id2word=self.id2word,
-                                                        coherence=coherence)
+                                                        coherence=coherence,
+                                                        coherence_cache=self.coherence_cache)
                 coherence_value[coherence] = coherence_model.get_coherence()
 
 
@@ -182,6 +186,8 @@ class HyperoptObj:
         self.path = path
         self.count = count
         self.coherence = coherence
+        # Word occurrence statistics shared by the coherence models of every trial.
+        self.coherence_cache = CoherenceCache(self.documents, id2word, corpus)
 
     def __call__(self, args):
          # Objective function for hyperopt package.
@@ -198,7 +204,8 @@ class HyperoptObj:
         coherence_model = tt.create_coherence_model(model=model,
                                                 texts=self.documents,
                                                 id2word=self.id2word,
-                                                coherence=self.coherence)
+                                                coherence=self.coherence,
+                                                coherence_cache=self.coherence_cache)
         coherence = coherence_model.get_coherence()
         coherence_value[self.coherence] = coherence
         loss = 1 - coherence
@@ -212,7 +219,8 @@ class HyperoptObj:
             coherence_model = tt.create_coherence_model(model=model,
                                                     texts=self.documents,
                                                     id2word=self.id2word,
-                                                    coherence=coherence)
+                                                    coherence=coherence,
+                                                    coherence_cache=self.coherence_cache)
             coherence_value[coherence] = coherence_model.get_coherence()
 
 
@@ -7,6 +7,7 @@ Collection of tools for analysis of topic modeling results from either LDA or To
 """
 from typing import Dict, Union, Optional
 from pathlib import Path
+import itertools
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -15,17 +16,22 @@ import numpy as np
 import gensim
 from gensim.models.coherencemodel import CoherenceModel
 from gensim.corpora.dictionary import Dictionary
+from gensim.utils import grouper
 
 from rdsmproj import utils
+from rdsmproj.coherence import CoherenceCache
 from rdsmproj.tm_lda._ctfidf import CTFIDF
 
 
 def get_topic_vectors(tokenized_documents:list[list[str]],
                       corpus:list[list[tuple[int, int]]],
-                      model) -> list[list[float]]:
+                      model,
+                      chunksize:int=2000) -> np.ndarray:
     """
     Gets the topic vectors for the different documents for use with LDA topic distribution. This
-    returns vectors of probabilities of topics for each document from the model.
+    returns vectors of probabilities of topics for each document from the model. For models with
+    variational inference (LdaModel, LdaMulticore) the documents are inferred chunksize at a time
+    instead of one at a time.
 
     Parameters
     ----------
@@ -39,18 +45,48 @@ def get_topic_vectors(tokenized_documents:list[list[str]],
         Pre-trained topic model. Currently supports LdaModel,
         LdaMulticore, LdaMallet, and LdaVowpalWabbit.
 
+    chunksize: int (Optional, default 2000)
+        Number of documents inferred at a time.
+
     Returns
     -------
-    topic_vectors: list[list[float]]
-        Vectors of topic probabilities for each document.
+    topic_vectors: np.ndarray
+        Document by topic matrix of topic probabilities for each document.
     """
-    topic_vectors = []
-    for doc, _ in enumerate(tokenized_documents):
-        top_topics = model.get_document_topics(corpus[doc],minimum_probability=0.0)
-        topic_vector = [top_topics[topic][1] for topic in range(model.num_topics)]
-        topic_vectors.append(topic_vector)
+    num_docs = len(tokenized_documents)
+    topic_vectors = np.zeros((num_docs, model.num_topics))
+    documents = itertools.islice(corpus, num_docs)
+    if hasattr(model, 'inference'):
+        start = 0
+        for chunk in grouper(documents, chunksize):
+            # Same normalization of the variational parameters as model.get_document_topics.
+            gamma, _ = model.inference(chunk)
+            topic_vectors[start:start + len(chunk)] = gamma / gamma.sum(axis=1, keepdims=True)
+            start += len(chunk)
+    else:
+        for doc, bow in enumerate(documents):
+            for topic, probability in model.get_document_topics(bow, minimum_probability=0.0):
+                topic_vectors[doc, topic] = probability
     return topic_vectors
 
+def get_top_topics(topic_vectors:Union[np.ndarray, list[list[float]]]) -> np.ndarray:
+    """
+    Finds the most probable topic of each document. Ties go to the lowest topic number.
+
+    Parameters
+    ----------
+    topic_vectors: np.ndarray, list[list[float]]
+        Vectors of topic probabilities for each document.
+
+    Returns
+    -------
+        Array with the most probable topic of each document.
+    """
+    topic_vectors = np.asarray(topic_vectors)
+    if topic_vectors.size == 0:
+        return np.zeros(len(topic_vectors), dtype=int)
+    return np.argmax(topic_vectors, axis=1)
+
 def pad_docs_per_topic(docs_per_topic:Dict[int, list[str]],
                        num_topics:int) -> Dict[int, list[str]]:
     """
@@ -77,7 +113,7 @@ def pad_docs_per_topic(docs_per_topic:Dict[int, list[str]],
     return docs_per_topic
 
 def cluster_by_topic(documents:list[str],
-                     topic_vectors:list[list[float]],
+                     topic_vectors:Union[np.ndarray, list[list[float]]],
                      num_topics:int) -> Dict[int, list[str]]:
     """
     Clusters documents by assigning a top topic to that document based on the most probable topic.
@@ -87,7 +123,7 @@ def cluster_by_topic(documents:list[str],
     documents: list[str]
         Filtered documents created from joining the tokens for a document together into one string.
 
-    topic_vectors: list[list[float]]
+    topic_vectors: np.ndarray, list[list[float]]
         Vectors of topic probabilities for each document.
 
     num_topics: int
@@ -100,15 +136,9 @@ def cluster_by_topic(documents:list[str],
         that have that topic as their top topic based on probability.
     """
     docs_per_topic = {}
-    for doc, _ in enumerate(topic_vectors):
-        # Finds the index of highest topic probability for the document.
-        topic = topic_vectors[doc].index(max(topic_vectors[doc]))
-        # Checks if topic is already a key in docs_per_topic and adds document to the value (list).
-        if topic in docs_per_topic:
-            docs_per_topic[topic].append(documents[doc])
-        # If the topic is not already a key, then it creates one with [document] as the value.
-        else:
-            docs_per_topic[topic] = [documents[doc]]
+    # Adds each document to the list of its most probable topic.
+    for document, topic in zip(documents, get_top_topics(topic_vectors).tolist()):
+        docs_per_topic.setdefault(topic, []).append(document)
     # Pads the dictionary with empty lists for topics with no documents.
     docs_per_topic = pad_docs_per_topic(docs_per_topic, num_topics)
     # Returns sorted dictionary with topics with the most documents first.
@@ -337,7 +367,7 @@ def create_topic_sizes_dict(topic_sizes:list[int]) -> Dict[str, int]:
 
 def find_distribution(model:gensim.models.basemodel.BaseTopicModel,
                       tokenized_docs:list[list[str]],
-                      corpus:list[tuple[int, int]]) -> Dict[int, list[str]]:
+                      corpus:list[tuple[int, int]]) -> Dict[int, int]:
     """
     Finds the distribution of posts for each topic.
 
@@ -355,9 +385,10 @@ def find_distribution(model:gensim.models.basemodel.BaseTopicModel,
 
     Returns
     -------
-    docs_per_topic: Dict[int, list[str]]
-        Dictionary with each key being the topic number and the value being the list of documents
-        that have that topic as their top topic based on probability.
+    docs_per_topic: Dict[int, int]
+        Dictionary with each key being the topic number and the value being the number of
+        documents that have that topic as their top topic based on probability, with the topics
+        with the most documents first.
     """
     # This is to weed out models in which the topics have no documents associated with them.
 
@@ -366,13 +397,11 @@ def find_distribution(model:gensim.models.basemodel.BaseTopicModel,
     topic_vectors = get_topic_vectors(tokenized_documents = tokenized_docs,
                                     corpus=corpus,
                                     model=model)
-    # Concatenates tokenized documents into single strings.
-    f_documents = create_filtered_documents(tokenized_docs)
-    # Clusters the documents by the most probable topic for each document.
-    num_topics = model.num_topics
-    docs_per_topic = cluster_by_topic(f_documents, topic_vectors, num_topics)
-    docs_per_topic = {topic: len(docs) for topic, docs in docs_per_topic.items()}
-    return docs_per_topic
+    # Counts the documents for each topic from the most probable topic for each document.
+    sizes = np.bincount(get_top_topics(topic_vectors), minlength=model.num_topics)
+    # Sorted with the topics with the most documents first.
+    order = np.argsort(-sizes, kind='stable')
+    return {int(topic): int(sizes[topic]) for topic in order}
 
 def create_coherence_model(model:Optional[gensim.models.basemodel.BaseTopicModel] = None,
                            topics:Optional[list[list[str]]] = None,
@@ -381,10 +410,13 @@ def create_coherence_model(model:Optional[gensim.models.basemodel.BaseTopicModel
                            corpus:Optional[list[tuple[int, int]]] = None,
                            coherence:str = 'c_v',
                            topn:int = 10,
-                           processes:int = 1):
+                           processes:int = 1,
+                           coherence_cache:Optional[CoherenceCache] = None):
     """
-    Creates a gensim.models.coherencemodel.CoherenceModel object from either a model or list of
-    tokenized topics. Used to calculate coherence of a topic.
+    Creates a coherence model from either a model or list of tokenized topics. Used to calculate
+    coherence of a topic. The coherence is computed with the sparse matrices of
+    rdsmproj.coherence, which gives the same values as gensim CoherenceModel, unless processes is
+    not 1.
 
     Parameters
     ----------
@@ -412,13 +444,28 @@ def create_coherence_model(model:Optional[gensim.models.basemodel.BaseTopicModel
         Integer corresponding to number of top words to be extracted from each topic.
 
     processes: int (default 1)
-        Number of processes to use, any value less than 1 will be num_cpus - 1.
+        Number of processes to use, any value less than 1 will be num_cpus - 1. If not 1, a gensim
+        CoherenceModel is created instead, which counts the sliding windows in several processes.
+
+    coherence_cache: rdsmproj.coherence.CoherenceCache (Optional, default None)
+        Word occurrence statistics shared between coherence models of the same documents. If
+        given, the documents, id2word, and corpus of the cache are used instead of texts, id2word,
+        and corpus, and the documents are only scanned again for topic words not counted yet.
 
     Returns
     -------
-    coherence_model: gensim.models.coherencemodel.CoherenceModel
-        CoherenceModel object used for building and maintaining a model for topic coherence.
+    coherence_model: rdsmproj.coherence.TopicCoherence, gensim.models.coherencemodel.CoherenceModel
+        Coherence model with get_coherence and get_coherence_per_topic methods.
     """
+    if processes == 1:
+        if coherence_cache is None:
+            if id2word is None:
+                id2word = model.id2word
+            coherence_cache = CoherenceCache(texts, id2word, corpus)
+        return coherence_cache.coherence_model(model=model,
+                                               topics=topics,
+                                               coherence=coherence,
+                                               topn=topn)
     coherence_model = CoherenceModel(model = model,
                                     topics = topics,
                                     texts = texts,
@@ -460,6 +507,10 @@ class AnalyzeTopics:
 
     path: Path, str (Optional, default None)
         Path to store the analysis results files to.
+
+    coherence_cache: rdsmproj.coherence.CoherenceCache (Optional, default None)
+        Word occurrence statistics of tokenized_docs shared with the analysis of other models of
+        the same documents. A new one is created if None.
     """
     def __init__(self,
                  model,
@@ -470,7 +521,8 @@ class AnalyzeTopics:
                  corpus:list[tuple[int, int]],
                  model_type:str,
                  coherence:str='c_v',
-                 path:Optional[Union[Path,str]]=None):
+                 path:Optional[Union[Path,str]]=None,
+                 coherence_cache:Optional[CoherenceCache]=None):
 
         self.model_name = model_name
         self.subreddit_name = subreddit_name
@@ -478,6 +530,10 @@ class AnalyzeTopics:
         self.id2word = id2word
         self.corpus = corpus
         self.model_type = model_type
+        # Word occurrence statistics shared by the coherence models.
+        if coherence_cache is None:
+            coherence_cache = CoherenceCache(tokenized_docs, id2word, corpus)
+        self.coherence_cache = coherence_cache
 
         # Sets the path for analysis files and plots to be saved to.
         if path is None:
@@ -497,7 +553,8 @@ class AnalyzeTopics:
             coherence_model = create_coherence_model(model=self.model,
                                                 texts=self.tokenized_docs,
                                                 id2word=id2word,
-                                                coherence=coherence)
+                                                coherence=coherence,
+                                                coherence_cache=self.coherence_cache)
             # Prints the number of topics and the mean coherence of derived topics.
             print(f'Num Topics: {num_topics} Coherence: {coherence_model.get_coherence()}')
             # Finds the coherence values for each derived topic.
@@ -557,13 +614,14 @@ class AnalyzeTopics:
             # c-TFIDF calculations for class (topic) based TFIDF for each topic using algorithm
             # by Maarten Grootendorst as part of BERTopic: https://github.com/MaartenGr/BERTopic.
 
-            # Concatenates all documents into a single string based on their most probable derived
-            # topic.
-            clustered_docs = [ ' '.join(values) for values in docs_per_topic.values()]
+            # Sums the bag-of-words vectors of the documents of each topic, based on their most
+            # probable derived topic, instead of joining and tokenizing the documents again.
             # Creates a word score dict from the c-TFIDF values for the top 50 words.
-            tfidf_word_score_dict = CTFIDF(clustered_docs=clustered_docs,
-                                           topic_list=list(docs_per_topic.keys()),
-                                           n=50)._extract_words_per_topic(ngram_range=(1,1))
+            tfidf_word_score_dict = CTFIDF.from_corpus(corpus=corpus,
+                                                       doc_topics=get_top_topics(topic_vectors),
+                                                       id2word=id2word,
+                                                       topic_list=list(docs_per_topic.keys()),
+                                                       n=50)._extract_words_per_topic(ngram_range=(1,1))
             # Saves the word score dict.
             utils.dump_json(tfidf_word_score_dict,
                       self.path,
@@ -576,7 +634,8 @@ class AnalyzeTopics:
                                                    texts=tokenized_docs,
                                                    corpus=corpus,
                                                    id2word=id2word,
-                                                   coherence=coherence)
+                                                   coherence=coherence,
+                                                   coherence_cache=self.coherence_cache)
             # Prints the number of topics and the mean coherence of derived topics for the model
             # using the c-TFIDF topic words.
             tfidf_coherence = tfidf_c_model.get_coherence()
@@ -637,7 +696,8 @@ class AnalyzeTopics:
             coherence_model = create_coherence_model(topics=topics,
                                                     texts=tokenized_docs,
                                                     id2word=id2word,
-                                                    coherence=coherence)
+                                                    coherence=coherence,
+                                                    coherence_cache=self.coherence_cache)
 
             # Prints the number of topics and the mean coherence of derived topics for the model.
             num_topics = self.model.get_num_topics()
@@ -8,8 +8,9 @@ Script for generating Top2Vec models.
 from pathlib import Path
 from typing import Optional, Union, Dict
 from gensim.models.phrases import ENGLISH_CONNECTOR_WORDS
-from rdsmproj import utils
+from rdsmproj import utils, metadata
 from rdsmproj import preprocess as pp
+from rdsmproj.coherence import CoherenceCache
 from rdsmproj.tm_t2v.top2vec_model import Top2VecModel
 import rdsmproj.tm_t2v.top2vec_topic_tools as ttt
 
@@ -50,6 +51,10 @@ def model_gen(name:str,
 
     print(f'Number of documents: {len(documents)}')
 
+    # Word occurrence statistics for the coherence of every model of the subreddit, so the
+    # documents are only scanned again for topic words of a model not counted yet.
+    coherence_cache = CoherenceCache(tokenized_documents, id2word, corpus)
+
     embedding_models = ['universal-sentence-encoder','universal-sentence-encoder-multilingual',
                         'distiluse-base-multilingual-cased','all-MiniLM-L6-v2',
                         'paraphrase-multilingual-MiniLM-L12-v2', 'doc2vec']
@@ -86,7 +91,8 @@ def model_gen(name:str,
                                             tokenized_docs=tokenized_documents,
                                             id2word=id2word,
                                             corpus=corpus,
-                                            model_type='Top2Vec')
+                                            model_type='Top2Vec',
+                                            coherence_cache=coherence_cache)
         else:
             model_path = Path(data_path, f'{name}_{embedding_model}')
             if not model_path.exists():
@@ -105,20 +111,22 @@ def model_gen(name:str,
                                      tokenized_docs=tokenized_documents,
                                      id2word=id2word,
                                      corpus=corpus,
-                                     model_type='Top2Vec')
+                                     model_type='Top2Vec',
+                                     coherence_cache=coherence_cache)
 
-def main():
+def main(shared_phrases:Optional[bool] = False):
     """
     Auto-magically creates the top2vec models for subreddit data.
+
+    Parameters
+    ----------
+    shared_phrases: bool (Optional, default False)
+        If True, one phrase model is trained across all of the subreddits and applied to each of
+        them instead of training a phrase model for every subreddit.
     """
 
-    # Finds the data path for the comments data to be written to.
-    comment_path = utils.get_data_path('comments')
-    # Scans the files in the comments folder for completed subreddit json files.
-    subreddit_list = [file.name for file in Path(comment_path).rglob('*.json')
-                      if 'temp' not in file.name]
-    # Removes comments from list of names.
-    subreddit_list = [file.replace('_comments.json', '') for file in subreddit_list]
+    # Queries the metadata store for the subreddits with completed comment data.
+    subreddit_list = metadata.get_store().names(status=metadata.COMMENTS)
 
     remove_list = ['LearningDisabilities', 'Blind','trollingforababy','achalasia','Strabismus',
                'DisabilityFitness','neurology','dyscalculia','ADPKD','Staphacne','Menieres',
@@ -131,9 +139,14 @@ def main():
 
     print(f'Number of subreddits: {len(subreddit_list)}')
 
+    preprocess_args = None
+    if shared_phrases:
+        print('\n*** Creating shared phrase model\n')
+        preprocess_args = {'phrase_model': pp.build_shared_phrase_model(subreddit_list)}
+
     for subreddit in subreddit_list:
         print(f'\n*** Creating models for: {subreddit}\n')
-        model_gen(name=subreddit)
+        model_gen(name=subreddit, preprocess_args=preprocess_args)
 
 if __name__ == '__main__':
     main()
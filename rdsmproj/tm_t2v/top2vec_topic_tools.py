@@ -16,6 +16,7 @@ from gensim.models.coherencemodel import CoherenceModel
 from gensim.corpora.dictionary import Dictionary
 
 from rdsmproj import utils
+from rdsmproj.coherence import CoherenceCache
 
 
 def create_topic_sizes_dict(topic_sizes:list[int]) -> Dict[str, int]:
@@ -75,10 +76,13 @@ def create_coherence_model(model:Optional[gensim.models.basemodel.BaseTopicModel
                            corpus:Optional[list[tuple[int, int]]] = None,
                            coherence:str = 'c_v',
                            topn:int = 10,
-                           processes:int = 1):
+                           processes:int = 1,
+                           coherence_cache:Optional[CoherenceCache] = None):
     """
-    Creates a gensim.models.coherencemodel.CoherenceModel object from either a model or list of
-    tokenized topics. Used to calculate coherence of a topic.
+    Creates a coherence model from either a model or list of tokenized topics. Used to calculate
+    coherence of a topic. The coherence is computed with the sparse matrices of
+    rdsmproj.coherence, which gives the same values as gensim CoherenceModel, unless processes is
+    not 1.
 
     Parameters
     ----------
@@ -106,13 +110,28 @@ def create_coherence_model(model:Optional[gensim.models.basemodel.BaseTopicModel
         Integer corresponding to number of top words to be extracted from each topic.
 
     processes: int (default 1)
-        Number of processes to use, any value less than 1 will be num_cpus - 1.
+        Number of processes to use, any value less than 1 will be num_cpus - 1. If not 1, a gensim
+        CoherenceModel is created instead, which counts the sliding windows in several processes.
+
+    coherence_cache: rdsmproj.coherence.CoherenceCache (Optional, default None)
+        Word occurrence statistics shared between coherence models of the same documents. If
+        given, the documents, id2word, and corpus of the cache are used instead of texts, id2word,
+        and corpus, and the documents are only scanned again for topic words not counted yet.
 
     Returns
     -------
-    coherence_model: gensim.models.coherencemodel.CoherenceModel
-        CoherenceModel object used for building and maintaining a model for topic coherence.
+    coherence_model: rdsmproj.coherence.TopicCoherence, gensim.models.coherencemodel.CoherenceModel
+        Coherence model with get_coherence and get_coherence_per_topic methods.
     """
+    if processes == 1:
+        if coherence_cache is None:
+            if id2word is None:
+                id2word = model.id2word
+            coherence_cache = CoherenceCache(texts, id2word, corpus)
+        return coherence_cache.coherence_model(model=model,
+                                               topics=topics,
+                                               coherence=coherence,
+                                               topn=topn)
     coherence_model = CoherenceModel(model = model,
                                     topics = topics,
                                     texts = texts,
@@ -298,6 +317,10 @@ class AnalyzeTopics:
 
     path: Path, str (Optional, default None)
         Path to store the analysis results files to.
+
+    coherence_cache: rdsmproj.coherence.CoherenceCache (Optional, default None)
+        Word occurrence statistics of tokenized_docs shared with the analysis of other models of
+        the same documents. A new one is created if None.
     """
     def __init__(self,
                  model,
@@ -308,7 +331,8 @@ class AnalyzeTopics:
                  corpus:list[tuple[int, int]],
                  model_type:str,
                  coherence:str='c_v',
-                 path:Optional[Union[Path,str]]=None):
+                 path:Optional[Union[Path,str]]=None,
+                 coherence_cache:Optional[CoherenceCache]=None):
 
         self.model_name = model_name
         self.subreddit_name = subreddit_name
@@ -316,6 +340,10 @@ class AnalyzeTopics:
         self.id2word = id2word
         self.corpus = corpus
         self.model_type = model_type
+        # Word occurrence statistics shared by the coherence models.
+        if coherence_cache is None:
+            coherence_cache = CoherenceCache(tokenized_docs, id2word, corpus)
+        self.coherence_cache = coherence_cache
 
         # Sets the path for analysis files and plots to be saved to.
         if path is None:
@@ -367,7 +395,8 @@ class AnalyzeTopics:
                 coherence_model = create_coherence_model(topics=topics,
                                                         texts=tokenized_docs,
                                                         id2word=id2word,
-                                                        coherence=coherence_measure)
+                                                        coherence=coherence_measure,
+                                                        coherence_cache=self.coherence_cache)
                 coherence_value[coherence_measure] = coherence_model.get_coherence()
                 #print(f'{coherence_measure}: {coherence_value[coherence_measure]}')
                 if coherence_measure == coherence:
@@ -5,28 +5,37 @@ Utility functions.
 """
 
 import json
+import re
 from pathlib import Path
-from typing import Union, Dict
+from typing import Any, Iterator, Optional, Union, Dict
+from rdsmproj import storage
 
 
-def load_json(path:Union[str,Path]) -> dict:
+# Whitespace and the comma between the items of a JSON array.
+_SEPARATOR = re.compile(r'\s*,?\s*')
+
+
+def load_json(path:Union[str,Path], columns:Optional[list[str]]=None) -> Any:
     """
-    Loads jsons given a path.
+    Loads jsons given a path. Files written in the parquet or tokens formats (see storage) are
+    detected and loaded as well, and if the path does not exist a file with the same name in
+    another format is used (e.g. {name}_posts.parquet for {name}_posts.json).
 
     Parameters
     ----------
     path: str, Path
         Path for file to be read.
 
+    columns: list[str] (Optional, default None)
+        For parquet files, only these keys of each dictionary are read.
+
     Returns
     -------
     Dictionary of data loaded from JSON file.
     """
-    with open(path,mode='r',encoding='utf-8') as f:
-        file = json.load(f)
-    return file
+    return storage.read(storage.resolve_path(path), columns=columns)
 
-def dump_json(json_dict:Dict, path:Union[str,Path], filename:str):
+def dump_json(json_dict:Dict, path:Union[str,Path], filename:str, fmt:str='json') -> Path:
     """
     Dumps data to a json file given a filename.
 
@@ -40,14 +49,68 @@ def dump_json(json_dict:Dict, path:Union[str,Path], filename:str):
 
     filename: str
         Filename of file to be written.
+
+    fmt: str (Optional, default 'json')
+        Storage format. 'parquet' stores lists of dictionaries (e.g. posts and comments) as a
+        columnar Parquet file, 'tokens' stores tokenized documents in a compact binary format,
+        and 'auto' picks one of them based on the data. Data that cannot be stored in the
+        requested format is written as JSON. See storage.
+
+    Returns
+    -------
+    Path of the file written.
     """
     # Checks if folder exists.
     check_folder(path)
 
-    # Writes json file to path using given filename.
-    path = Path(path, filename+'.json')
-    with open(path, mode= 'w+', encoding='utf-8') as file:
-        json.dump(json_dict, file)
+    # Writes file to path using given filename and the suffix of the storage format.
+    file = storage.write(json_dict, Path(path, filename), fmt)
+    # Removes files of the same name in other formats so that they are not loaded instead.
+    for suffix in storage.SUFFIXES.values():
+        other = Path(path, filename + suffix)
+        if other != file and other.is_file():
+            other.unlink()
+    return file
+
+def iter_records(path:Union[str,Path], columns:Optional[list[str]]=None) -> Iterator[Any]:
+    """
+    Reads the items of a list stored in any of the storage formats one at a time. See load_json.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path for file to be read.
+
+    columns: list[str] (Optional, default None)
+        For parquet files, only these keys of each dictionary are read.
+
+    Returns
+    -------
+    Generator of the items in the order they appear in the file.
+    """
+    return storage.iter_records(storage.resolve_path(path), columns, iter_json_array)
+
+def data_names(path:Union[str,Path], suffix:str) -> list[str]:
+    """
+    Finds the names of the data files in a folder ending in suffix in any of the storage formats
+    (e.g. the subreddit names of the {name}_posts files).
+
+    Parameters
+    ----------
+    path: str, Path
+        Folder to be searched.
+
+    suffix: str
+        End of the file names without the format suffix (e.g. '_posts').
+
+    Returns
+    -------
+    Names with the suffix removed.
+    """
+    formats = set(storage.SUFFIXES.values())
+    names = [file.stem[:-len(suffix)] for file in Path(path).rglob('*')
+             if file.suffix in formats and file.stem.endswith(suffix)]
+    return list(dict.fromkeys(names))
 
 def check_folder(path:Union[str,Path]):
     """
@@ -88,3 +151,62 @@ def get_data_path(path:Union[Path, str], data_path:Union[Path,str]=None) -> Path
     folder_path = Path(folder, path)
     check_folder(folder_path)
     return folder_path
+
+def iter_json_array(path:Union[str,Path], buffer_size:int=2**20) -> Iterator[Any]:
+    """
+    Reads the items of a JSON file containing a top level array one item at a time, so that the
+    whole file never has to be loaded into memory.
+
+    Parameters
+    ----------
+    path: str, Path
+        Path for file to be read.
+
+    buffer_size: int (Optional, default 2**20)
+        Number of characters read from the file at a time.
+
+    Returns
+    -------
+    Generator of the items of the array in the order they appear in the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, mode='r', encoding='utf-8') as file:
+        buffer = file.read(buffer_size).lstrip()
+        # Reads past leading whitespace longer than the buffer.
+        while not buffer:
+            chunk = file.read(buffer_size)
+            if not chunk:
+                break
+            buffer = chunk.lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{path} does not contain a JSON array.')
+        # Position of the next item in the buffer. The decoded text is only dropped from the
+        # buffer when more of the file is read, so each item does not copy the rest of the buffer.
+        pos = 1
+        eof = False
+        while True:
+            # Skips whitespace and the commas between items.
+            pos = _SEPARATOR.match(buffer, pos).end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item is incomplete, so more of the file is read into the buffer.
+                if eof:
+                    raise
+                chunk = file.read(buffer_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            # Values such as numbers can be cut off at the end of the buffer and still decode, so
+            # an item is only yielded once a separator follows it or the whole file has been read.
+            if (end == len(buffer) or buffer[end] not in ' \t\n\r,]') and not eof:
+                chunk = file.read(buffer_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+            pos = end
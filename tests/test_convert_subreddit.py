@@ -0,0 +1,23 @@
+"""
+Tests for the byte-level prefilter of the subreddit dump.
+"""
+import json
+from rdsmproj.sm_reddit.convert_subreddit import is_candidate, parse_lines
+
+
+SUBREDDIT = {'display_name': 'a', 'title': 'A', 'description': '', 'subscribers': 1,
+             'created_utc': 0, 'public_description': '', 'subreddit_type': 'public',
+             'lang': 'en'}
+
+
+def test_compact_and_spaced_lines_are_candidates():
+    for separators in ((',', ':'), (', ', ': '), (' , ', ' : ')):
+        line = json.dumps(SUBREDDIT, separators=separators).encode('utf-8')
+        assert is_candidate(line)
+        assert parse_lines([line])[0][0] == 'a'
+
+
+def test_other_subreddits_are_skipped():
+    for key, value in (('subreddit_type', 'private'), ('lang', 'de')):
+        line = json.dumps({**SUBREDDIT, key: value}).encode('utf-8')
+        assert not is_candidate(line)
@@ -0,0 +1,85 @@
+"""
+Tests for HttpFetcher and ConcurrentCommentFetcher against a local fake Pushshift server.
+"""
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from rdsmproj.sm_reddit.fetcher import HttpFetcher, ConcurrentCommentFetcher
+
+
+POSTS = {f'p{i}': [f'p{i}c{j}' for j in range(3)] for i in range(5)}
+
+
+class FakePushshift(BaseHTTPRequestHandler):
+    """
+    Serves the comment ids of POSTS and a comment for any requested id. The ids of every comment
+    request are recorded on the server.
+    """
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urllib.parse.urlparse(self.path)
+        if url.path.startswith('/reddit/submission/comment_ids/'):
+            data = POSTS.get(url.path.rsplit('/', 1)[-1], [])
+        elif url.path == '/reddit/search/comment':
+            ids = urllib.parse.parse_qs(url.query)['ids'][0].split(',')
+            with self.server.lock:
+                self.server.comment_requests.append(ids)
+            data = [{'id': comment_id, 'body': f'body of {comment_id}'} for comment_id in ids]
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps({'data': data}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakePushshift)
+    httpd.lock = threading.Lock()
+    httpd.comment_requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetcher(httpd):
+    return HttpFetcher(f'http://127.0.0.1:{httpd.server_address[1]}', timeout=5)
+
+
+def test_ids_are_chunked(server):
+    ConcurrentCommentFetcher(fetcher(server), ids_per_request=4)(POSTS)
+
+    sizes = sorted(len(ids) for ids in server.comment_requests)
+    assert sizes == [3, 4, 4, 4]
+    requested = [comment_id for ids in server.comment_requests for comment_id in ids]
+    assert sorted(requested) == sorted(sum(POSTS.values(), []))
+
+
+def test_concurrent_chunks_are_merged(server):
+    results = ConcurrentCommentFetcher(fetcher(server), concurrency=4, ids_per_request=2)(POSTS)
+
+    assert list(results) == list(POSTS)
+    for post_id, ids in POSTS.items():
+        assert [comment['id'] for comment in results[post_id]] == ids
+
+
+def test_requests_are_paced(server):
+    rate_limit = 20
+    start = time.monotonic()
+    ConcurrentCommentFetcher(fetcher(server), concurrency=2, rate_limit=rate_limit,
+                             ids_per_request=4)(POSTS)
+    elapsed = time.monotonic() - start
+
+    # 5 comment id requests and 4 comment requests, with a burst of 2 allowed at once.
+    assert elapsed >= (5 + 4 - 2) / rate_limit * 0.9
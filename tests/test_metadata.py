@@ -0,0 +1,48 @@
+"""
+Tests for the subreddit metadata store.
+"""
+from rdsmproj import metadata, utils
+
+
+def test_posts_and_comments_share_a_store(tmp_path):
+    assert (metadata.store_path(tmp_path / 'posts')
+            == metadata.store_path(tmp_path / 'comments')
+            == tmp_path / 'subreddits.db')
+
+
+def test_get_store_imports_earlier_data(tmp_path):
+    post_path = tmp_path / 'posts'
+    comment_path = tmp_path / 'comments'
+    utils.dump_json({'a': 120, 'b': 300}, post_path, 'post_data')
+    utils.dump_json([{'id': 'x'}], comment_path, 'a_comments')
+    utils.dump_json(7, comment_path, 'a_count')
+
+    store = metadata.get_store(post_path)
+
+    assert store.path == tmp_path / 'subreddits.db'
+    assert store.names(status=metadata.COMMENTS) == ['a']
+    assert store.names(exclude_status=metadata.COMMENTS) == ['b']
+    assert store.get('a')['posts'] == 120
+    assert store.get('a')['comments'] == 7
+
+
+def test_get_store_imports_comments_into_existing_store(tmp_path):
+    post_path = tmp_path / 'posts'
+    utils.dump_json({'a': 120}, post_path, 'post_data')
+    metadata.get_store(post_path)
+    utils.dump_json([{'id': 'x'}], tmp_path / 'comments', 'a_comments')
+
+    store = metadata.get_store(post_path)
+
+    assert store.names(status=metadata.COMMENTS) == ['a']
+
+
+def test_get_store_keeps_recorded_comments(tmp_path):
+    post_path = tmp_path / 'posts'
+    store = metadata.get_store(post_path)
+    store.update('a', posts=200, comments=5, status=metadata.POSTS)
+    utils.dump_json([{'id': 'x'}], tmp_path / 'comments', 'a_comments')
+
+    store = metadata.get_store(post_path)
+
+    assert store.get('a')['status'] == metadata.POSTS
@@ -0,0 +1,31 @@
+"""
+Tests for saving and loading frozen phrase models.
+"""
+from rdsmproj.phrase_model import PhraseModel
+
+
+DOCS = [['new', 'york', 'city', 'is', 'big'],
+        ['i', 'love', 'new', 'york', 'city'],
+        ['new', 'york', 'city', 'at', 'night']] * 10
+ARGS = {'min_count': 1, 'threshold': 0.1}
+
+
+def test_save_and_load(tmp_path):
+    model = PhraseModel.train([DOCS], ARGS, key='abc')
+    model.save(tmp_path, 'sub')
+
+    loaded = PhraseModel.load(tmp_path, 'sub')
+    assert loaded is not None
+    assert loaded.key == 'abc'
+    assert loaded.apply(DOCS) == model.apply(DOCS)
+
+
+def test_load_checks_key(tmp_path):
+    PhraseModel.train([DOCS], ARGS, key='abc').save(tmp_path, 'sub')
+
+    assert PhraseModel.load(tmp_path, 'sub', key='abc') is not None
+    assert PhraseModel.load(tmp_path, 'sub', key='other') is None
+
+
+def test_load_missing(tmp_path):
+    assert PhraseModel.load(tmp_path, 'sub') is None
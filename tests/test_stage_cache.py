@@ -0,0 +1,21 @@
+"""
+Tests for the preprocessing stage cache.
+"""
+from rdsmproj.stage_cache import StageCache, hash_data
+
+
+def test_save_replaces_older_entry(tmp_path):
+    cache = StageCache(tmp_path, 'foo')
+    cache.save('documents', hash_data('old'), ['a'])
+    cache.save('documents', hash_data('new'), ['b'])
+
+    assert not cache.has('documents', hash_data('old'))
+    assert cache.load('documents', hash_data('new')) == ['b']
+
+
+def test_save_keeps_entries_of_other_names(tmp_path):
+    other = StageCache(tmp_path, 'foo_documents')
+    other.save('documents', hash_data('other'), ['a'])
+    StageCache(tmp_path, 'foo').save('documents', hash_data('foo'), ['b'])
+
+    assert other.has('documents', hash_data('other'))